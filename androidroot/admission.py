@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Callable, Awaitable, Dict, Set, Tuple
+
+from discord import Member
+
+from .metrics import Histogram
+
+log = logging.getLogger(__name__)
+
+
+class AdmissionQueue:
+    """
+    Sits in front of the verification: at most `concurrency` verifications run at once, the rest wait
+    in a FIFO queue. Each member can only have one request running or waiting at a time (per guild),
+    repeated requests are collapsed into the existing one.
+    """
+    def __init__(self, concurrency: int, runner: Callable[[Member], Awaitable[None]],
+                 wait_histogram: Optional[Histogram] = None):
+        """
+        :param wait_histogram: Observes how long each request waited for a slot
+        """
+        self.concurrency = max(concurrency, 1)
+        self._runner = runner
+        self._wait_histogram = wait_histogram
+
+        # (guild ID, member ID)
+        self._in_flight: Set[Tuple[int, int]] = set()
+        # (guild ID, member ID) -> (Member, time it was queued)
+        self._waiting: "OrderedDict[Tuple[int, int], tuple]" = OrderedDict()
+
+        # Metrics
+        self.admitted = 0
+        self.collapsed = 0
+        self.peak_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """
+        :return: Number of members waiting in the queue
+        """
+        return len(self._waiting)
+
+    @property
+    def running(self) -> int:
+        return len(self._in_flight)
+
+    def is_pending(self, guild_id: int, member_id: int) -> bool:
+        key = (guild_id, member_id)
+        return key in self._in_flight or key in self._waiting
+
+    def submit(self, member: Member) -> Optional[int]:
+        """
+        Requests a verification for the member.
+        :return: None if the member already has a pending request, 0 if the verification started
+                 right away, otherwise the position in the queue
+        """
+        if self.is_pending(member.guild.id, member.id):
+            self.collapsed += 1
+            return None
+
+        self.admitted += 1
+
+        if len(self._in_flight) < self.concurrency:
+            self._start(member, None)
+            return 0
+
+        self._waiting[(member.guild.id, member.id)] = (member, time.monotonic())
+        self.peak_depth = max(self.peak_depth, len(self._waiting))
+        return len(self._waiting)
+
+    def start_now(self, member: Member, runner: Callable[[Member], Awaitable[None]]) -> None:
+        """
+        Runs runner for the member right away, regardless of the concurrency limit
+        (used to resume verifications that were already running before a restart).
+        """
+        self._in_flight.add((member.guild.id, member.id))
+        asyncio.ensure_future(self._run(member, runner))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self.running,
+            "depth": self.depth,
+            "peak_depth": self.peak_depth,
+            "admitted": self.admitted,
+            "collapsed": self.collapsed,
+        }
+
+    def _start(self, member: Member, queued_at: Optional[float]) -> None:
+        if self._wait_histogram is not None:
+            self._wait_histogram.observe(time.monotonic() - queued_at if queued_at is not None else 0.0)
+
+        self._in_flight.add((member.guild.id, member.id))
+        asyncio.ensure_future(self._run(member, self._runner))
+
+    async def _run(self, member: Member, runner: Callable[[Member], Awaitable[None]]) -> None:
+        try:
+            await runner(member)
+        except Exception:
+            log.exception(f"Verification of {member.id} failed")
+        finally:
+            self._in_flight.discard((member.guild.id, member.id))
+
+            while self._waiting and len(self._in_flight) < self.concurrency:
+                _, (next_member, queued_at) = self._waiting.popitem(last=False)
+                self._start(next_member, queued_at)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Optional, Dict, List
+
+from .sqlite_store import BatchedSQLiteStore, Operation
+
+log = logging.getLogger(__name__)
+
+# Responses are trimmed to this many characters, only the last MAX_RESPONSES of an attempt are kept
+MAX_RESPONSE_LENGTH = 200
+MAX_RESPONSES = 5
+
+
+class AuditEntry:
+    """
+    One verification attempt as it was written to the audit store.
+    """
+    def __init__(self, guild_id: int, member_id: int, member_name: str, channel_id: Optional[int], mode: str,
+                 outcome: str, expected: Optional[str], responses: str, response_count: int, finished: float,
+                 duration: Optional[float], answer_duration: Optional[float]):
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.member_name = member_name
+        self.channel_id = channel_id
+        self.mode = mode
+        self.outcome = outcome
+        self.expected = expected
+        # The last (trimmed) responses, oldest first
+        self.responses: List[str] = json.loads(responses)
+        self.response_count = response_count
+        # Wall-clock (time.time()) time the attempt ended
+        self.finished = finished
+        # From the request (reaction or !verify) to the outcome, None if not known (e.g. resumed after a restart)
+        self.duration = duration
+        # From the challenge being sent to the outcome
+        self.answer_duration = answer_duration
+
+
+_ENTRY_COLUMNS = "guild_id, member_id, member_name, channel_id, mode, outcome, expected, responses, " \
+                 "response_count, finished, duration, answer_duration"
+
+
+class AuditStore(BatchedSQLiteStore):
+    """
+    Every verification attempt with its outcome, what was expected and what the member answered, so the history
+    of a member can be looked up without going through the log channel. Attempts are appended in batches and
+    indexed by member and by time. The bot and the workers (worker.py) write to the same database.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS verification_audit (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            member_id INTEGER NOT NULL,
+            member_name TEXT NOT NULL,
+            channel_id INTEGER,
+            mode TEXT NOT NULL,
+            outcome TEXT NOT NULL,
+            expected TEXT,
+            responses TEXT NOT NULL DEFAULT '[]',
+            response_count INTEGER NOT NULL DEFAULT 0,
+            finished REAL NOT NULL,
+            duration REAL,
+            answer_duration REAL
+        );
+        CREATE INDEX IF NOT EXISTS verification_audit_member ON verification_audit (guild_id, member_id, finished);
+        CREATE INDEX IF NOT EXISTS verification_audit_finished ON verification_audit (guild_id, finished);
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0):
+        super().__init__(path, flush_interval)
+        self._pending: List[Operation] = []
+
+    def record(self, guild_id: int, member_id: int, member_name: str, channel_id: Optional[int], mode: str,
+               outcome: str, expected: Optional[str], responses: List[str], response_count: int,
+               duration: Optional[float], answer_duration: Optional[float]) -> None:
+        """
+        Appends an attempt with the next batch.
+        """
+        trimmed = [response if len(response) <= MAX_RESPONSE_LENGTH else f"{response[:MAX_RESPONSE_LENGTH]}[...]"
+                   for response in responses[-MAX_RESPONSES:]]
+
+        self._pending.append((
+            f"INSERT INTO verification_audit ({_ENTRY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (guild_id, member_id, member_name, channel_id, mode, outcome, expected, json.dumps(trimmed),
+             response_count, time.time(),
+             round(duration, 3) if duration is not None else None,
+             round(answer_duration, 3) if answer_duration is not None else None)
+        ))
+        self._schedule_flush()
+
+    async def member_history(self, guild_id: int, member_id: int, limit: int = 10) -> List[AuditEntry]:
+        """
+        :return: The latest attempts of the member, newest first
+        """
+        rows = await self.query(f"SELECT {_ENTRY_COLUMNS} FROM verification_audit WHERE guild_id = ? AND member_id = ? "
+                                f"ORDER BY finished DESC LIMIT ?", (guild_id, member_id, limit))
+        return [AuditEntry(*row) for row in rows]
+
+    async def since(self, guild_id: int, since: float, limit: int = 15) -> List[AuditEntry]:
+        """
+        :return: The latest attempts that ended after since (wall-clock), newest first
+        """
+        rows = await self.query(f"SELECT {_ENTRY_COLUMNS} FROM verification_audit WHERE guild_id = ? AND finished >= ? "
+                                f"ORDER BY finished DESC LIMIT ?", (guild_id, since, limit))
+        return [AuditEntry(*row) for row in rows]
+
+    async def outcomes_since(self, guild_id: int, since: float) -> Dict[str, int]:
+        """
+        :return: Number of attempts by outcome that ended after since
+        """
+        rows = await self.query("SELECT outcome, COUNT(*) FROM verification_audit WHERE guild_id = ? AND finished >= ? "
+                                "GROUP BY outcome", (guild_id, since))
+        return dict(rows)
+
+    async def prune(self, max_age: float) -> int:
+        """
+        Deletes attempts older than max_age seconds.
+        :return: Number of deleted attempts
+        """
+        return await self._run(self._delete_before, time.time() - max_age)
+
+    async def prune_periodically(self, max_age: float, interval: float = 3600) -> None:
+        while self.is_open:
+            try:
+                deleted = await self.prune(max_age)
+                if deleted:
+                    log.info(f"Pruned {deleted} verification attempts older than {max_age / 86400:.0f} days")
+            except Exception as e:
+                log.error(f"Could not prune the verification audit store: {e!r}")
+
+            await asyncio.sleep(interval)
+
+    def _take_pending(self) -> List[Operation]:
+        operations, self._pending = self._pending, []
+        return operations
+
+    # Runs on the store thread
+    def _delete_before(self, finished: float) -> int:
+        with self._connection:
+            cursor = self._connection.execute("DELETE FROM verification_audit WHERE finished < ?", (finished,))
+        return cursor.rowcount
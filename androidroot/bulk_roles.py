@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional, List, Callable, Awaitable
+
+from discord import Guild, Role, Member, Object
+from discord.errors import HTTPException
+
+from .scheduler import ActionScheduler, Priority
+
+log = logging.getLogger(__name__)
+
+
+class BulkRoleMode:
+    ADD = "add"
+    REMOVE = "remove"
+
+
+class BulkRoleProgress:
+    """
+    Counters of a bulk role job. These are also what gets written into the checkpoint.
+    """
+    def __init__(self, last_member_id: int = 0, processed: int = 0, changed: int = 0,
+                 skipped: int = 0, errored: int = 0):
+        self.last_member_id = last_member_id
+        self.processed = processed
+        self.changed = changed
+        self.skipped = skipped
+        self.errored = errored
+
+    def to_dict(self) -> dict:
+        return {
+            "last_member_id": self.last_member_id,
+            "processed": self.processed,
+            "changed": self.changed,
+            "skipped": self.skipped,
+            "errored": self.errored,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BulkRoleProgress":
+        return cls(
+            last_member_id=int(data.get("last_member_id", 0)),
+            processed=int(data.get("processed", 0)),
+            changed=int(data.get("changed", 0)),
+            skipped=int(data.get("skipped", 0)),
+            errored=int(data.get("errored", 0)),
+        )
+
+
+class BulkRoleJob:
+    """
+    Adds or removes a role from every member of a guild.
+
+    - members that already are in the desired state are skipped without an API call,
+    - role changes run with bounded concurrency (the member role route shares one bucket per guild,
+      so a handful of parallel requests is enough to saturate it without a flood of 429s),
+    - after every batch a checkpoint with the last processed member ID is written to disk,
+      so an interrupted job resumes from there the next time it is started,
+    - in dry-run mode only counts what would change.
+    """
+    BATCH_SIZE = 100
+
+    def __init__(self, guild: Guild, role: Role, mode: str, scheduler: ActionScheduler, checkpoint_directory: str,
+                 concurrency: int = 4, dry_run: bool = False, reason: Optional[str] = None):
+        self.guild = guild
+        self.role = role
+        self.mode = mode
+        self.scheduler = scheduler
+        self.dry_run = dry_run
+        self.reason = reason
+        self.concurrency = max(concurrency, 1)
+
+        self.checkpoint_path = os.path.join(
+            checkpoint_directory, f"bulkrole-{guild.id}-{role.id}-{mode}.json"
+        )
+
+        self.progress = BulkRoleProgress()
+        self.resumed = False
+
+    def load_checkpoint(self) -> bool:
+        """
+        Restores the progress of a previously interrupted run.
+        :return: True if a checkpoint was found
+        """
+        if self.dry_run or not os.path.isfile(self.checkpoint_path):
+            return False
+
+        try:
+            with open(self.checkpoint_path, "r") as checkpoint_file:
+                self.progress = BulkRoleProgress.from_dict(json.load(checkpoint_file))
+        except (OSError, ValueError) as e:
+            log.warning(f"Ignoring unreadable bulk role checkpoint {self.checkpoint_path}: {e}")
+            return False
+
+        self.resumed = True
+        return True
+
+    def _save_checkpoint(self) -> None:
+        if self.dry_run:
+            return
+
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump(self.progress.to_dict(), checkpoint_file)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self) -> None:
+        if not self.dry_run and os.path.isfile(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def needs_change(self, member: Member) -> bool:
+        has_role = self.role in member.roles
+        if self.mode == BulkRoleMode.ADD:
+            return not has_role
+        return has_role
+
+    async def _apply(self, member: Member, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            try:
+                if self.mode == BulkRoleMode.ADD:
+                    await self.scheduler.run(Priority.BULK, lambda: member.add_roles(self.role, reason=self.reason))
+                else:
+                    await self.scheduler.run(Priority.BULK, lambda: member.remove_roles(self.role, reason=self.reason))
+            except HTTPException as e:
+                log.warning(f"Bulk role {self.mode} failed for {member.id}: {e}")
+                self.progress.errored += 1
+            else:
+                self.progress.changed += 1
+
+    async def _members(self, members: Optional[List[Member]]):
+        if members is None:
+            after = Object(id=self.progress.last_member_id) if self.progress.last_member_id else None
+            async for member in self.guild.fetch_members(limit=None, after=after):
+                yield member
+        else:
+            for member in members:
+                if member.id > self.progress.last_member_id:
+                    yield member
+
+    async def _run_batch(self, batch: List[Member], semaphore: asyncio.Semaphore) -> None:
+        to_change = []
+        for member in batch:
+            if self.needs_change(member):
+                to_change.append(member)
+            else:
+                self.progress.skipped += 1
+
+        if self.dry_run:
+            self.progress.changed += len(to_change)
+        else:
+            await asyncio.gather(*[self._apply(member, semaphore) for member in to_change])
+
+        self.progress.processed += len(batch)
+        self.progress.last_member_id = batch[-1].id
+        self._save_checkpoint()
+
+    async def run(self, members: Optional[List[Member]] = None) -> BulkRoleProgress:
+        """
+        Runs the job to completion.
+        :param members: Members (sorted by ID) to go through instead of fetching the whole member list,
+                        e.g. only the ones missing the role according to the VerifiedIndex
+        :return: Final progress
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        batch: List[Member] = []
+        async for member in self._members(members):
+            batch.append(member)
+            if len(batch) >= self.BATCH_SIZE:
+                await self._run_batch(batch, semaphore)
+                batch = []
+
+        if batch:
+            await self._run_batch(batch, semaphore)
+
+        self._clear_checkpoint()
+        return self.progress
+
+
+async def report_progress_periodically(job: BulkRoleJob, interval: float,
+                                       report: Callable[[BulkRoleProgress], Awaitable[None]]) -> None:
+    """
+    Calls report with the current progress every interval seconds until cancelled.
+    """
+    last_processed = None
+    while True:
+        await asyncio.sleep(interval)
+
+        if job.progress.processed != last_processed:
+            last_processed = job.progress.processed
+            try:
+                await report(job.progress)
+            except HTTPException as e:
+                log.warning(f"Could not report bulk role progress: {e}")
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Any, Dict, List, Iterable, Callable, Awaitable
+
+from .utilities import Singleton
+
+log = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value: Any, expires_at: Optional[float]):
+        self.value = value
+        self.expires_at = expires_at
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+
+class EntityCache(metaclass=Singleton):
+    """
+    Caches the results of argument-less async getters (guild, channels, roles, messages).
+
+    - concurrent misses of the same key share a single call of the getter,
+    - entries can expire after a TTL,
+    - entries are invalidated by gateway events: an event invalidates every entry registered for it
+      whose cached entity has the ID the event is about.
+    """
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # event name -> cache keys to check on that event
+        self._invalidators: Dict[str, List[str]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def watch(self, key: str, invalidate_on: Iterable[str]) -> None:
+        """
+        Registers the events that invalidate key.
+        """
+        for event in invalidate_on:
+            self._invalidators.setdefault(event, []).append(key)
+
+    async def get(self, key: str, getter: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and not entry.expired:
+            self.hits += 1
+            return entry.value
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        future = asyncio.get_event_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await getter()
+        except Exception as e:
+            future.set_exception(e)
+            # The caller gets the exception directly, don't warn about the shared future
+            future.exception()
+            raise
+        else:
+            if value is not None:
+                self._entries[key] = _Entry(value, time.monotonic() + ttl if ttl is not None else None)
+            future.set_result(value)
+            return value
+        finally:
+            del self._in_flight[key]
+
+    def invalidate(self, key: str) -> None:
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+            log.debug(f"Invalidated cached entity: {key}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def handle_event(self, event: str, entity_id: int) -> None:
+        """
+        Invalidates the entries registered for the event that cache the entity with entity_id.
+        """
+        for key in self._invalidators.get(event, ()):
+            entry = self._entries.get(key)
+            if entry is not None and getattr(entry.value, "id", None) == entity_id:
+                self.invalidate(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+        }
+
+
+entity_cache = EntityCache()
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import math
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Optional, Deque, Tuple, Dict
+
+from .utilities import generate_code
+
+log = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = ImageDraw = ImageFont = None
+
+# Without the characters that look alike in an image (0/O, 1/I)
+CAPTCHA_CHARS = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+
+WIDTH = 240
+HEIGHT = 90
+# Rendered height of the characters in pixels
+GLYPH_HEIGHT = 48
+
+# Pillow 9.1 moved these into enums (the old names are gone since Pillow 10)
+_BICUBIC = getattr(Image, "Resampling", Image).BICUBIC if Image is not None else None
+
+
+def is_available() -> bool:
+    """
+    :return: True if Pillow is installed (it's optional, only the image challenge needs it)
+    """
+    return Image is not None
+
+
+def _random_color(rng: random.Random, low: int, high: int) -> Tuple[int, int, int]:
+    return rng.randint(low, high), rng.randint(low, high), rng.randint(low, high)
+
+
+def _text_box(char: str, font) -> Tuple[int, int, int, int]:
+    """
+    :return: Bounding box of the character drawn at (0, 0)
+    """
+    try:
+        return ImageDraw.Draw(Image.new("L", (1, 1))).textbbox((0, 0), char, font=font)
+    except ValueError:
+        # Before Pillow 9.2 only TrueType fonts can be measured like this, not the built-in bitmap font
+        width, height = font.getsize(char)
+        return 0, 0, width, height
+
+
+def _render_glyph(char: str, rng: random.Random, font_path: Optional[str]):
+    """
+    :return: Mask ("L" image) of one character, scaled to GLYPH_HEIGHT and rotated
+    """
+    font = ImageFont.truetype(font_path, GLYPH_HEIGHT) if font_path else ImageFont.load_default()
+
+    left, top, right, bottom = _text_box(char, font)
+    glyph = Image.new("L", (right - left + 2, bottom - top + 2), 0)
+    ImageDraw.Draw(glyph).text((1 - left, 1 - top), char, fill=255, font=font)
+
+    # The built-in font is a tiny bitmap font
+    scale = GLYPH_HEIGHT / glyph.height
+    if abs(scale - 1) > 0.1:
+        glyph = glyph.resize((max(int(glyph.width * scale), 1), GLYPH_HEIGHT), _BICUBIC)
+
+    return glyph.rotate(rng.uniform(-25, 25), resample=_BICUBIC, expand=True)
+
+
+def _wave(image, rng: random.Random):
+    """
+    Shifts every column up or down along a sine wave.
+    """
+    amplitude = rng.uniform(3, 6)
+    period = rng.uniform(60, 120)
+    phase = rng.uniform(0, 2 * math.pi)
+
+    waved = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    for x in range(image.width):
+        offset = int(amplitude * math.sin(2 * math.pi * x / period + phase))
+        waved.paste(image.crop((x, 0, x + 1, image.height)), (x, offset))
+
+    return waved
+
+
+def render_captcha(code: str, seed: int, font_path: Optional[str] = None) -> bytes:
+    """
+    Draws the code distorted on a noisy background. Runs in the worker processes of CaptchaPool.
+    :return: PNG image
+    """
+    rng = random.Random(seed)
+
+    image = Image.new("RGB", (WIDTH, HEIGHT), _random_color(rng, 225, 255))
+    draw = ImageDraw.Draw(image)
+    for _ in range(WIDTH * HEIGHT // 25):
+        draw.point((rng.randrange(WIDTH), rng.randrange(HEIGHT)), fill=_random_color(rng, 120, 220))
+
+    step = WIDTH // (len(code) + 1)
+    for index, char in enumerate(code):
+        glyph = _render_glyph(char, rng, font_path)
+        x = step * index + step // 2 + rng.randint(-6, 6)
+        y = (HEIGHT - glyph.height) // 2 + rng.randint(-8, 8)
+        image.paste(_random_color(rng, 0, 110), (x, y, x + glyph.width, y + glyph.height), glyph)
+
+    image = _wave(image, rng)
+
+    # Lines through the characters
+    draw = ImageDraw.Draw(image)
+    for _ in range(3):
+        start = (rng.randint(0, WIDTH // 4), rng.randint(HEIGHT // 4, HEIGHT * 3 // 4))
+        end = (rng.randint(WIDTH * 3 // 4, WIDTH), rng.randint(HEIGHT // 4, HEIGHT * 3 // 4))
+        draw.line((start, end), fill=_random_color(rng, 40, 140), width=rng.randint(1, 3))
+
+    output = BytesIO()
+    image.save(output, format="PNG", optimize=False)
+    return output.getvalue()
+
+
+class CaptchaPool:
+    """
+    Keeps rendered captcha images (with their code) ready, so a verification never waits for one to be drawn.
+    Images are rendered in a pool of worker processes, away from the event loop. Once fewer than low_water
+    are left, the pool is filled back up to size in the background.
+
+    If a raid empties the pool anyway, take() renders one right away and counts it in `empty`.
+    """
+    def __init__(self, size: int, low_water: int, processes: int = 0, code_length: int = 4,
+                 font_path: Optional[str] = None):
+        self.size = max(size, 1)
+        self.low_water = min(max(low_water, 0), self.size)
+        self.processes = processes if processes > 0 else (os.cpu_count() or 1)
+        self.code_length = code_length
+        self.font_path = font_path
+
+        self._ready: Deque[Tuple[str, bytes]] = deque()
+        self._rendering = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._refill_task: Optional[asyncio.Task] = None
+
+        self.rendered = 0
+        self.taken = 0
+        self.empty = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def available(self) -> int:
+        return len(self._ready)
+
+    async def start(self) -> None:
+        """
+        Starts the render processes and fills the pool. Renders one image right away, so a broken font
+        shows up on startup.
+        """
+        if not is_available():
+            raise Exception("The image challenge needs Pillow (install it with 'poetry install -E captcha')")
+
+        self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        self._ready.append(await self._render())
+        self.refill()
+
+    async def close(self) -> None:
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            # At most a couple of images per process are queued. Not waiting for them leaves the render
+            # processes behind (and the interpreter hanging on exit on Python 3.8), waiting blocks.
+            await asyncio.get_event_loop().run_in_executor(None, executor.shutdown)
+
+    async def take(self) -> Tuple[str, bytes]:
+        """
+        :return: Code and PNG image of a pre-rendered captcha
+        """
+        self.taken += 1
+        if self._ready:
+            captcha = self._ready.popleft()
+            self.refill()
+            return captcha
+
+        self.empty += 1
+        log.warning(f"Captcha pool ran empty ({self.empty} times since start), rendering one right away")
+        self.refill()
+        return await self._render()
+
+    def refill(self) -> None:
+        """
+        Starts refilling the pool in the background if it dropped below the low-water mark.
+        """
+        if not self.running or len(self._ready) + self._rendering > self.low_water:
+            return
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+
+        self._refill_task = asyncio.ensure_future(self._refill())
+
+    async def _refill(self) -> None:
+        while len(self._ready) < self.size:
+            # A couple per process, so none of them sits idle while the results are collected
+            batch = min(self.size - len(self._ready), self.processes * 2)
+            self._rendering = batch
+            try:
+                rendered = await asyncio.gather(*[self._render() for _ in range(batch)])
+            except Exception as e:
+                log.error(f"Could not render captcha images: {e!r}")
+                return
+            finally:
+                self._rendering = 0
+
+            self._ready.extend(rendered)
+
+    async def _render(self) -> Tuple[str, bytes]:
+        code = generate_code(self.code_length, CAPTCHA_CHARS)
+        image = await asyncio.get_event_loop().run_in_executor(
+            self._executor, render_captcha, code, random.getrandbits(32), self.font_path
+        )
+        self.rendered += 1
+        return code, image
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "available": self.available,
+            "rendered": self.rendered,
+            "taken": self.taken,
+            "empty": self.empty,
+        }
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Awaitable, Optional
+
+from discord import Message, Member
+
+log = logging.getLogger(__name__)
+
+
+class CatchUpResult:
+    def __init__(self):
+        self.seen = 0
+        self.recovered = 0
+        self.duration = 0.0
+
+
+class ReactionCatchUp:
+    """
+    Finds members that reacted to the trigger message while the bot was offline (so no reaction event
+    reached it) and feeds them into the verification at a limited rate.
+    """
+    def __init__(self, rate: float):
+        # Verifications started per second
+        self.rate = rate
+
+        self._task: Optional[asyncio.Task] = None
+        self.last_result: Optional[CatchUpResult] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, get_member: Callable[[int], Awaitable[Optional[Member]]],
+              get_message: Callable[[], Awaitable[Message]], emoji: str,
+              needs_verification: Callable[[int], bool],
+              submit: Callable[[Member], Awaitable[None]]) -> None:
+        """
+        Starts a catch-up pass in the background (unless one is already running).
+        :param get_member: Looks up a member by ID (None if they left)
+        :param needs_verification: Checked by member ID, before the member is looked up
+        """
+        if self.running:
+            return
+
+        self._task = asyncio.ensure_future(self._run(get_member, get_message, emoji, needs_verification, submit))
+
+    async def _run(self, get_member: Callable[[int], Awaitable[Optional[Member]]],
+                   get_message: Callable[[], Awaitable[Message]], emoji: str,
+                   needs_verification: Callable[[int], bool],
+                   submit: Callable[[Member], Awaitable[None]]) -> None:
+        result = CatchUpResult()
+        started = time.monotonic()
+
+        try:
+            message = await get_message()
+            reaction = next((r for r in message.reactions if str(r.emoji) == emoji), None)
+
+            if reaction is not None:
+                delay = 1 / self.rate if self.rate > 0 else 0
+
+                # Pages through the users in bulk (100 per request)
+                async for user in reaction.users(limit=None):
+                    result.seen += 1
+                    if user.bot or not needs_verification(user.id):
+                        continue
+
+                    member = user if isinstance(user, Member) else await get_member(user.id)
+                    if member is None:
+                        continue
+
+                    await submit(member)
+                    result.recovered += 1
+
+                    if delay:
+                        await asyncio.sleep(delay)
+        except Exception:
+            log.exception("Reaction catch-up failed")
+        finally:
+            result.duration = time.monotonic() - started
+            self.last_result = result
+
+            log.info(f"Reaction catch-up: recovered {result.recovered} missed verification requests "
+                     f"out of {result.seen} reactions in {result.duration:.2f}s")
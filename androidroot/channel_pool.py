@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional, Deque, Set, Dict
+
+from discord import Guild, TextChannel, CategoryChannel, Member, PermissionOverwrite
+from discord.errors import HTTPException
+
+from .scheduler import ActionScheduler, Priority
+from .utilities import generate_id
+
+log = logging.getLogger(__name__)
+
+CHANNEL_NAME_PREFIX = "verification-"
+
+
+def is_verification_channel_name(name: str) -> bool:
+    """
+    :return: True if the name matches verification-<4digits>
+    """
+    return len(name) == len("verification-1234") and name.startswith(CHANNEL_NAME_PREFIX)
+
+
+def hidden_overwrites(guild: Guild) -> Dict:
+    """
+    :return: Overwrites for a verification channel nobody but the bot can see
+    """
+    return {
+        guild.me: PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True,
+                                      manage_messages=True),
+        guild.default_role: PermissionOverwrite(read_messages=False, send_messages=False),
+    }
+
+
+def member_overwrite() -> PermissionOverwrite:
+    return PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True)
+
+
+class ChannelPool:
+    """
+    Keeps a number of idle, hidden verification channels ready so a verification does not have to wait
+    for a channel to be created. Channels are handed out by adding the member's overwrite and recycled
+    after the verification by purging them and removing the overwrite again.
+
+    A size of 0 disables the pool: channels are then created and deleted for each verification.
+    """
+    def __init__(self, size: int, low_water: int, scheduler: ActionScheduler):
+        self.size = max(size, 0)
+        self.low_water = min(max(low_water, 0), self.size)
+        self.scheduler = scheduler
+
+        self._guild: Optional[Guild] = None
+        self._category: Optional[CategoryChannel] = None
+
+        self._idle: Deque[TextChannel] = deque()
+        self._in_use: Set[int] = set()
+        self._creating = 0
+        # Channels being adopted, handed out or recycled, they already count against the size
+        self._updating: Set[int] = set()
+        self._refill_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @property
+    def room(self) -> int:
+        """
+        :return: How many more channels the pool can take
+        """
+        return max(self.size - len(self._idle) - len(self._in_use) - self._creating - len(self._updating), 0)
+
+    def owns(self, channel_id: int) -> bool:
+        if channel_id in self._in_use or channel_id in self._updating:
+            return True
+        return any(ch.id == channel_id for ch in self._idle)
+
+    def attach(self, guild: Guild, category: CategoryChannel) -> None:
+        self._guild = guild
+        self._category = category
+
+    async def adopt(self, channel: TextChannel) -> bool:
+        """
+        Takes over an existing verification channel (e.g. left over from the previous run).
+        :return: False if the pool is full and the channel should be deleted instead
+        """
+        if self.owns(channel.id):
+            return True
+        if self.room == 0:
+            return False
+
+        self._updating.add(channel.id)
+        try:
+            await self._reset(channel)
+        except HTTPException:
+            log.warning(f"Could not adopt verification channel {channel.name} ({channel.id})")
+            return False
+        finally:
+            self._updating.discard(channel.id)
+
+        self._idle.append(channel)
+        log.info(f"Adopted verification channel into the pool: {channel.name} ({channel.id})")
+        return True
+
+    async def acquire(self, member: Member) -> Optional[TextChannel]:
+        """
+        Hands out an idle channel to the member.
+        :return: TextChannel or None if the pool is empty (or disabled)
+        """
+        channel = None
+        while self._idle and channel is None:
+            candidate = self._idle.popleft()
+            self._updating.add(candidate.id)
+            try:
+                await self.scheduler.run(Priority.NORMAL, lambda: candidate.set_permissions(
+                    member, overwrite=member_overwrite(),
+                    reason=f"Authenticating user {member.id}#{member.discriminator}"
+                ))
+            except HTTPException:
+                log.warning(f"Pooled verification channel {candidate.id} is unusable, dropping it")
+            else:
+                channel = candidate
+                self._in_use.add(channel.id)
+            finally:
+                self._updating.discard(candidate.id)
+
+        self.refill()
+
+        return channel
+
+    async def release(self, channel: TextChannel, member: Member, reason: str) -> None:
+        """
+        Returns the channel into the pool if there is room for it, otherwise deletes it.
+        """
+        self._in_use.discard(channel.id)
+
+        if self.room > 0:
+            self._updating.add(channel.id)
+            try:
+                await self.scheduler.run(
+                    Priority.NORMAL, lambda: channel.set_permissions(member, overwrite=None, reason=reason)
+                )
+                await self.scheduler.run(Priority.NORMAL, lambda: channel.purge(limit=None))
+            except HTTPException:
+                log.warning(f"Could not recycle verification channel {channel.name} ({channel.id}), deleting it")
+            else:
+                self._idle.append(channel)
+                return
+            finally:
+                self._updating.discard(channel.id)
+
+        await self.scheduler.run(Priority.NORMAL, lambda: channel.delete(reason=reason))
+        self.refill()
+
+    def refill(self) -> None:
+        """
+        Starts refilling the pool in the background if it dropped below the low-water mark.
+        """
+        if not self.enabled or self._guild is None:
+            return
+        if len(self._idle) + self._creating > self.low_water:
+            return
+        if self._refill_task is not None and not self._refill_task.done():
+            return
+
+        self._refill_task = asyncio.ensure_future(self._refill())
+
+    async def _refill(self) -> None:
+        while self.room > 0:
+            self._creating += 1
+            try:
+                channel = await self.scheduler.run(Priority.NORMAL, lambda: self._guild.create_text_channel(
+                    f"{CHANNEL_NAME_PREFIX}{generate_id(4)}",
+                    category=self._category,
+                    overwrites=hidden_overwrites(self._guild),
+                    reason="Refilling the verification channel pool"
+                ))
+            except HTTPException as e:
+                log.warning(f"Could not create pooled verification channel: {e}")
+                return
+            finally:
+                self._creating -= 1
+
+            self._idle.append(channel)
+
+    async def _reset(self, channel: TextChannel) -> None:
+        await self.scheduler.run(Priority.NORMAL, lambda: channel.edit(
+            overwrites=hidden_overwrites(channel.guild), reason="Adopting verification channel"
+        ))
+        await self.scheduler.run(Priority.NORMAL, lambda: channel.purge(limit=None))
@@ -1,6 +1,6 @@
 from discord.ext.commands import Context, check
 
-from .config import SPECIAL_USERS_IDS
+from .config import config_registry
 
 
 def decorate_check(predicate):
@@ -12,8 +12,9 @@ def decorate_check(predicate):
 
 
 async def is_server_owner(ctx: Context):
-    return ctx.author.id == ctx.guild.owner.id
+    return ctx.author.id == ctx.guild.owner_id
 
 
 async def is_special_user(ctx: Context):
-    return ctx.author.id in SPECIAL_USERS_IDS
+    # Read on every check, so reloading the config applies changes right away
+    return ctx.author.id in config_registry.config.special_user_ids
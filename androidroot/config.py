@@ -1,56 +1,599 @@
+import asyncio
+import codecs
 import configparser
+import copy
 import logging
-import codecs
+import os
+import re
 
 from json import loads
+from typing import Dict, List, Optional, Callable, Iterable, Mapping, Tuple, Any
+
+from .guilds import GuildConfig
 
 log = logging.getLogger(__name__)
 
 CONFIG_FILE = "./data/config.ini"
+# Every option can also be set with an environment variable, which wins over config.ini:
+# ANDROIDROOT_<SECTION>__<OPTION>, e.g. ANDROIDROOT_BOT__BOT_TOKEN or ANDROIDROOT_GUILD_<ID>__<OPTION>
+ENVIRONMENT_PREFIX = "ANDROIDROOT_"
 
-config = configparser.ConfigParser()
-config.read_file(codecs.open(CONFIG_FILE, "r", "utf-8"))
+SECTIONS = ("Bot", "Cache", "TriggerConfig", "AuthConfig", "Captcha", "Lockout", "Storage", "BulkRoles", "Workers",
+            "Logging", "Metrics", "Debug", "Status")
 
-#######
-# Bot
-#######
-BOT_TOKEN = config.get("Bot", "bot_token", fallback=None)
-if not BOT_TOKEN:
-    raise Exception("'bot_token' is missing!")
+_REQUIRED = object()
 
-BOT_PREFIX = config.get("Bot", "bot_prefix", fallback="!").strip(" ")
-SPECIAL_USERS_IDS = [int(id_) for id_ in loads(config.get("Bot", "special_user_ids", fallback="[]"))]
 
-log.info(f"Special users: {', '.join([str(a) for a in SPECIAL_USERS_IDS])}")
+class ConfigError(Exception):
+    """
+    An option is missing or has a value it can't have.
+    """
 
-#######
-# TriggerConfig
-#######
-GUILD_ID: int = config.getint("TriggerConfig", "guild_id")
-VERIFICATION_TRIGGER_CHANNEL_ID: int = config.getint("TriggerConfig", "verification_trigger_channel_id")
-VERIFICATION_TRIGGER_MESSAGE_ID: int = config.getint("TriggerConfig", "verification_trigger_message_id")
-VERIFICATION_TRIGGER_EMOJI: str = config.get("TriggerConfig", "verification_trigger_emoji")
 
-#######
-# AuthConfig
-#######
-VERIFICATION_CHANNEL_CATEGORY_ID: int = config.getint("AuthConfig", "verification_channel_category_id")
-VERIFICATION_SUCCESS_ROLE_ID: int = config.getint("AuthConfig", "verification_success_role_id")
+class ConfigReader:
+    """
+    The options of config.ini with the environment overrides applied. The getters convert and check the values
+    and raise a ConfigError naming the option if one doesn't fit. Empty values count as not set, except for text.
+    """
+    def __init__(self, parser: configparser.ConfigParser, environ: Mapping[str, str] = os.environ):
+        self.parser = parser
+        for name, value in environ.items():
+            if name.startswith(ENVIRONMENT_PREFIX) and "__" in name:
+                section_name, option = name[len(ENVIRONMENT_PREFIX):].split("__", 1)
+                self._override(self._section(section_name), option.lower(), value)
 
-#######
-# Logging
-#######
-LOG_VERIFICATIONS_CONSOLE = config.getboolean("Logging", "log_verification_to_console")
-LOG_VERIFICATIONS_CHANNEL = config.get("Logging", "log_verification_to_channel")
-try:
-    LOG_VERIFICATIONS_CHANNEL = int(LOG_VERIFICATIONS_CHANNEL)
-except ValueError:
-    LOG_VERIFICATIONS_CHANNEL = None
+    def _section(self, environment_name: str) -> str:
+        for section in SECTIONS + tuple(self.parser.sections()):
+            if re.sub(r"\W", "_", section).upper() == environment_name:
+                return section
+
+        match = re.fullmatch(r"GUILD_(\d+)", environment_name)
+        if match is None:
+            raise ConfigError(f"{ENVIRONMENT_PREFIX}{environment_name}__* doesn't belong to a section of config.ini")
+
+        return f"Guild:{match.group(1)}"
+
+    def _override(self, section: str, option: str, value: str) -> None:
+        if not self.parser.has_section(section):
+            self.parser.add_section(section)
+        try:
+            self.parser.set(section, option, value)
+        except ValueError as e:
+            raise ConfigError(f"[{section}] {option} (from the environment): {e}")
+
+    def sections(self) -> List[str]:
+        return self.parser.sections()
+
+    def _get(self, section: str, option: str) -> Optional[str]:
+        try:
+            return self.parser.get(section, option, fallback=None)
+        except configparser.Error as e:
+            raise ConfigError(f"[{section}] {option}: {e.message}")
+
+    def _convert(self, section: str, option: str, fallback: Any, convert: Callable[[str], Any],
+                 expected: str) -> Any:
+        value = self._get(section, option)
+        if value is None or not value.strip():
+            if fallback is _REQUIRED:
+                raise ConfigError(f"[{section}] {option} is missing")
+            return fallback
+
+        try:
+            return convert(value.strip())
+        except (ValueError, TypeError, KeyError):
+            raise ConfigError(f"[{section}] {option} has to be {expected}, not '{value}'")
+
+    def string(self, section: str, option: str, fallback: Any = _REQUIRED) -> str:
+        value = self._get(section, option)
+        if value is None:
+            if fallback is _REQUIRED:
+                raise ConfigError(f"[{section}] {option} is missing")
+            return fallback
+
+        return value
+
+    def integer(self, section: str, option: str, fallback: Any = _REQUIRED, minimum: Optional[int] = None) -> int:
+        value = self._convert(section, option, fallback, int, "a whole number")
+        return self._at_least(section, option, value, minimum)
+
+    def number(self, section: str, option: str, fallback: Any = _REQUIRED,
+               minimum: Optional[float] = None) -> float:
+        value = self._convert(section, option, fallback, float, "a number")
+        return self._at_least(section, option, value, minimum)
+
+    def boolean(self, section: str, option: str, fallback: Any = _REQUIRED) -> bool:
+        return self._convert(section, option, fallback, lambda value: self.parser.BOOLEAN_STATES[value.lower()],
+                             "true or false")
+
+    def choice(self, section: str, option: str, choices: Iterable[str], fallback: Any = _REQUIRED) -> str:
+        choices = tuple(choices)
+        value = self._convert(section, option, fallback, str.lower, "text")
+        if value not in choices:
+            raise ConfigError(f"[{section}] {option} has to be one of {', '.join(repr(c) for c in choices)}, "
+                              f"not '{value}'")
+        return value
+
+    def optional(self, section: str, option: str, fallback: Optional[str] = None) -> Optional[str]:
+        """
+        :return: The value, None if it is None or empty
+        """
+        value = self._get(section, option)
+        if value is None:
+            return fallback
+
+        value = value.strip()
+        return value if value not in ("", "None") else None
+
+    def optional_id(self, section: str, option: str) -> Optional[int]:
+        """
+        :return: The Discord ID, None if it is None or empty
+        """
+        value = self.optional(section, option)
+        if value is not None and not value.isdigit():
+            raise ConfigError(f"[{section}] {option} has to be an ID or None, not '{value}'")
+
+        return int(value) if value is not None else None
+
+    def id_list(self, section: str, option: str, fallback: Any = _REQUIRED) -> List[int]:
+        """
+        :return: The Discord IDs of a JSON array
+        """
+        def convert(value: str) -> List[int]:
+            ids = loads(value)
+            if not isinstance(ids, list):
+                raise ValueError(value)
+            return [int(id_) for id_ in ids]
+
+        return self._convert(section, option, fallback, convert, "a JSON array of IDs")
+
+    @staticmethod
+    def _at_least(section: str, option: str, value: Any, minimum: Optional[float]) -> Any:
+        if minimum is not None and value is not None and value < minimum:
+            raise ConfigError(f"[{section}] {option} has to be at least {minimum}, not {value}")
+        return value
+
+
+class Config:
+    """
+    Everything in config.ini, converted and checked. A Config isn't changed once it's created, a reload creates
+    a new one (see ConfigRegistry).
+    """
+    # Options that take effect while the bot is running, the others keep their value until the next restart.
+    # The guilds are compared setting by setting (see GuildConfig.RESTART_FIELDS).
+    RELOADABLE = frozenset((
+        "bot_prefix", "special_user_ids", "lockout_base", "lockout_max", "lockout_ttl", "log_level",
+        "log_verifications_console", "status_name", "status_type", "status_url", "member_status",
+    ))
+
+    def __init__(self, reader: ConfigReader):
+        #######
+        # Bot
+        #######
+        self.bot_token: str = reader.string("Bot", "bot_token", fallback="").strip()
+        if not self.bot_token:
+            raise ConfigError("'bot_token' is missing!")
+
+        self.bot_prefix: str = reader.string("Bot", "bot_prefix", fallback="!").strip(" ")
+        self.special_user_ids: List[int] = reader.id_list("Bot", "special_user_ids", fallback=[])
+        # How many outbound API calls can be in flight at once (see androidroot.scheduler)
+        self.outbound_workers: int = reader.integer("Bot", "outbound_workers", fallback=4, minimum=1)
+        # How many stale verification channels are cleaned up at once on startup
+        self.startup_cleanup_concurrency: int = reader.integer("Bot", "startup_cleanup_concurrency", fallback=5,
+                                                               minimum=1)
+        # Connect with several shards (for many guilds), the shard count is the one Discord recommends unless set
+        self.sharded: bool = reader.boolean("Bot", "sharded", fallback=False)
+        self.shard_count: Optional[int] = reader.integer("Bot", "shard_count", fallback=None, minimum=1)
+        # How often (in seconds) data/strings.json and this file are checked for changes and reloaded,
+        # 0 only reloads them on SIGHUP
+        self.strings_check_interval: float = reader.number("Bot", "strings_check_interval", fallback=5, minimum=0)
+        self.config_check_interval: float = reader.number("Bot", "config_check_interval",
+                                                          fallback=self.strings_check_interval, minimum=0)
+
+        #######
+        # Cache
+        #######
+        # Gateway intents (names of discord.Intents flags), the bot needs at least the ones in the fallback
+        self.cache_intents: List[str] = [name.strip() for name in reader.string(
+            "Cache", "intents", fallback="guilds, members, guild_messages, guild_reactions"
+        ).split(",") if name.strip()]
+        # How many messages discord.py keeps in memory, 0 disables the message cache
+        self.cache_messages: int = reader.integer("Cache", "message_cache_size", fallback=0, minimum=0)
+        # Keep members in memory (the ones that join and, with chunking, everyone), otherwise they're requested
+        # when needed
+        self.cache_members: bool = reader.boolean("Cache", "cache_members", fallback=True)
+        # Request the whole member list when connecting instead of when the verified index is built
+        self.cache_chunk_at_startup: bool = reader.boolean("Cache", "chunk_members_at_startup",
+                                                           fallback=self.cache_members)
+        if self.cache_chunk_at_startup and not self.cache_members:
+            raise ConfigError("'chunk_members_at_startup' requires 'cache_members'!")
+
+        #######
+        # TriggerConfig
+        #######
+        self.guild_id: int = reader.integer("TriggerConfig", "guild_id")
+        # How many missed reactions per second to start verifications for when catching up after a
+        # restart/reconnect
+        self.verification_catch_up_rate: float = reader.number("TriggerConfig", "verification_catch_up_rate",
+                                                               fallback=2, minimum=0)
+
+        #######
+        # AuthConfig
+        #######
+        self.max_concurrent_verifications: int = reader.integer("AuthConfig", "max_concurrent_verifications",
+                                                                fallback=25, minimum=1)
+        # "text" sends the code in the message, "image" as a distorted image (see androidroot.captcha, needs Pillow)
+        self.verification_challenge: str = reader.choice("AuthConfig", "verification_challenge", ("text", "image"),
+                                                         fallback="text")
+        # "channel" verifies in a channel of the verification category, "dm" in the member's DMs (falling back to
+        # a channel if they are closed)
+        self.verification_mode: str = reader.choice("AuthConfig", "verification_mode", ("channel", "dm"),
+                                                    fallback="channel")
+
+        #######
+        # Captcha
+        #######
+        # Pre-rendered images for the image challenge, refilled in the background once fewer than the low-water
+        # mark are left
+        self.captcha_pool_size: int = reader.integer("Captcha", "pool_size", fallback=100, minimum=1)
+        self.captcha_pool_low_water: int = reader.integer("Captcha", "pool_low_water",
+                                                          fallback=self.captcha_pool_size // 2, minimum=0)
+        # Processes rendering the images (0 for one per CPU core)
+        self.captcha_processes: int = reader.integer("Captcha", "processes", fallback=0, minimum=0)
+        # TrueType font for the codes, None uses the one built into Pillow
+        self.captcha_font: Optional[str] = reader.optional("Captcha", "font")
+
+        #######
+        # Lockout
+        #######
+        # After a failed (timed out) verification, a member has to wait this many seconds before they can try
+        # again, doubling with every further failure up to max_lockout. 0 disables it.
+        self.lockout_base: float = reader.number("Lockout", "base_lockout", fallback=60, minimum=0)
+        self.lockout_max: float = reader.number("Lockout", "max_lockout", fallback=3600, minimum=0)
+        # Failures are forgotten this many seconds after the last one
+        self.lockout_ttl: float = reader.number("Lockout", "ttl", fallback=86400, minimum=0)
+        # The failures are saved here on shutdown and loaded on startup, None keeps them in memory only
+        self.lockout_snapshot: Optional[str] = reader.optional("Lockout", "snapshot", fallback="./data/lockouts.json")
+
+        #######
+        # Storage
+        #######
+        # Pending verification sessions are kept here so they can be resumed after a restart
+        self.session_database: str = reader.string("Storage", "session_database", fallback="./data/sessions.sqlite3")
+        self.session_database_flush_interval: float = reader.number("Storage", "flush_interval", fallback=1,
+                                                                    minimum=0)
+        # Every verification attempt is kept here for !verifylog, None disables it
+        self.audit_database: Optional[str] = reader.optional("Storage", "audit_database",
+                                                             fallback="./data/audit.sqlite3")
+        # Attempts older than this many days are deleted
+        self.audit_retention_days: float = reader.number("Storage", "audit_retention_days", fallback=90, minimum=0)
+
+        #######
+        # BulkRoles
+        #######
+        # How many role changes of !verifyall/!unverifyall run at once
+        self.bulk_role_concurrency: int = reader.integer("BulkRoles", "concurrency", fallback=4, minimum=1)
+        self.bulk_role_progress_interval: float = reader.number("BulkRoles", "progress_interval", fallback=5,
+                                                                minimum=0)
+        self.bulk_role_checkpoint_directory: str = reader.string("BulkRoles", "checkpoint_directory",
+                                                                 fallback="./data/jobs")
+
+        #######
+        # Workers
+        #######
+        # Run verifications and bulk role jobs in separate worker processes (worker.py) instead of the bot process
+        self.workers_enabled: bool = reader.boolean("Workers", "enabled", fallback=False)
+        # Job queue shared by the bot and the workers
+        self.job_database: str = reader.string("Workers", "job_database", fallback="./data/jobs.sqlite3")
+        # How many jobs each worker runs at once
+        self.worker_concurrency: int = reader.integer("Workers", "concurrency",
+                                                      fallback=self.max_concurrent_verifications, minimum=1)
+        # How often (in seconds) the queue is written and checked for new jobs and answers
+        self.worker_poll_interval: float = reader.number("Workers", "poll_interval", fallback=0.25, minimum=0)
+        # A job of a worker that didn't check in for this many seconds is handed to another worker (at most
+        # max_attempts times)
+        self.worker_lease: float = reader.number("Workers", "lease", fallback=30, minimum=0)
+        self.worker_max_attempts: int = reader.integer("Workers", "max_attempts", fallback=3, minimum=1)
+
+        #######
+        # Logging
+        #######
+        self.log_level: str = reader.choice("Logging", "log_level", ("debug", "info", "warning", "error", "critical"),
+                                            fallback="info").upper()
+        # Records are also written as JSON lines to this file (rotated by size), None disables it
+        self.log_file: Optional[str] = reader.optional("Logging", "log_file", fallback="./data/logs/bot.log")
+        self.log_file_max_bytes: int = reader.integer("Logging", "log_file_max_bytes", fallback=10 * 1024 * 1024,
+                                                      minimum=0)
+        self.log_file_backups: int = reader.integer("Logging", "log_file_backups", fallback=5, minimum=0)
+        # How many records can wait to be written before they're sampled (debug) or dropped
+        self.log_queue_size: int = reader.integer("Logging", "log_queue_size", fallback=10000, minimum=1)
+
+        self.log_verifications_console: bool = reader.boolean("Logging", "log_verification_to_console")
+        # Verification log embeds are sent in batches, at least this often (in seconds)
+        self.log_verifications_channel_flush_interval: float = reader.number(
+            "Logging", "log_channel_flush_interval", fallback=5, minimum=0
+        )
+        # With more than this many buffered, a compact text digest is sent instead of the embeds
+        self.log_verifications_channel_digest_threshold: int = reader.integer(
+            "Logging", "log_channel_digest_threshold", fallback=30, minimum=1
+        )
+
+        #######
+        # Guilds
+        #######
+        # The guild of [TriggerConfig]/[AuthConfig] plus one per [Guild:<id>] section, by guild ID.
+        # Guild sections fall back to the values of the first guild for the emoji and the pool.
+        pool_size = reader.integer("AuthConfig", "verification_channel_pool_size", fallback=0, minimum=0)
+        main_guild = GuildConfig(
+            self.guild_id,
+            reader.integer("TriggerConfig", "verification_trigger_channel_id"),
+            reader.integer("TriggerConfig", "verification_trigger_message_id"),
+            reader.string("TriggerConfig", "verification_trigger_emoji").strip(),
+            reader.integer("AuthConfig", "verification_channel_category_id"),
+            reader.integer("AuthConfig", "verification_success_role_id"),
+            reader.optional_id("Logging", "log_verification_to_channel"),
+            pool_size,
+            reader.integer("AuthConfig", "verification_channel_pool_low_water", fallback=pool_size // 2, minimum=0)
+        )
+        self.guilds: Dict[int, GuildConfig] = {self.guild_id: main_guild}
+
+        for section in reader.sections():
+            if not section.startswith("Guild:"):
+                continue
+            if not section[len("Guild:"):].isdigit():
+                raise ConfigError(f"[{section}] has to be named [Guild:<guild ID>]")
+
+            guild_id = int(section[len("Guild:"):])
+            pool_size = reader.integer(section, "verification_channel_pool_size", fallback=main_guild.pool_size,
+                                       minimum=0)
+            self.guilds[guild_id] = GuildConfig(
+                guild_id,
+                reader.integer(section, "verification_trigger_channel_id"),
+                reader.integer(section, "verification_trigger_message_id"),
+                reader.string(section, "verification_trigger_emoji", fallback=main_guild.trigger_emoji).strip(),
+                reader.integer(section, "verification_channel_category_id"),
+                reader.integer(section, "verification_success_role_id"),
+                reader.optional_id(section, "log_verification_to_channel"),
+                pool_size,
+                reader.integer(section, "verification_channel_pool_low_water", fallback=pool_size // 2, minimum=0)
+            )
+
+        if self.workers_enabled:
+            # Workers create a channel per verification, pooled channels would sit unused in the bot process
+            for guild_config in self.guilds.values():
+                guild_config.pool_size = guild_config.pool_low_water = 0
+
+        #######
+        # Metrics
+        #######
+        # Port of the Prometheus metrics endpoint (0 disables it)
+        self.metrics_port: int = reader.integer("Metrics", "port", fallback=0, minimum=0)
+        self.metrics_host: str = reader.string("Metrics", "host", fallback="127.0.0.1")
+
+        #######
+        # Debug
+        #######
+        # Record the incoming reactions, messages and member joins/leaves (anonymized) to this file, None disables it
+        self.record_gateway_events: Optional[str] = reader.optional("Debug", "record_gateway_events")
+        # How often the event loop lag is sampled and after how long (in seconds) a blocked loop is reported with
+        # its stack
+        self.loop_lag_interval: float = reader.number("Debug", "loop_lag_interval", fallback=0.5, minimum=0)
+        self.loop_stall_threshold: float = reader.number("Debug", "stall_threshold", fallback=0.25, minimum=0)
+        # Where !diag saves profiles and memory snapshots
+        self.diagnostics_directory: str = reader.string("Debug", "diagnostics_directory",
+                                                        fallback="./data/diagnostics")
+
+        #######
+        # Status
+        #######
+        self.status_name: str = reader.string("Status", "discord_status", fallback="")
+        # Empty for no activity
+        self.status_type: str = reader.choice("Status", "discord_status_type",
+                                              ("", "playing", "watching", "listening", "streaming"), fallback="")
+        self.status_url: str = reader.string("Status", "discord_twitch_url", fallback="").strip()
+        self.member_status: str = reader.choice("Status", "discord_member_status",
+                                                ("online", "offline", "idle", "dnd", "invisible"), fallback="online")
+
+    def reloaded(self, loaded: "Config") -> Tuple["Config", List[str]]:
+        """
+        :param loaded: The config just read from the file
+        :return: This config with the reloadable options of loaded, and the changed options that need a restart
+        """
+        config = copy.copy(self)
+        restart = []
+        for name, value in vars(loaded).items():
+            if name == "guilds" or value == getattr(self, name):
+                continue
+
+            if name in self.RELOADABLE:
+                setattr(config, name, value)
+            else:
+                restart.append(name)
+
+        config.guilds = {}
+        for guild_id, guild_config in self.guilds.items():
+            loaded_guild = loaded.guilds.get(guild_id)
+            if loaded_guild is None:
+                restart.append(f"removing guild {guild_id}")
+                config.guilds[guild_id] = guild_config
+                continue
+
+            config.guilds[guild_id] = copy.copy(loaded_guild)
+            for field in GuildConfig.RESTART_FIELDS:
+                if getattr(loaded_guild, field) != getattr(guild_config, field):
+                    restart.append(f"{field} of guild {guild_id}")
+                    setattr(config.guilds[guild_id], field, getattr(guild_config, field))
+
+        restart.extend(f"adding guild {guild_id}" for guild_id in loaded.guilds.keys() - self.guilds.keys())
+        return config, restart
+
+
+def load_config(path: str, environ: Mapping[str, str] = os.environ) -> Config:
+    """
+    Reads and checks the config file.
+    :raises ConfigError: If an option is missing or has a value it can't have
+    """
+    parser = configparser.ConfigParser()
+    try:
+        with codecs.open(path, "r", "utf-8") as config_file:
+            parser.read_file(config_file)
+    except configparser.Error as e:
+        raise ConfigError(f"Could not parse {path}: {e}")
+
+    return Config(ConfigReader(parser, environ))
+
+
+class ConfigRegistry:
+    """
+    The config in use. Like the strings (see StringRegistry), a reload reads and checks the whole file before
+    swapping it in at once, if anything is wrong with it the current config stays in use. Options that need
+    a restart keep their current value, the listeners apply the others (e.g. the presence) without reconnecting.
+    """
+    def __init__(self, path: str, environ: Mapping[str, str] = os.environ):
+        self.path = path
+        self.environ = environ
+        self.config = load_config(path, environ)
+        self._modified = os.stat(path).st_mtime_ns
+        self._listeners: List[Callable[[Config, Config], None]] = []
+
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    def add_listener(self, listener: Callable[[Config, Config], None]) -> None:
+        """
+        :param listener: Called with the old and the new config after every reload
+        """
+        self._listeners.append(listener)
+
+    def reload(self) -> bool:
+        """
+        :return: True if the new config is in use
+        """
+        try:
+            self._modified = os.stat(self.path).st_mtime_ns
+            loaded = load_config(self.path, self.environ)
+        except Exception as e:
+            self.failed_reloads += 1
+            log.error(f"Keeping the current config, could not reload it: {e}")
+            return False
+
+        config, restart = self.config.reloaded(loaded)
+        if restart:
+            log.warning(f"Only taking effect after a restart: {', '.join(restart)}")
+
+        old, self.config = self.config, config
+        self.reloads += 1
+        log.info(f"Reloaded {self.path}")
+
+        for listener in self._listeners:
+            try:
+                listener(old, config)
+            except Exception as e:
+                log.exception(f"Could not apply the reloaded config: {e!r}")
+
+        return True
+
+    async def watch(self, interval: float) -> None:
+        """
+        Reloads the config when the file changes, checking every interval seconds.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                modified = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                log.warning(f"Could not check {self.path} for changes: {e}")
+                continue
+
+            if modified != self._modified:
+                self.reload()
+
+
+config_registry = ConfigRegistry(CONFIG_FILE)
 
 #######
-# Status
+# Constants
 #######
-DISCORD_STATUS_NAME = config.get("Status", "discord_status")
-DISCORD_TYPE = config.get("Status", "discord_status_type")
-DISCORD_TWITCH = config.get("Status", "discord_twitch_url")
-DISCORD_STATUS = config.get("Status", "discord_member_status")
+# The config at startup. Options that need a restart are read from these, the reloadable ones
+# (Config.RELOADABLE and the guilds) from config_registry.config where they are used.
+_config = config_registry.config
+_main_guild = _config.guilds[_config.guild_id]
+
+BOT_TOKEN = _config.bot_token
+BOT_PREFIX = _config.bot_prefix
+SPECIAL_USERS_IDS = _config.special_user_ids
+OUTBOUND_WORKERS = _config.outbound_workers
+STARTUP_CLEANUP_CONCURRENCY = _config.startup_cleanup_concurrency
+SHARDED = _config.sharded
+SHARD_COUNT = _config.shard_count
+STRINGS_CHECK_INTERVAL = _config.strings_check_interval
+CONFIG_CHECK_INTERVAL = _config.config_check_interval
+
+CACHE_INTENTS = _config.cache_intents
+CACHE_MESSAGES = _config.cache_messages
+CACHE_MEMBERS = _config.cache_members
+CACHE_CHUNK_AT_STARTUP = _config.cache_chunk_at_startup
+
+GUILD_ID = _config.guild_id
+VERIFICATION_TRIGGER_CHANNEL_ID = _main_guild.trigger_channel_id
+VERIFICATION_TRIGGER_MESSAGE_ID = _main_guild.trigger_message_id
+VERIFICATION_TRIGGER_EMOJI = _main_guild.trigger_emoji
+VERIFICATION_CATCH_UP_RATE = _config.verification_catch_up_rate
+
+VERIFICATION_CHANNEL_CATEGORY_ID = _main_guild.category_id
+VERIFICATION_SUCCESS_ROLE_ID = _main_guild.role_id
+VERIFICATION_CHANNEL_POOL_SIZE = _main_guild.pool_size
+VERIFICATION_CHANNEL_POOL_LOW_WATER = _main_guild.pool_low_water
+MAX_CONCURRENT_VERIFICATIONS = _config.max_concurrent_verifications
+VERIFICATION_CHALLENGE = _config.verification_challenge
+VERIFICATION_MODE = _config.verification_mode
+
+CAPTCHA_POOL_SIZE = _config.captcha_pool_size
+CAPTCHA_POOL_LOW_WATER = _config.captcha_pool_low_water
+CAPTCHA_PROCESSES = _config.captcha_processes
+CAPTCHA_FONT = _config.captcha_font
+
+LOCKOUT_BASE = _config.lockout_base
+LOCKOUT_MAX = _config.lockout_max
+LOCKOUT_TTL = _config.lockout_ttl
+LOCKOUT_SNAPSHOT = _config.lockout_snapshot
+
+SESSION_DATABASE = _config.session_database
+SESSION_DATABASE_FLUSH_INTERVAL = _config.session_database_flush_interval
+AUDIT_DATABASE = _config.audit_database
+AUDIT_RETENTION_DAYS = _config.audit_retention_days
+
+BULK_ROLE_CONCURRENCY = _config.bulk_role_concurrency
+BULK_ROLE_PROGRESS_INTERVAL = _config.bulk_role_progress_interval
+BULK_ROLE_CHECKPOINT_DIRECTORY = _config.bulk_role_checkpoint_directory
+
+WORKERS_ENABLED = _config.workers_enabled
+JOB_DATABASE = _config.job_database
+WORKER_CONCURRENCY = _config.worker_concurrency
+WORKER_POLL_INTERVAL = _config.worker_poll_interval
+WORKER_LEASE = _config.worker_lease
+WORKER_MAX_ATTEMPTS = _config.worker_max_attempts
+
+LOG_LEVEL = _config.log_level
+LOG_FILE = _config.log_file
+LOG_FILE_MAX_BYTES = _config.log_file_max_bytes
+LOG_FILE_BACKUPS = _config.log_file_backups
+LOG_QUEUE_SIZE = _config.log_queue_size
+LOG_VERIFICATIONS_CONSOLE = _config.log_verifications_console
+LOG_VERIFICATIONS_CHANNEL = _main_guild.log_channel_id
+LOG_VERIFICATIONS_CHANNEL_FLUSH_INTERVAL = _config.log_verifications_channel_flush_interval
+LOG_VERIFICATIONS_CHANNEL_DIGEST_THRESHOLD = _config.log_verifications_channel_digest_threshold
+
+GUILDS = _config.guilds
+
+METRICS_PORT = _config.metrics_port
+METRICS_HOST = _config.metrics_host
+
+RECORD_GATEWAY_EVENTS = _config.record_gateway_events
+LOOP_LAG_INTERVAL = _config.loop_lag_interval
+LOOP_STALL_THRESHOLD = _config.loop_stall_threshold
+DIAGNOSTICS_DIRECTORY = _config.diagnostics_directory
+
+DISCORD_STATUS_NAME = _config.status_name
+DISCORD_TYPE = _config.status_type
+DISCORD_TWITCH = _config.status_url
+DISCORD_STATUS = _config.member_status
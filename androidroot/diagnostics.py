@@ -0,0 +1,265 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import deque
+from datetime import datetime
+from typing import Optional, Deque, Dict, Tuple, List
+
+from discord import Client
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+log = logging.getLogger(__name__)
+
+
+def _timestamp() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def process_memory() -> Tuple[float, float]:
+    """
+    :return: (current, peak) resident memory of the process in MiB, 0 where it can't be read
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else 0.0
+
+    try:
+        with open("/proc/self/statm", "r") as file:
+            pages = int(file.read().split()[1])
+        current = pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        current = peak
+
+    return current, max(peak, current)
+
+
+def cache_report(client: Client) -> Dict[str, int]:
+    """
+    :return: How many objects of each kind discord.py has cached
+    """
+    guilds = client.guilds
+    return {
+        "guilds": len(guilds),
+        "members": sum(len(guild.members) for guild in guilds),
+        "users": len(client.users),
+        "channels": sum(len(guild.channels) for guild in guilds),
+        "roles": sum(len(guild.roles) for guild in guilds),
+        "messages": len(client.cached_messages),
+    }
+
+
+class Stall:
+    """
+    A time the event loop didn't run for longer than the stall threshold, with the stack it was stuck in.
+    """
+    def __init__(self, started: float, stack: str):
+        self.started = started
+        self.stack = stack
+        # Filled in once the loop runs again
+        self.duration: Optional[float] = None
+
+
+class LoopMonitor:
+    """
+    Measures the event loop lag (how late a sleep wakes up) and catches stalls: a watchdog thread notices
+    when the loop hasn't checked in for too long and captures the stack of the loop thread at that moment,
+    which is the code that is blocking it.
+    """
+    def __init__(self, interval: float = 0.5, stall_threshold: float = 0.25, history: int = 240):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+
+        self.samples: Deque[float] = deque(maxlen=history)
+        self.max_lag = 0.0
+        self.stalls: Deque[Stall] = deque(maxlen=20)
+        self.stall_count = 0
+
+        self._heartbeat = 0.0
+        self._pending_stall: Optional[Stall] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+
+        self._task = asyncio.ensure_future(self._sample())
+        threading.Thread(target=self._watch, name="LoopWatchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        :return: Lag statistics of the recent samples in milliseconds
+        """
+        samples = list(self.samples)
+        return {
+            "samples": len(samples),
+            "p50": _percentile(samples, 0.50) * 1000,
+            "p95": _percentile(samples, 0.95) * 1000,
+            "max": max(samples, default=0.0) * 1000,
+            "max_since_start": self.max_lag * 1000,
+            "stalls": self.stall_count,
+        }
+
+    def longest_stall(self) -> Optional[Stall]:
+        finished = [s for s in self.stalls if s.duration is not None]
+        return max(finished, key=lambda s: s.duration, default=None)
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+
+            lag = max(now - expected, 0.0)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self._heartbeat = now
+
+            stall = self._pending_stall
+            if stall is not None:
+                self._pending_stall = None
+                stall.duration = now - stall.started
+                log.warning(f"Event loop was blocked for {stall.duration * 1000:.0f}ms in:\n{stall.stack}")
+
+    # Runs on the watchdog thread
+    def _watch(self) -> None:
+        check_every = max(self.stall_threshold / 2, 0.01)
+
+        while not self._stopped.wait(check_every):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.stall_threshold or self._pending_stall is not None:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            stall = Stall(heartbeat + self.interval, "".join(traceback.format_stack(frame)))
+            self._pending_stall = stall
+            self.stalls.append(stall)
+            self.stall_count += 1
+
+
+class Profiler:
+    """
+    Profiles everything running on the event loop thread for a while with cProfile.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.running = False
+
+    async def profile(self, seconds: float, top: int = 15) -> Tuple[str, str]:
+        """
+        :return: (path of the saved profile, summary of the top functions by cumulative time)
+        """
+        if self.running:
+            raise RuntimeError("A profile is already running")
+
+        self.running = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+            self.running = False
+
+        path = os.path.join(self.directory, f"profile-{_timestamp()}.prof")
+        return path, await asyncio.get_event_loop().run_in_executor(None, self._save, profile, path, top)
+
+    def _save(self, profile: cProfile.Profile, path: str, top: int) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile.dump_stats(path)
+
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).strip_dirs().sort_stats("cumulative").print_stats(top)
+        with open(f"{path}.txt", "w", encoding="utf-8") as file:
+            file.write(summary.getvalue())
+
+        return summary.getvalue()
+
+
+class MemoryTracer:
+    """
+    Traces allocations with tracemalloc and shows what grew between snapshots.
+    """
+    def __init__(self, directory: str, frames: int = 5):
+        self.directory = directory
+        self.frames = frames
+
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        if not self.tracing:
+            tracemalloc.start(self.frames)
+        self._previous = self._snapshot()
+
+    def stop(self) -> None:
+        self._previous = None
+        if self.tracing:
+            tracemalloc.stop()
+
+    async def diff(self, top: int = 10) -> Tuple[float, float, str]:
+        """
+        Takes a snapshot (also saved to the diagnostics directory) and compares it to the previous one.
+        :return: (current MiB, peak MiB, the top allocation sites by growth)
+        """
+        snapshot = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        statistics = snapshot.compare_to(self._previous, "lineno") if self._previous is not None \
+            else snapshot.statistics("lineno")
+        self._previous = snapshot
+
+        await asyncio.get_event_loop().run_in_executor(None, self._save, snapshot)
+
+        lines = "\n".join(str(statistic) for statistic in statistics[:top])
+        return current / 1024 / 1024, peak / 1024 / 1024, lines
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def _save(self, snapshot: tracemalloc.Snapshot) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot.dump(os.path.join(self.directory, f"memory-{_timestamp()}.snapshot"))
@@ -0,0 +1,187 @@
+import logging
+from typing import Optional, List
+
+from discord import Guild, TextChannel, Message, Role, CategoryChannel, Member
+from discord.errors import NotFound
+from discord.ext.commands import Bot
+
+from .cache import entity_cache
+from .catchup import ReactionCatchUp
+from .channel_pool import ChannelPool
+from .log_sink import VerificationLogSink
+from .member_index import VerifiedIndex
+from .scheduler import ActionScheduler
+
+log = logging.getLogger(__name__)
+
+
+class GuildConfig:
+    """
+    Verification settings of one guild ([TriggerConfig]/[AuthConfig] or a [Guild:<id>] section of config.ini).
+    """
+    # Settings the channel pool is set up with, changing them needs a restart (the others are reloaded)
+    RESTART_FIELDS = ("category_id", "pool_size", "pool_low_water")
+
+    def __init__(self, guild_id: int, trigger_channel_id: int, trigger_message_id: int, trigger_emoji: str,
+                 category_id: int, role_id: int, log_channel_id: Optional[int],
+                 pool_size: int = 0, pool_low_water: int = 0):
+        self.guild_id = guild_id
+        self.trigger_channel_id = trigger_channel_id
+        self.trigger_message_id = trigger_message_id
+        self.trigger_emoji = trigger_emoji
+        self.category_id = category_id
+        self.role_id = role_id
+        self.log_channel_id = log_channel_id
+        self.pool_size = pool_size
+        self.pool_low_water = pool_low_water
+
+
+# Cached entities (see GuildState._key) that are looked up with a setting
+_ENTITIES_BY_SETTING = {
+    "trigger_channel_id": ("trigger_channel", "trigger_message"),
+    "trigger_message_id": ("trigger_message",),
+    "role_id": ("verified_role",),
+    "log_channel_id": ("logging_channel",),
+}
+
+
+class GuildState:
+    """
+    Everything the bot keeps per configured guild: the settings, cached entities, verified member index,
+    channel pool, verification log and reaction catch-up. Events are routed to it by guild ID.
+    """
+    def __init__(self, bot: Bot, config: GuildConfig, scheduler: ActionScheduler, catch_up_rate: float,
+                 log_flush_interval: float = 5, log_digest_threshold: int = 30):
+        self.bot = bot
+        self.config = config
+        self.id = config.guild_id
+
+        self.verified_index = VerifiedIndex()
+        self.channel_pool = ChannelPool(config.pool_size, config.pool_low_water, scheduler)
+        self.catch_up = ReactionCatchUp(catch_up_rate)
+        self.log_sink = VerificationLogSink(
+            bot.http, self.get_logging_channel, scheduler,
+            flush_interval=log_flush_interval, digest_threshold=log_digest_threshold
+        )
+
+        # Cached like the other entities (see androidroot.cache), one key per guild
+        entity_cache.watch(self._key("guild"), ("guild_update", "guild_remove"))
+        entity_cache.watch(self._key("trigger_channel"), ("guild_channel_update", "guild_channel_delete"))
+        entity_cache.watch(self._key("trigger_message"), ("message_edit", "message_delete"))
+        entity_cache.watch(self._key("verified_role"), ("guild_role_update", "guild_role_delete"))
+        entity_cache.watch(self._key("logging_channel"), ("guild_channel_update", "guild_channel_delete"))
+
+    def _key(self, name: str) -> str:
+        return f"{name}:{self.id}"
+
+    def apply_config(self, config: GuildConfig) -> List[str]:
+        """
+        Swaps in reloaded settings and invalidates the cached entities whose IDs changed.
+        :return: Names of the settings that changed
+        """
+        changed = [name for name, value in vars(config).items() if getattr(self.config, name) != value]
+        self.config = config
+        for name in changed:
+            for entity in _ENTITIES_BY_SETTING.get(name, ()):
+                entity_cache.invalidate(self._key(entity))
+
+        return changed
+
+    async def get_guild(self) -> Guild:
+        async def get():
+            return self.bot.get_guild(self.id)
+
+        return await entity_cache.get(self._key("guild"), get)
+
+    async def get_trigger_channel(self) -> TextChannel:
+        async def get():
+            return (await self.get_guild()).get_channel(self.config.trigger_channel_id)
+
+        return await entity_cache.get(self._key("trigger_channel"), get)
+
+    async def get_trigger_message(self) -> Message:
+        async def get():
+            return await (await self.get_trigger_channel()).fetch_message(self.config.trigger_message_id)
+
+        return await entity_cache.get(self._key("trigger_message"), get)
+
+    async def get_verified_role(self) -> Role:
+        """
+        :return: Role to add when successfully authenticated.
+        """
+        async def get():
+            return (await self.get_guild()).get_role(self.config.role_id)
+
+        return await entity_cache.get(self._key("verified_role"), get)
+
+    async def get_logging_channel(self) -> Optional[TextChannel]:
+        if self.config.log_channel_id is None:
+            return None
+
+        async def get():
+            return (await self.get_guild()).get_channel(self.config.log_channel_id)
+
+        return await entity_cache.get(self._key("logging_channel"), get)
+
+    async def get_category(self) -> CategoryChannel:
+        """
+        :return: Category the verification channels are created in
+        """
+        guild = await self.get_guild()
+        category = next((c for c in guild.categories if c.id == self.config.category_id), None)
+        if category is None:
+            raise Exception(f"Could not find category with ID {self.config.category_id} in guild {self.id}")
+
+        return category
+
+    def is_trigger(self, message_id: int, emoji: str) -> bool:
+        return message_id == self.config.trigger_message_id and emoji == self.config.trigger_emoji
+
+    async def get_member(self, member_id: int) -> Optional[Member]:
+        """
+        :return: Member from the cache or, if not all members are cached, from the API (None if they left)
+        """
+        guild = await self.get_guild()
+        member = guild.get_member(member_id)
+        if member is None and not guild.chunked:
+            try:
+                member = await guild.fetch_member(member_id)
+            except NotFound:
+                return None
+
+        return member
+
+    async def is_verified(self, member: Member) -> bool:
+        """
+        :return: True if the member has the verified role (looked up in the VerifiedIndex once it is built)
+        """
+        if self.verified_index.ready:
+            return member.id in self.verified_index
+
+        return await self.get_verified_role() in member.roles
+
+    async def build_verified_index(self, cache_members: bool) -> None:
+        """
+        Builds the VerifiedIndex from the member list (requesting it in one go if it's not cached).
+        """
+        guild = await self.get_guild()
+        verified_role = await self.get_verified_role()
+
+        if guild.chunked:
+            self.verified_index.rebuild(member.id for member in verified_role.members)
+        else:
+            # Without the member cache the list is only used for the index and not kept
+            members = await guild.chunk(cache=cache_members)
+            self.verified_index.rebuild(member.id for member in members if verified_role in member.roles)
+
+    def sync_verified_index(self, event: str, data: dict) -> None:
+        """
+        Applies a GUILD_MEMBER_UPDATE or GUILD_MEMBER_REMOVE gateway payload to the index. discord.py only
+        dispatches on_member_update and on_member_remove for cached members, this keeps the index right
+        when members aren't cached.
+        """
+        member_id = int(data["user"]["id"])
+        if event == "GUILD_MEMBER_UPDATE" and str(self.config.role_id) in data.get("roles", ()):
+            self.verified_index.add(member_id)
+        else:
+            self.verified_index.discard(member_id)
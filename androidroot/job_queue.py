@@ -0,0 +1,293 @@
+import json
+import logging
+import time
+from typing import Optional, Dict, List, Set, Tuple
+
+from .sqlite_store import BatchedSQLiteStore, Operation
+
+log = logging.getLogger(__name__)
+
+
+class JobKind:
+    # Verify one member (guild ID, member ID)
+    VERIFY = "verify"
+    # !verifyall/!unverifyall (one per guild at a time)
+    BULK_ROLE = "bulk_role"
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    FINISHED = (DONE, FAILED)
+
+
+class Job:
+    """
+    A job as it was read from the queue.
+    """
+    def __init__(self, id_: int, kind: str, guild_id: int, member_id: int, payload: str, status: str,
+                 attempts: int, channel_id: Optional[int], result: Optional[str], created: float):
+        self.id = id_
+        self.kind = kind
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.payload: dict = json.loads(payload) if payload else {}
+        self.status = status
+        self.attempts = attempts
+        # Verification channel of the current (or, after a retry, the previous) attempt
+        self.channel_id = channel_id
+        self.result: dict = json.loads(result) if result else {}
+        # Wall-clock (time.time()) time it was queued
+        self.created = created
+
+
+class ForwardedMessage:
+    """
+    A message the gateway saw in a verification channel, handed to the worker running that verification.
+    """
+    def __init__(self, id_: int, channel_id: int, author_id: int, message_id: int, content: str):
+        self.id = id_
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.message_id = message_id
+        self.content = content
+
+
+_JOB_COLUMNS = "id, kind, guild_id, member_id, payload, status, attempts, channel_id, result, created"
+
+
+class JobQueue(BatchedSQLiteStore):
+    """
+    Local job queue between the gateway process (bot.py) and the worker processes (worker.py), in a SQLite
+    database they all open. No broker: workers claim jobs in a transaction, so each job runs once.
+
+    - the gateway queues verifications and forwards the answers sent in verification channels, both batched
+      like the other stores (every flush_interval seconds),
+    - a worker holds a lease on each job it runs and renews it while it is alive. Jobs of a crashed worker are
+      handed to the next worker once the lease runs out (up to max_attempts times, then they fail),
+    - finished jobs stay in the table until the gateway collected their result (and a while after that).
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            member_id INTEGER NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            worker TEXT,
+            lease_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            channel_id INTEGER,
+            result TEXT,
+            reported INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            finished REAL
+        );
+        -- At most one open job per member (and kind), repeated requests are ignored
+        CREATE UNIQUE INDEX IF NOT EXISTS jobs_open ON jobs (kind, guild_id, member_id)
+            WHERE status IN ('queued', 'running');
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+        CREATE TABLE IF NOT EXISTS job_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            created REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.25, lease: float = 30, max_attempts: int = 3):
+        super().__init__(path, flush_interval)
+        self.lease = lease
+        self.max_attempts = max(max_attempts, 1)
+
+        self._pending: List[Operation] = []
+
+    # Gateway side
+    def enqueue(self, kind: str, guild_id: int, member_id: int, payload: Optional[dict] = None) -> None:
+        """
+        Queues a job with the next batch (ignored if the member already has an open job of that kind).
+        """
+        self._pending.append((
+            "INSERT OR IGNORE INTO jobs (kind, guild_id, member_id, payload, created) VALUES (?, ?, ?, ?, ?)",
+            (kind, guild_id, member_id, json.dumps(payload or {}), time.time())
+        ))
+        self._schedule_flush()
+
+    async def submit(self, kind: str, guild_id: int, member_id: int, payload: Optional[dict] = None) -> Optional[int]:
+        """
+        Queues a job right away.
+        :return: Job ID, None if there already is an open job of that kind for the member
+        """
+        return await self._run(self._insert, kind, guild_id, member_id, json.dumps(payload or {}))
+
+    def forward(self, channel_id: int, author_id: int, message_id: int, content: str) -> None:
+        self._pending.append((
+            "INSERT INTO job_messages (channel_id, author_id, message_id, content, created) VALUES (?, ?, ?, ?, ?)",
+            (channel_id, author_id, message_id, content, time.time())
+        ))
+        self._schedule_flush()
+
+    async def get(self, job_id: int) -> Optional[Job]:
+        rows = await self.query(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,))
+        return Job(*rows[0]) if rows else None
+
+    async def is_pending(self, kind: str, guild_id: int, member_id: int) -> bool:
+        rows = await self.query(
+            "SELECT 1 FROM jobs WHERE kind = ? AND guild_id = ? AND member_id = ? AND status IN ('queued', 'running')",
+            (kind, guild_id, member_id)
+        )
+        return bool(rows)
+
+    async def active_channels(self) -> Set[int]:
+        """
+        :return: Verification channels of running jobs (not stale, even if the gateway doesn't know them)
+        """
+        rows = await self.query("SELECT channel_id FROM jobs WHERE status = 'running' AND channel_id IS NOT NULL")
+        return {channel_id for channel_id, in rows}
+
+    async def counts(self) -> Dict[str, int]:
+        """
+        :return: Number of jobs by status
+        """
+        rows = await self.query("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return dict(rows)
+
+    async def collect_finished(self) -> List[Job]:
+        """
+        :return: Jobs that finished since the last call
+        """
+        return await self._run(self._collect_finished)
+
+    async def prune(self, job_age: float, message_age: float) -> None:
+        """
+        Deletes collected jobs that finished more than job_age seconds ago and older forwarded messages.
+        """
+        now = time.time()
+        await self._run(self._execute, "DELETE FROM jobs WHERE reported = 1 AND finished < ?", (now - job_age,))
+        await self._run(self._execute, "DELETE FROM job_messages WHERE created < ?", (now - message_age,))
+
+    # Worker side
+    async def claim(self, worker: str) -> Optional[Job]:
+        """
+        Takes the oldest queued job and leases it to the worker. Jobs whose lease ran out are queued
+        again (or failed after max_attempts) first.
+        """
+        return await self._run(self._claim, worker)
+
+    async def renew(self, worker: str) -> None:
+        """
+        Extends the leases of all jobs the worker is running, call at least every lease / 2 seconds.
+        """
+        await self._run(self._execute, "UPDATE jobs SET lease_until = ? WHERE worker = ? AND status = 'running'",
+                        (time.time() + self.lease, worker))
+
+    async def release(self, worker: str) -> None:
+        """
+        Queues the jobs of the worker again without counting the attempt, when it shuts down.
+        """
+        await self._run(self._execute, "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, "
+                                        "attempts = attempts - 1 WHERE worker = ? AND status = 'running'", (worker,))
+
+    async def update(self, job: Job, channel_id: Optional[int] = None, result: Optional[dict] = None) -> None:
+        """
+        Records the verification channel or the progress of a running job.
+        """
+        if channel_id is not None:
+            job.channel_id = channel_id
+        if result is not None:
+            job.result = result
+
+        await self._run(self._execute, "UPDATE jobs SET channel_id = ?, result = ? WHERE id = ?",
+                        (job.channel_id, json.dumps(job.result), job.id))
+
+    async def finish(self, job: Job, status: str, result: Optional[dict] = None) -> None:
+        if result is not None:
+            job.result = result
+        job.status = status
+
+        await self._run(self._execute, "UPDATE jobs SET status = ?, result = ?, worker = NULL, finished = ? "
+                                        "WHERE id = ?", (status, json.dumps(job.result), time.time(), job.id))
+
+    async def last_message_id(self) -> int:
+        rows = await self.query("SELECT COALESCE(MAX(id), 0) FROM job_messages")
+        return rows[0][0]
+
+    async def messages(self, after_id: int) -> List[ForwardedMessage]:
+        """
+        :return: Forwarded messages newer than after_id, oldest first
+        """
+        rows = await self.query("SELECT id, channel_id, author_id, message_id, content FROM job_messages "
+                                "WHERE id > ? ORDER BY id", (after_id,))
+        return [ForwardedMessage(*row) for row in rows]
+
+    def _take_pending(self) -> List[Operation]:
+        operations, self._pending = self._pending, []
+        return operations
+
+    # These run on the store thread
+    def _execute(self, sql: str, parameters: tuple) -> None:
+        with self._connection:
+            self._connection.execute(sql, parameters)
+
+    def _insert(self, kind: str, guild_id: int, member_id: int, payload: str) -> Optional[int]:
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO jobs (kind, guild_id, member_id, payload, created) VALUES (?, ?, ?, ?, ?)",
+                (kind, guild_id, member_id, payload, time.time())
+            )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def _claim(self, worker: str) -> Optional[Job]:
+        now = time.time()
+        connection = self._connection
+
+        # Take the write lock before looking, so two workers can't pick the same job
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            expired: List[Tuple[int, int]] = connection.execute(
+                "SELECT id, attempts FROM jobs WHERE status = 'running' AND lease_until < ?", (now,)
+            ).fetchall()
+            for job_id, attempts in expired:
+                if attempts >= self.max_attempts:
+                    log.error(f"Job {job_id} failed, its worker stopped responding {attempts} times")
+                    connection.execute("UPDATE jobs SET status = 'failed', worker = NULL, finished = ?, "
+                                       "result = ? WHERE id = ?", (now, json.dumps({"error": "worker lost"}), job_id))
+                else:
+                    log.warning(f"Job {job_id} is queued again, its worker stopped responding")
+                    connection.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL "
+                                       "WHERE id = ?", (job_id,))
+
+            row = connection.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                connection.execute("UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, "
+                                   "attempts = attempts + 1 WHERE id = ?", (worker, now + self.lease, row[0]))
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+        if row is None:
+            return None
+
+        job = Job(*row)
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        return job
+
+    def _collect_finished(self) -> List[Job]:
+        with self._connection:
+            rows = self._connection.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status IN ('done', 'failed') AND reported = 0"
+            ).fetchall()
+            if rows:
+                self._connection.executemany("UPDATE jobs SET reported = 1 WHERE id = ?", [(row[0],) for row in rows])
+
+        return [Job(*row) for row in rows]
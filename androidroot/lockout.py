@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class AttemptRecord:
+    __slots__ = ("failures", "last_attempt", "locked_until", "notified")
+
+    def __init__(self, failures: int, last_attempt: float, locked_until: float):
+        self.failures = failures
+        # Wall-clock (time.time()) times, so a snapshot stays valid after a restart
+        self.last_attempt = last_attempt
+        self.locked_until = locked_until
+        # The member was told about the current lockout already
+        self.notified = False
+
+
+class LockoutTable:
+    """
+    Failed verification attempts per member. After a failure, the member has to wait before the next
+    verification starts: base_lockout seconds after the first one, doubling with every further failure
+    up to max_lockout. Requests during a lockout are rejected before any channel is created.
+
+    Members are forgotten ttl seconds after their last failure (a success forgets them right away). Records
+    are kept in the order of their last failure, so expired ones are always at the front and evicting them
+    never looks at the others. A base_lockout of 0 disables the table.
+    """
+    def __init__(self, base_lockout: float, max_lockout: float, ttl: float):
+        self.configure(base_lockout, max_lockout, ttl)
+
+        # (guild ID, member ID) -> record, oldest last failure first
+        self._records: "OrderedDict[Tuple[int, int], AttemptRecord]" = OrderedDict()
+
+        self.rejected = 0
+        self.evicted = 0
+
+    def configure(self, base_lockout: float, max_lockout: float, ttl: float) -> None:
+        """
+        Sets the lockout durations, current lockouts keep their end.
+        """
+        self.base_lockout = max(base_lockout, 0)
+        self.max_lockout = max(max_lockout, self.base_lockout)
+        # Never forget a member while they are still locked out
+        self.ttl = max(ttl, self.max_lockout)
+
+    @property
+    def enabled(self) -> bool:
+        return self.base_lockout > 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def locked_for(self, guild_id: int, member_id: int) -> float:
+        """
+        Checks a verification request and counts it if it's rejected.
+        :return: Seconds the member is still locked out for, 0 if the verification can start
+        """
+        record = self._records.get((guild_id, member_id))
+        if record is None:
+            return 0.0
+
+        remaining = record.locked_until - time.time()
+        if remaining <= 0:
+            return 0.0
+
+        self.rejected += 1
+        return remaining
+
+    def should_notify(self, guild_id: int, member_id: int) -> bool:
+        """
+        :return: True once per lockout, so repeated requests don't each send a message
+        """
+        record = self._records.get((guild_id, member_id))
+        if record is None or record.notified:
+            return False
+
+        record.notified = True
+        return True
+
+    def record_failure(self, guild_id: int, member_id: int) -> float:
+        """
+        :return: Seconds the member is locked out for now
+        """
+        if not self.enabled:
+            return 0.0
+
+        now = time.time()
+        self._evict(now)
+
+        key = (guild_id, member_id)
+        record = self._records.pop(key, None)
+        failures = record.failures + 1 if record is not None else 1
+
+        lockout = min(self.base_lockout * 2 ** min(failures - 1, 32), self.max_lockout)
+        self._records[key] = AttemptRecord(failures, now, now + lockout)
+        return lockout
+
+    def record_success(self, guild_id: int, member_id: int) -> None:
+        self._records.pop((guild_id, member_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        now = time.time()
+        return {
+            "size": len(self._records),
+            "locked": sum(1 for record in self._records.values() if record.locked_until > now),
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
+
+    def _evict(self, now: float) -> None:
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record.last_attempt + self.ttl > now:
+                break
+
+            del self._records[key]
+            self.evicted += 1
+
+    def save(self, path: str) -> None:
+        """
+        Writes the records that haven't expired yet to a JSON snapshot.
+        """
+        self._evict(time.time())
+        records = [[guild_id, member_id, record.failures, record.last_attempt, record.locked_until]
+                   for (guild_id, member_id), record in self._records.items()]
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            json.dump(records, snapshot_file)
+        os.replace(temporary_path, path)
+
+        log.info(f"Saved {len(records)} failed verification attempts to {path}")
+
+    def load(self, path: Optional[str]) -> int:
+        """
+        Restores a snapshot written by save().
+        :return: Number of records restored
+        """
+        if path is None or not os.path.isfile(path):
+            return 0
+
+        try:
+            with open(path, "r") as snapshot_file:
+                records = json.load(snapshot_file)
+        except (OSError, ValueError) as e:
+            log.warning(f"Ignoring unreadable lockout snapshot {path}: {e}")
+            return 0
+
+        now = time.time()
+        # Sorted by last failure, so the oldest are evicted first again
+        for guild_id, member_id, failures, last_attempt, locked_until in sorted(records, key=lambda r: r[3]):
+            if last_attempt + self.ttl > now:
+                self._records[(guild_id, member_id)] = AttemptRecord(failures, last_attempt, locked_until)
+
+        log.info(f"Restored {len(self._records)} failed verification attempts from {path}")
+        return len(self._records)
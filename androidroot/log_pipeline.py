@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional, Dict, List
+
+# Attributes every LogRecord has, everything else on a record came in through extra={...}
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line. Fields passed with extra={...} (e.g. member_id, outcome)
+    become top-level keys.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _SheddingQueueHandler(QueueHandler):
+    """
+    Puts records on the queue without ever blocking the caller. When the queue fills up, debug records are
+    sampled and then dropped, info records are dropped and warnings and errors push out the oldest record.
+    """
+    def __init__(self, pipeline: "LogPipeline"):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+        self._debug_seen = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread, only %-style arguments are merged here because
+        # the objects they refer to might change by then
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        pipeline = self.pipeline
+
+        if record.levelno <= logging.DEBUG and self.queue.qsize() >= pipeline.sample_above:
+            self._debug_seen += 1
+            if self._debug_seen % pipeline.debug_sample_rate != 0:
+                pipeline.sampled_out += 1
+                return
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                pipeline.dropped += 1
+                return
+
+            try:
+                self.queue.get_nowait()
+                pipeline.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                pipeline.dropped += 1
+                return
+
+        pipeline.enqueued += 1
+
+
+class _CountingListener(QueueListener):
+    def __init__(self, pipeline: "LogPipeline", handlers: List[logging.Handler]):
+        super().__init__(pipeline.queue, *handlers, respect_handler_level=True)
+        self.pipeline = pipeline
+
+    def handle(self, record: logging.LogRecord) -> None:
+        super().handle(record)
+        self.pipeline.written += 1
+        self.pipeline.report_shedding(self)
+
+
+class LogPipeline:
+    """
+    Moves log formatting and I/O off the event loop: loggers only put records on a bounded queue and
+    a background thread writes them to the console and (as JSON lines) to a size-rotated log file.
+    When the queue fills up, records are sampled or dropped instead of making the bot wait.
+    """
+    # How often dropped records are reported (in seconds)
+    REPORT_INTERVAL = 60
+
+    def __init__(self):
+        self.queue: Optional[queue.Queue] = None
+        self.sample_above = 0
+        self.debug_sample_rate = 10
+
+        self._listener: Optional[_CountingListener] = None
+        self._previous_handlers: List[logging.Handler] = []
+        self._last_report = 0.0
+        self._reported_lost = 0
+        self._report_lock = threading.Lock()
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None
+
+    def start(self, level: int = logging.INFO, file: Optional[str] = None, max_bytes: int = 10 * 1024 * 1024,
+              backups: int = 5, queue_size: int = 10000, debug_sample_rate: int = 10) -> None:
+        """
+        Replaces the handlers of the root logger with the queue.
+        :param file: JSON log file (None to only log to the console)
+        :param debug_sample_rate: When the queue is more than half full, only every n-th debug record is kept
+        """
+        if self.running:
+            self.stop()
+
+        self.queue = queue.Queue(maxsize=max(queue_size, 1))
+        self.sample_above = max(queue_size // 2, 1)
+        self.debug_sample_rate = max(debug_sample_rate, 1)
+
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        handlers: List[logging.Handler] = [console]
+
+        if file is not None:
+            directory = os.path.dirname(file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            file_handler = RotatingFileHandler(file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            file_handler.setFormatter(JSONFormatter())
+            handlers.append(file_handler)
+
+        root = logging.getLogger()
+        self._previous_handlers = list(root.handlers)
+        for handler in self._previous_handlers:
+            root.removeHandler(handler)
+        root.addHandler(_SheddingQueueHandler(self))
+        root.setLevel(level)
+
+        self._listener = _CountingListener(self, handlers)
+        self._listener.start()
+
+    def stop(self) -> None:
+        """
+        Writes out what's still queued and puts the previous root handlers back.
+        """
+        if not self.running:
+            return
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, _SheddingQueueHandler):
+                root.removeHandler(handler)
+        for handler in self._previous_handlers:
+            root.addHandler(handler)
+
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+        }
+
+    def report_shedding(self, listener: QueueListener) -> None:
+        """
+        Called on the listener thread, writes a warning if records were dropped or sampled out recently.
+        """
+        now = time.monotonic()
+        if now - self._last_report < self.REPORT_INTERVAL:
+            return
+
+        with self._report_lock:
+            lost = self.dropped + self.sampled_out
+            self._last_report = now
+            if lost == self._reported_lost:
+                return
+
+            record = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                f"Logging fell behind: {lost - self._reported_lost} records were dropped or sampled out "
+                f"({self.dropped} dropped, {self.sampled_out} sampled out since start)", None, None
+            )
+            self._reported_lost = lost
+
+        # Straight to the handlers, the queue might still be full
+        for handler in listener.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+log_pipeline = LogPipeline()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from typing import Optional, Callable, Awaitable, List
+
+from discord import TextChannel, Embed
+from discord.http import HTTPClient, Route
+
+from .scheduler import ActionScheduler, Priority
+
+log = logging.getLogger(__name__)
+
+# Discord allows up to 10 embeds per message and 2000 characters of content
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_MESSAGE_LENGTH = 2000
+
+
+class VerificationLogSink:
+    """
+    Buffers verification log embeds and sends them to the logging channel in batches
+    (one message with up to 10 embeds) whenever the buffer is full or the flush interval passes.
+    If too many embeds pile up (e.g. during a raid), they are sent as a compact text digest instead.
+    """
+    def __init__(self, http: HTTPClient, get_channel: Callable[[], Awaitable[Optional[TextChannel]]],
+                 scheduler: ActionScheduler, flush_interval: float = 5, digest_threshold: int = 30):
+        self.http = http
+        self.get_channel = get_channel
+        self.scheduler = scheduler
+        self.flush_interval = flush_interval
+        self.digest_threshold = digest_threshold
+
+        self._buffer: List[Embed] = []
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def add(self, embed: Embed) -> None:
+        self._buffer.append(embed)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        elif len(self._buffer) >= MAX_EMBEDS_PER_MESSAGE:
+            self._full.set()
+
+    async def close(self) -> None:
+        """
+        Sends everything that is still buffered, call before shutting down.
+        """
+        self._closing = True
+        self._full.set()
+
+        if self._task is not None and not self._task.done():
+            await self._task
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+
+        embeds, self._buffer = self._buffer, []
+
+        channel = await self.get_channel()
+        if channel is None:
+            return
+
+        if len(embeds) > self.digest_threshold:
+            for digest in self._digest(embeds):
+                await self.scheduler.run(Priority.COSMETIC, lambda: channel.send(digest))
+        else:
+            for start in range(0, len(embeds), MAX_EMBEDS_PER_MESSAGE):
+                batch = embeds[start:start + MAX_EMBEDS_PER_MESSAGE]
+                await self.scheduler.run(Priority.COSMETIC, lambda: self._send_embeds(channel, batch))
+
+    async def _run(self) -> None:
+        while self._buffer:
+            if len(self._buffer) < MAX_EMBEDS_PER_MESSAGE and not self._closing:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            try:
+                await self.flush()
+            except Exception as e:
+                log.warning(f"Could not send verification log batch: {e!r}")
+
+    async def _send_embeds(self, channel: TextChannel, embeds: List[Embed]):
+        if len(embeds) == 1:
+            return await channel.send(embed=embeds[0])
+
+        # TextChannel.send only takes a single embed, so post the batch directly
+        route = Route("POST", "/channels/{channel_id}/messages", channel_id=channel.id)
+        return await self.http.request(route, json={"embeds": [e.to_dict() for e in embeds]})
+
+    @staticmethod
+    def _digest(embeds: List[Embed]) -> List[str]:
+        """
+        :return: Messages listing one embed per line, each under the message length limit
+        """
+        messages = []
+        current = f"**{len(embeds)} verifications** (digest):"
+
+        for embed in embeds:
+            line = f"\n• {embed.title}"
+            if embed.footer.text:
+                line += f" · {embed.footer.text}"
+
+            if len(current) + len(line) > MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current = line.lstrip("\n")
+            else:
+                current += line
+
+        messages.append(current)
+        return messages
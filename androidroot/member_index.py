@@ -0,0 +1,84 @@
+import logging
+import time
+from collections import deque
+from typing import Set, Iterable, List, Deque, Tuple
+
+from discord import Member
+
+log = logging.getLogger(__name__)
+
+
+class VerifiedIndex:
+    """
+    Set of the IDs of all members that have the verified role.
+    Built once from the member list at startup and then kept up to date from member events
+    and the bot's own role changes, so checking whether someone is verified is a set lookup.
+
+    The number of verified members is also sampled over time (at most once per history_interval)
+    to be able to show growth.
+    """
+    def __init__(self, history_interval: float = 3600, history_length: int = 24 * 31):
+        self._members: Set[int] = set()
+        self.ready = False
+
+        self.history_interval = history_interval
+        # (timestamp, verified count)
+        self.history: Deque[Tuple[float, int]] = deque(maxlen=history_length)
+
+    def __contains__(self, member_id: int) -> bool:
+        return member_id in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def rebuild(self, member_ids: Iterable[int]) -> None:
+        self._members = set(member_ids)
+        self.ready = True
+        self._sample()
+
+        log.info(f"Verified member index built: {len(self._members)} verified members")
+
+    def add(self, member_id: int) -> None:
+        if member_id not in self._members:
+            self._members.add(member_id)
+            self._sample()
+
+    def discard(self, member_id: int) -> None:
+        if member_id in self._members:
+            self._members.discard(member_id)
+            self._sample()
+
+    def missing(self, members: Iterable[Member]) -> List[Member]:
+        """
+        :return: Members (sorted by ID) that are not verified
+        """
+        return sorted((m for m in members if m.id not in self._members), key=lambda m: m.id)
+
+    def present(self, members: Iterable[Member]) -> List[Member]:
+        """
+        :return: Members (sorted by ID) that are verified
+        """
+        return sorted((m for m in members if m.id in self._members), key=lambda m: m.id)
+
+    def growth(self, window: float) -> int:
+        """
+        :return: Change of the verified count in the last window seconds (as far back as the history goes)
+        """
+        if not self.history:
+            return 0
+
+        since = time.time() - window
+        baseline = self.history[0][1]
+        for timestamp, count in self.history:
+            if timestamp > since:
+                break
+            baseline = count
+
+        return len(self._members) - baseline
+
+    def _sample(self) -> None:
+        now = time.time()
+        if self.history and now - self.history[-1][0] < self.history_interval:
+            return
+
+        self.history.append((now, len(self._members)))
@@ -0,0 +1,274 @@
+import functools
+import logging
+import math
+import time
+from typing import Optional, Dict, List, Tuple, Callable, Iterable, Union
+
+from aiohttp import web
+from discord.errors import HTTPException
+
+log = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace("\"", "\\\"")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f"{name}=\"{_escape(value)}\"" for name, value in zip(names, values)]
+    return f"{{{','.join(pairs)}}}" if pairs else ""
+
+
+class Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """
+        :return: (name suffix, formatted labels, value) for every sample of this metric
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Value that only goes up. If function is given, it's called on every scrape instead
+    (for counts kept elsewhere, e.g. in the scheduler).
+    """
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 function: Optional[Callable[[], Union[float, Dict[LabelValues, float]]]] = None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _current(self) -> Dict[LabelValues, float]:
+        if self.function is None:
+            return self._values
+
+        value = self.function()
+        return value if isinstance(value, dict) else {(): value}
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [("", _format_labels(self.label_names, key), value) for key, value in self._current().items()]
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down (or is read from function on every scrape).
+    """
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class _Timer:
+    """
+    Observes the elapsed time into a histogram, works as a context manager and as a decorator for coroutines.
+    """
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, *_):
+        self.histogram.observe(time.monotonic() - self._started, **self.labels)
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> (count per bucket, sum, count)
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = [[0] * len(self.buckets), 0.0, 0]
+            self._values[key] = entry
+
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][index] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names + ("le",), key + (_format_value(bound),))
+                samples.append(("_bucket", labels, cumulative))
+
+            labels = _format_labels(self.label_names, key)
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Holds all metrics and renders them in the Prometheus text format.
+    """
+    def __init__(self, prefix: str = "androidroot_"):
+        self.prefix = prefix
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = (), function=None) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labels, function))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = (), function=None) -> Gauge:
+        return self._register(Gauge(self.prefix + name, documentation, labels, function))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        rendered = []
+        for metric in self._metrics.values():
+            try:
+                rendered.append(metric.render())
+            except Exception:
+                log.exception(f"Could not collect metric {metric.name}")
+        return "\n".join(rendered) + "\n"
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a registry at http://<host>:<port>/metrics.
+    """
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        self.registry = registry
+        self.host = host
+        self.port = port
+
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    async def start(self) -> None:
+        if self.running:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        self._runner = runner
+
+        log.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, _request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+
+def instrument_http(http, latency: Histogram, responses: Counter) -> None:
+    """
+    Wraps the REST client of the bot (discord.http.HTTPClient) to record the latency of every request per route
+    (the route template, e.g. "POST /guilds/{guild_id}/channels", so the number of label values stays small).
+    Includes the time discord.py spends waiting out rate limits.
+    """
+    request = http.request
+
+    @functools.wraps(request)
+    async def timed_request(route, **kwargs):
+        name = f"{route.method} {route.path}"
+        started = time.monotonic()
+        status = "ok"
+        try:
+            return await request(route, **kwargs)
+        except HTTPException as e:
+            status = str(e.status)
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            latency.observe(time.monotonic() - started, route=name)
+            responses.inc(route=name, status=status)
+
+    http.request = timed_request
+
+
+registry = MetricsRegistry()
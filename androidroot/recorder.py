@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Callable
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Message kinds (only answers in verification channels are classified, everything else is "other")
+MESSAGE_CORRECT = "correct"
+MESSAGE_WRONG = "wrong"
+MESSAGE_OTHER = "other"
+
+
+def emoji_to_str(emoji: dict) -> str:
+    """
+    :return: The emoji of a raw reaction payload formatted like str(PartialEmoji)
+    """
+    if emoji.get("id") is None:
+        return emoji.get("name") or ""
+
+    return f"<{'a' if emoji.get('animated') else ''}:{emoji.get('name')}:{emoji['id']}>"
+
+
+class Anonymizer:
+    """
+    Replaces Discord IDs with small sequential numbers. The same ID always maps to the same number within
+    one recording, but the real IDs are never written anywhere.
+    """
+    def __init__(self):
+        self._ids: Dict[int, int] = {}
+
+    def __call__(self, real_id) -> Optional[int]:
+        if real_id is None:
+            return None
+
+        real_id = int(real_id)
+        anonymized = self._ids.get(real_id)
+        if anonymized is None:
+            anonymized = len(self._ids) + 1
+            self._ids[real_id] = anonymized
+        return anonymized
+
+
+class GatewayRecorder:
+    """
+    Writes the gateway events the verification reacts to (reactions, messages, member joins and leaves) to a
+    line-delimited JSON file, so real traffic can be replayed later (see benchmarks/replay_gateway.py).
+
+    Only the parts of the events the bot looks at are kept and all IDs are anonymized. Message contents are
+    never written, answers in verification channels are only recorded as correct or wrong.
+
+    The first line is a header with the anonymized IDs of the configured guild, trigger channel and trigger
+    message, every other line is one event with "t" being seconds since the recording started.
+    """
+    def __init__(self, path: str, guild_id: int, trigger_channel_id: int, trigger_message_id: int,
+                 trigger_emoji: str, classify_message: Callable[[int, int, str], str], flush_interval: float = 1.0):
+        """
+        :param classify_message: (channel ID, author ID, content) -> MESSAGE_CORRECT, MESSAGE_WRONG or MESSAGE_OTHER
+        """
+        self.path = path
+        self.guild_id = guild_id
+        self.trigger_emoji = trigger_emoji
+        self.classify_message = classify_message
+        self.flush_interval = flush_interval
+
+        self._anonymize = Anonymizer()
+        self._started = time.monotonic()
+        self._pending: List[str] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="GatewayRecorder")
+        # Every recording starts a new file
+        self._truncate = True
+
+        self.recorded = 0
+
+        self._pending.append(self._encode({
+            "v": FORMAT_VERSION,
+            "started": time.time(),
+            "guild": self._anonymize(guild_id),
+            "trigger_channel": self._anonymize(trigger_channel_id),
+            "trigger_message": self._anonymize(trigger_message_id),
+        }))
+
+    def handle(self, payload: dict) -> None:
+        """
+        Records a raw gateway payload (from on_socket_response) if it's one of the events we replay.
+        """
+        if payload.get("op") != 0:
+            return
+
+        data = payload.get("d") or {}
+        if data.get("guild_id") is None or int(data["guild_id"]) != self.guild_id:
+            return
+
+        event = payload.get("t")
+        record = None
+
+        if event == "MESSAGE_REACTION_ADD":
+            member = data.get("member") or {}
+            emoji = data.get("emoji") or {}
+            record = {
+                "e": "reaction",
+                "u": self._anonymize(data["user_id"]),
+                "c": self._anonymize(data["channel_id"]),
+                "m": self._anonymize(data["message_id"]),
+                "trigger": emoji_to_str(emoji) == self.trigger_emoji,
+                "bot": bool((member.get("user") or {}).get("bot", False)),
+            }
+        elif event == "MESSAGE_CREATE":
+            author = data.get("author") or {}
+            if author.get("bot", False):
+                # The bot's own messages are produced by the bot again during the replay
+                return
+
+            record = {
+                "e": "message",
+                "u": self._anonymize(author["id"]),
+                "c": self._anonymize(data["channel_id"]),
+                "k": self.classify_message(int(data["channel_id"]), int(author["id"]), data.get("content", "")),
+            }
+        elif event == "GUILD_MEMBER_ADD":
+            user = data.get("user") or {}
+            record = {"e": "join", "u": self._anonymize(user["id"]), "bot": bool(user.get("bot", False))}
+        elif event == "GUILD_MEMBER_REMOVE":
+            user = data.get("user") or {}
+            record = {"e": "leave", "u": self._anonymize(user["id"])}
+
+        if record is None:
+            return
+
+        record["t"] = round(time.monotonic() - self._started, 3)
+        self._pending.append(self._encode(record))
+        self.recorded += 1
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
+        self._executor.shutdown(wait=False)
+
+        log.info(f"Recorded {self.recorded} gateway events to {self.path}")
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+
+        lines, self._pending = self._pending, []
+        # Shielded, cancelling the flush (e.g. on close) must not drop a write that's already taken its lines
+        await asyncio.shield(asyncio.get_event_loop().run_in_executor(self._executor, self._write, lines))
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except OSError as e:
+            log.error(f"Could not write gateway recording to {self.path}: {e}")
+
+    def _write(self, lines: List[str]) -> None:
+        with open(self.path, "w" if self._truncate else "a", encoding="utf-8") as file:
+            file.write("\n".join(lines))
+            file.write("\n")
+
+        self._truncate = False
+
+    @staticmethod
+    def _encode(record: dict) -> str:
+        return json.dumps(record, separators=(",", ":"), ensure_ascii=False)
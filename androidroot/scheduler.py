@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional, Callable, Awaitable, Any, Dict, List, Hashable, Deque
+
+log = logging.getLogger(__name__)
+
+# Priority of the action the current task is executing (used to attribute rate limit hits)
+_current_priority: ContextVar[Optional[int]] = ContextVar("current_priority", default=None)
+
+
+class Priority:
+    """
+    Priority classes of outbound actions, lower runs first.
+    """
+    # Role grants and removals
+    CRITICAL = 0
+    # Channel lifecycle and messages in the verification flow
+    NORMAL = 1
+    # Reactions, log embeds, progress edits, informational DMs
+    COSMETIC = 2
+    # Role changes of !verifyall and !unverifyall, thousands of them that must not hold up verifications
+    BULK = 3
+
+    NAMES = {
+        CRITICAL: "critical",
+        NORMAL: "normal",
+        COSMETIC: "cosmetic",
+        BULK: "bulk",
+    }
+
+
+class ClassStats:
+    def __init__(self):
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        finished = self.completed + self.failed
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "average_latency": self.total_latency / finished if finished else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+
+class _Action:
+    __slots__ = ("priority", "factory", "key", "futures", "submitted_at")
+
+    def __init__(self, priority: int, factory: Callable[[], Awaitable[Any]], key: Optional[Hashable]):
+        self.priority = priority
+        self.factory = factory
+        self.key = key
+        self.futures: List[asyncio.Future] = []
+        self.submitted_at = time.monotonic()
+
+
+class _RateLimitCounter(logging.Filter):
+    """
+    discord.py retries 429s internally and only logs them (as warnings), so count them from its log records.
+    The logger lets warnings through to this filter even if the configured level is higher (see
+    ActionScheduler.follow_log_level), the filter then drops what's below the root level.
+    """
+    def __init__(self, scheduler: "ActionScheduler"):
+        super().__init__()
+        self.scheduler = scheduler
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            message = record.getMessage()
+            if "rate limited" in message or "rate limit has been hit" in message:
+                self.scheduler.record_rate_limit(_current_priority.get())
+        return record.levelno >= logging.getLogger().getEffectiveLevel()
+
+
+class ActionScheduler:
+    """
+    Runs outbound Discord API calls through a fixed number of workers, always picking the most
+    important waiting action first, so cheap cosmetic calls can't eat the rate limit role grants need.
+
+    Each class only gets up to its limit of the workers at once (by default half of them for cosmetic
+    and bulk actions) and one worker is always kept free for role grants. discord.py waits out a 429
+    inside the call, so without the limits e.g. channel creations stuck on a rate limit during a raid
+    would occupy every worker and hold up the role grants behind them.
+
+    Actions submitted with a key replace a still-waiting action with the same key (e.g. repeated edits
+    of the same message collapse into the latest one); all submitters get the result of the one that runs.
+    """
+    def __init__(self, workers: int = 4, class_limits: Optional[Dict[int, int]] = None):
+        """
+        :param class_limits: Maximum number of workers per priority class, overriding the defaults
+        """
+        self.workers = max(workers, 1)
+
+        self.class_limits: Dict[int, int] = {p: self.workers for p in Priority.NAMES}
+        self.class_limits[Priority.NORMAL] = max(self.workers - 1, 1)
+        self.class_limits[Priority.COSMETIC] = self.class_limits[Priority.BULK] = max(self.workers // 2, 1)
+        for priority, limit in (class_limits or {}).items():
+            self.class_limits[priority] = min(max(limit, 1), self.workers)
+
+        self._queues: Dict[int, Deque[_Action]] = {p: deque() for p in sorted(Priority.NAMES)}
+        self._running: Dict[int, int] = {p: 0 for p in Priority.NAMES}
+        self._pending_by_key: Dict[Hashable, _Action] = {}
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+        self.stats_by_class: Dict[int, ClassStats] = {p: ClassStats() for p in Priority.NAMES}
+        self.rate_limited_unattributed = 0
+
+        logging.getLogger("discord.http").addFilter(_RateLimitCounter(self))
+        self.follow_log_level()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, priority: int, factory: Callable[[], Awaitable[Any]],
+               key: Optional[Hashable] = None) -> asyncio.Future:
+        """
+        Queues an action. The returned future can be awaited for the result or ignored
+        (failures are logged either way).
+        :param factory: Callable returning the coroutine to run, e.g. lambda: member.add_roles(role)
+        :param key: Coalescing key, a waiting action with the same key is replaced by this one
+        """
+        self._ensure_workers()
+
+        future = asyncio.get_event_loop().create_future()
+        # Mark exceptions as retrieved so fire-and-forget actions don't warn, the worker logs them
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        stats = self.stats_by_class[priority]
+        stats.submitted += 1
+
+        if key is not None and key in self._pending_by_key:
+            action = self._pending_by_key[key]
+            action.factory = factory
+            action.futures.append(future)
+            stats.coalesced += 1
+            return future
+
+        action = _Action(priority, factory, key)
+        action.futures.append(future)
+        if key is not None:
+            self._pending_by_key[key] = action
+
+        self._queues[priority].append(action)
+        self._wakeup.set()
+
+        return future
+
+    async def run(self, priority: int, factory: Callable[[], Awaitable[Any]], key: Optional[Hashable] = None) -> Any:
+        """
+        Queues an action and waits for its result.
+        """
+        return await self.submit(priority, factory, key)
+
+    def record_rate_limit(self, priority: Optional[int]) -> None:
+        if priority is None:
+            self.rate_limited_unattributed += 1
+        else:
+            self.stats_by_class[priority].rate_limited += 1
+
+    @staticmethod
+    def follow_log_level() -> None:
+        """
+        Lowers the level of discord.http to warning if the root level is higher, so the rate limit counter
+        still sees its rate limit warnings. Call after changing the root level.
+        """
+        level = logging.getLogger().getEffectiveLevel()
+        logging.getLogger("discord.http").setLevel(min(level, logging.WARNING))
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {Priority.NAMES[p]: s.to_dict() for p, s in self.stats_by_class.items()}
+
+    def _ensure_workers(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+        self._worker_tasks = [t for t in self._worker_tasks if not t.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.ensure_future(self._work()))
+
+    def _next_action(self) -> Optional[_Action]:
+        """
+        :return: Oldest action of the most important class that is below its limit
+        """
+        # Everything but role grants shares all workers but one
+        others_running = sum(self._running.values()) - self._running[Priority.CRITICAL]
+        others_full = self.workers > 1 and others_running >= self.workers - 1
+
+        for priority, queue in self._queues.items():
+            if priority != Priority.CRITICAL and others_full:
+                break
+            if queue and self._running[priority] < self.class_limits[priority]:
+                action = queue.popleft()
+                if action.key is not None:
+                    self._pending_by_key.pop(action.key, None)
+                return action
+        return None
+
+    async def _work(self) -> None:
+        while True:
+            action = self._next_action()
+            if action is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._running[action.priority] += 1
+            try:
+                await self._execute(action)
+            finally:
+                self._running[action.priority] -= 1
+                # Its class may have been at the limit with more actions waiting
+                self._wakeup.set()
+
+    async def _execute(self, action: _Action) -> None:
+        stats = self.stats_by_class[action.priority]
+        token = _current_priority.set(action.priority)
+        try:
+            result = await action.factory()
+        except Exception as e:
+            stats.failed += 1
+            log.warning(f"Outbound {Priority.NAMES[action.priority]} action failed: {e!r}")
+            for future in action.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            stats.completed += 1
+            for future in action.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            _current_priority.reset(token)
+
+            latency = time.monotonic() - action.submitted_at
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
@@ -0,0 +1,82 @@
+import logging
+from typing import Dict, List, Tuple
+
+from .sessions import VerificationSession
+from .sqlite_store import BatchedSQLiteStore, Operation
+
+log = logging.getLogger(__name__)
+
+
+class StoredSession:
+    """
+    A verification session as it was last written to the store.
+    """
+    def __init__(self, guild_id: int, member_id: int, channel_id: int, code: str, emoji: str, deadline: float,
+                 responses: int):
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.channel_id = channel_id
+        self.code = code
+        self.emoji = emoji
+        self.deadline = deadline
+        self.responses = responses
+
+
+class SessionStore(BatchedSQLiteStore):
+    """
+    Keeps pending verification sessions on disk so they survive a restart.
+    Only the latest state of each member's session is written (newer changes replace queued ones).
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS verification_sessions (
+            guild_id INTEGER NOT NULL,
+            member_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            code TEXT NOT NULL,
+            emoji TEXT NOT NULL,
+            deadline REAL NOT NULL,
+            responses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, member_id)
+        );
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        super().__init__(path, flush_interval)
+        # (guild ID, member ID) -> latest operation for that member
+        self._pending: Dict[Tuple[int, int], Operation] = {}
+
+    def save(self, session: VerificationSession) -> None:
+        self._pending[(session.guild_id, session.member_id)] = (
+            "INSERT OR REPLACE INTO verification_sessions "
+            "(guild_id, member_id, channel_id, code, emoji, deadline, responses) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session.guild_id, session.member_id, session.channel_id, session.code, session.emoji,
+             session.deadline, session.response_count)
+        )
+        self._schedule_flush()
+
+    def remove(self, session: VerificationSession) -> None:
+        self._delete(session.guild_id, session.member_id)
+        self._schedule_flush()
+
+    async def load(self) -> List[StoredSession]:
+        rows = await self.query("SELECT guild_id, member_id, channel_id, code, emoji, deadline, responses "
+                                "FROM verification_sessions")
+        return [StoredSession(*row) for row in rows]
+
+    async def discard(self, keys: List[Tuple[int, int]]) -> None:
+        """
+        Removes the sessions of the given (guild ID, member ID) pairs right away.
+        """
+        for guild_id, member_id in keys:
+            self._delete(guild_id, member_id)
+        await self.flush()
+
+    def _delete(self, guild_id: int, member_id: int) -> None:
+        self._pending[(guild_id, member_id)] = (
+            "DELETE FROM verification_sessions WHERE guild_id = ? AND member_id = ?", (guild_id, member_id)
+        )
+
+    def _take_pending(self) -> List[Operation]:
+        operations = list(self._pending.values())
+        self._pending.clear()
+        return operations
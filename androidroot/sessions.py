@@ -0,0 +1,201 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Optional, Dict, List, Tuple
+
+from discord import Message
+
+log = logging.getLogger(__name__)
+
+
+class VerificationSession:
+    """
+    A single pending verification: which member has to answer in which channel and what the expected answer is.
+    """
+    def __init__(self, guild_id: int, member_id: int, channel_id: int, code: str, emoji: str, deadline: float):
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.channel_id = channel_id
+        self.code = code
+        self.emoji = emoji
+        # Wall-clock (time.time()) deadline
+        self.deadline = deadline
+
+        self.responses: List[Message] = []
+        # Responses received before a restart (their messages are not kept)
+        self.previous_responses = 0
+        self.future: asyncio.Future = asyncio.get_event_loop().create_future()
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+    @property
+    def response_count(self) -> int:
+        return self.previous_responses + len(self.responses)
+
+    def is_correct(self, content: str) -> bool:
+        content = str(content).strip().lower()
+        # Should contain the code and the emoji
+        if self.code.lower() not in content:
+            return False
+        if self.emoji not in content:
+            return False
+
+        return True
+
+    def feed(self, message: Message) -> bool:
+        """
+        Records the response and resolves the session if it is correct.
+        :return: True if the message was the correct answer
+        """
+        if message.author.id != self.member_id:
+            return False
+
+        self.responses.append(message)
+
+        if not self.is_correct(message.content):
+            return False
+
+        if not self.done:
+            self.future.set_result(message)
+        return True
+
+
+class SessionManager:
+    """
+    Keeps all live verification sessions, routes incoming messages directly to the session
+    of the channel they were sent in and expires sessions using a single deadline heap.
+
+    If a store is set (see androidroot.session_store), every change to a session is also written to it.
+    """
+    def __init__(self):
+        self.store = None
+
+        self._by_channel: Dict[int, VerificationSession] = {}
+        # (guild ID, member ID) -> session, a member can verify in several guilds at once
+        self._by_member: Dict[Tuple[int, int], VerificationSession] = {}
+
+        self._deadlines: List[Tuple[float, int, VerificationSession]] = []
+        self._sequence = 0
+
+        self._timer_task: Optional[asyncio.Task] = None
+        self._timer_wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def active(self) -> int:
+        """
+        :return: Number of currently active sessions
+        """
+        return len(self._by_channel)
+
+    def __len__(self) -> int:
+        return self.active
+
+    def get_by_channel(self, channel_id: int) -> Optional[VerificationSession]:
+        return self._by_channel.get(channel_id)
+
+    def get_by_member(self, guild_id: int, member_id: int) -> Optional[VerificationSession]:
+        return self._by_member.get((guild_id, member_id))
+
+    def open(self, guild_id: int, member_id: int, channel_id: int, code: str, emoji: str,
+             timeout: float) -> VerificationSession:
+        """
+        Registers a new session and schedules its timeout.
+        """
+        return self.restore(guild_id, member_id, channel_id, code, emoji, time.time() + timeout)
+
+    def restore(self, guild_id: int, member_id: int, channel_id: int, code: str, emoji: str, deadline: float,
+                previous_responses: int = 0) -> VerificationSession:
+        """
+        Registers a session with an absolute (wall-clock) deadline, e.g. one loaded from the store after a restart.
+        """
+        session = VerificationSession(guild_id, member_id, channel_id, code, emoji, deadline)
+        session.previous_responses = previous_responses
+
+        self._by_channel[channel_id] = session
+        self._by_member[(guild_id, member_id)] = session
+        self._schedule(session)
+
+        if self.store is not None:
+            self.store.save(session)
+
+        return session
+
+    def close(self, session: VerificationSession) -> None:
+        """
+        Removes the session from the manager. Its heap entry is dropped lazily by the timer.
+        """
+        if self._by_channel.get(session.channel_id) is session:
+            del self._by_channel[session.channel_id]
+        key = (session.guild_id, session.member_id)
+        if self._by_member.get(key) is session:
+            del self._by_member[key]
+
+            # A cancelled future means the bot is shutting down, keep the session stored to resume it later
+            if self.store is not None and not (session.done and session.future.cancelled()):
+                self.store.remove(session)
+
+        if not session.done:
+            session.future.cancel()
+
+    async def wait(self, session: VerificationSession) -> Message:
+        """
+        Waits for the correct response.
+        :raises asyncio.TimeoutError: if the deadline passes first
+        """
+        try:
+            return await session.future
+        finally:
+            self.close(session)
+
+    def dispatch(self, message: Message) -> bool:
+        """
+        Routes a message to the session waiting in its channel (if any).
+        :return: True if the message resolved a session
+        """
+        session = self._by_channel.get(message.channel.id)
+        if session is None or session.done:
+            return False
+
+        resolved = session.feed(message)
+
+        if self.store is not None and message.author.id == session.member_id:
+            self.store.save(session)
+
+        return resolved
+
+    def _schedule(self, session: VerificationSession) -> None:
+        self._sequence += 1
+        heapq.heappush(self._deadlines, (session.deadline, self._sequence, session))
+
+        if self._timer_task is None or self._timer_task.done():
+            self._timer_wakeup = asyncio.Event()
+            self._timer_task = asyncio.ensure_future(self._run_timer())
+        elif self._deadlines[0][2] is session:
+            # New earliest deadline, make the timer recalculate its sleep
+            self._timer_wakeup.set()
+
+    async def _run_timer(self) -> None:
+        while self._deadlines:
+            deadline, _, session = self._deadlines[0]
+
+            if session.done:
+                heapq.heappop(self._deadlines)
+                continue
+
+            delay = deadline - time.time()
+            if delay <= 0:
+                heapq.heappop(self._deadlines)
+                session.future.set_exception(asyncio.TimeoutError())
+                continue
+
+            self._timer_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._timer_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+
+session_manager = SessionManager()
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Tuple, Any, Callable
+
+log = logging.getLogger(__name__)
+
+# (SQL statement, parameters)
+Operation = Tuple[str, tuple]
+
+
+class BatchedSQLiteStore:
+    """
+    Base for the local SQLite stores. The database runs in WAL mode and is only ever touched from
+    one background thread, writes are queued and committed together in a single transaction
+    every flush_interval seconds, so the event loop never waits on disk I/O.
+
+    Subclasses set SCHEMA and implement _take_pending.
+    """
+    SCHEMA = ""
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+        self._connection: Optional[sqlite3.Connection] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.batches_written = 0
+        self.operations_written = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._connection is not None
+
+    async def open(self) -> None:
+        await self._run(self._connect)
+        # Writes queued before the store was open
+        self._schedule_flush()
+
+    async def close(self) -> None:
+        if not self.is_open:
+            return
+
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
+
+        await self._run(self._disconnect)
+        self._executor.shutdown(wait=False)
+
+    async def flush(self) -> None:
+        # Before open or after close the operations stay queued
+        if not self.is_open:
+            return
+        operations = self._take_pending()
+        if not operations:
+            return
+
+        # Shielded, cancelling the flush (e.g. on close) must not drop operations that were already taken
+        await asyncio.shield(self._run(self._write, operations))
+
+    async def query(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        return await self._run(self._query, sql, parameters)
+
+    def _take_pending(self) -> List[Operation]:
+        """
+        :return: Queued operations to commit now (and forget them)
+        """
+        raise NotImplementedError
+
+    def _schedule_flush(self) -> None:
+        if not self.is_open:
+            return
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except sqlite3.Error as e:
+            log.error(f"Could not write to {self.path}: {e}")
+
+    async def _run(self, function: Callable, *args) -> Any:
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    # These run on the store thread
+    def _connect(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(self.SCHEMA)
+        connection.commit()
+
+        self._connection = connection
+
+    def _disconnect(self) -> None:
+        self._connection.close()
+        self._connection = None
+
+    def _write(self, operations: List[Operation]) -> None:
+        with self._connection:
+            for sql, parameters in operations:
+                self._connection.execute(sql, parameters)
+
+        self.batches_written += 1
+        self.operations_written += len(operations)
+
+    def _query(self, sql: str, parameters: tuple) -> List[tuple]:
+        return self._connection.execute(sql, parameters).fetchall()
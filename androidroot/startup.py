@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Awaitable, List, Tuple, Dict, Iterable, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StartupPipeline:
+    """
+    Runs the startup work as a list of named stages, one after another, and logs how long each took.
+    The bot only counts as ready once every stage has finished.
+    """
+    def __init__(self):
+        self.stages: List[Tuple[str, Callable[[], Awaitable[None]]]] = []
+        self.timings: Dict[str, float] = {}
+        self.ready = False
+
+        self._lock = asyncio.Lock()
+
+    def stage(self, name: str):
+        """
+        Decorator that appends the coroutine function as the next stage.
+        """
+        def decorator(function: Callable[[], Awaitable[None]]):
+            self.stages.append((name, function))
+            return function
+
+        return decorator
+
+    async def run(self) -> None:
+        # on_ready can fire again after a reconnect while the previous run is still going
+        async with self._lock:
+            self.ready = False
+            started = time.monotonic()
+
+            for name, function in self.stages:
+                stage_started = time.monotonic()
+                await function()
+                self.timings[name] = time.monotonic() - stage_started
+
+                log.info(f"Startup stage '{name}' finished in {self.timings[name]:.3f}s")
+
+            self.ready = True
+            log.info(f"Startup finished in {time.monotonic() - started:.3f}s")
+
+
+async def gather_bounded(limit: int, items: Iterable[T], function: Callable[[T], Awaitable[None]]) -> None:
+    """
+    Runs function for every item, at most limit at a time.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item: T):
+        async with semaphore:
+            await function(item)
+
+    await asyncio.gather(*[run(item) for item in items])
@@ -1,5 +1,8 @@
+import asyncio
 import logging
-from typing import Optional
+import os
+from string import Formatter
+from typing import Optional, Dict, List, Any
 
 log = logging.getLogger(__name__)
 
@@ -10,31 +13,7 @@ except ImportError:
     log.warning("'commentjson' not found, falling back to built-in 'json'. "
                 "Be warned, comments in .json files will cause errors.")
 
-with open("./data/strings.json", "r") as strings_:
-    STRINGS = loads(strings_.read())
-
-REQUIRED_STRING_LIST = [
-    "BOT_ABOUT",
-    "ON_MEMBER_JOIN",
-    "ON_VERIFICATION_BEGIN",
-    "VERIFICATION_HOW",
-    "VERIFY_RANDOM_EMOJI_LIST",
-    "VERIFY_FAILED_TIMEOUT",
-    "VERIFY_SUCCESS",
-    "VERIFYALL_CONFIRMATION",
-    "VERIFYALL_TIMEOUT",
-    "VERIFYALL_STARTING",
-    "VERIFYALL_PROGRESS",
-    "VERIFYALL_DONE",
-    "CMD_NOT_ALLOWED_FOR_USER",
-    "MANUAL_VERIFICATION",
-    "MANUAL_VERIFICATION_NO_NEED",
-]
-
-# Make sure all required strings are present
-for s in REQUIRED_STRING_LIST:
-    if STRINGS.get(s) is None:
-        raise Exception(f"String {s} is required, but missing!")
+STRINGS_FILE = "./data/strings.json"
 
 
 class String:
@@ -45,7 +24,10 @@ class String:
     ON_MEMBER_JOIN = "ON_MEMBER_JOIN"
     ON_VERIFICATION_BEGIN = "ON_VERIFICATION_BEGIN"
     VERIFICATION_HOW = "VERIFICATION_HOW"
+    VERIFICATION_HOW_IMAGE = "VERIFICATION_HOW_IMAGE"
     VERIFY_RANDOM_EMOJI_LIST = "VERIFY_RANDOM_EMOJI_LIST"
+    VERIFICATION_QUEUED = "VERIFICATION_QUEUED"
+    VERIFICATION_LOCKED = "VERIFICATION_LOCKED"
     VERIFY_FAILED_TIMEOUT = "VERIFY_FAILED_TIMEOUT"
     VERIFY_SUCCESS = "VERIFY_SUCCESS"
     VERIFYALL_CONFIRMATION = "VERIFYALL_CONFIRMATION"
@@ -53,10 +35,220 @@ class String:
     VERIFYALL_STARTING = "VERIFYALL_STARTING"
     VERIFYALL_PROGRESS = "VERIFYALL_PROGRESS"
     VERIFYALL_DONE = "VERIFYALL_DONE"
+    UNVERIFYALL_CONFIRMATION = "UNVERIFYALL_CONFIRMATION"
+    UNVERIFYALL_STARTING = "UNVERIFYALL_STARTING"
+    UNVERIFYALL_DONE = "UNVERIFYALL_DONE"
+    BULK_ROLE_RESUMING = "BULK_ROLE_RESUMING"
+    BULK_ROLE_DRY_RUN = "BULK_ROLE_DRY_RUN"
+    BULK_ROLE_ALREADY_RUNNING = "BULK_ROLE_ALREADY_RUNNING"
+    VERIFYSTATS = "VERIFYSTATS"
+    VERIFYLOG_MEMBER = "VERIFYLOG_MEMBER"
+    VERIFYLOG_SINCE = "VERIFYLOG_SINCE"
+    VERIFYLOG_EMPTY = "VERIFYLOG_EMPTY"
+    VERIFYLOG_USAGE = "VERIFYLOG_USAGE"
+    VERIFYLOG_DISABLED = "VERIFYLOG_DISABLED"
+    DIAG_LAG = "DIAG_LAG"
+    DIAG_STALL = "DIAG_STALL"
+    DIAG_NO_STALLS = "DIAG_NO_STALLS"
+    DIAG_PROFILE_STARTED = "DIAG_PROFILE_STARTED"
+    DIAG_PROFILE_RUNNING = "DIAG_PROFILE_RUNNING"
+    DIAG_PROFILE_DONE = "DIAG_PROFILE_DONE"
+    DIAG_MEMORY_STARTED = "DIAG_MEMORY_STARTED"
+    DIAG_MEMORY_DIFF = "DIAG_MEMORY_DIFF"
+    DIAG_MEMORY_STOPPED = "DIAG_MEMORY_STOPPED"
     CMD_NOT_ALLOWED_FOR_USER = "CMD_NOT_ALLOWED_FOR_USER"
+    GUILD_NOT_CONFIGURED = "GUILD_NOT_CONFIGURED"
     MANUAL_VERIFICATION = "MANUAL_VERIFICATION"
     MANUAL_VERIFICATION_NO_NEED = "MANUAL_VERIFICATION_NO_NEED"
+    MANUAL_VERIFICATION_PENDING = "MANUAL_VERIFICATION_PENDING"
 
 
-def gets(string_name: str) -> Optional[str]:
-    return STRINGS.get(string_name)
+_BULK_ROLE_DONE = {"verified_role_name": str, "total_done": int, "total_skipped": int, "total_errored": int}
+
+# Every required string with the placeholders it may use and the type of the values they are formatted with
+# (None for VERIFY_RANDOM_EMOJI_LIST, which is a list of [":name:", "emoji"] pairs instead of a template).
+# New strings go here and in String.
+STRING_SCHEMA: Dict[str, Optional[Dict[str, type]]] = {
+    String.BOT_ABOUT: {"bot_mention": str, "bot_version": str},
+    String.ON_MEMBER_JOIN: {"user_mention": str, "channel_mention": str},
+    String.ON_VERIFICATION_BEGIN: {"user_mention": str},
+    String.VERIFICATION_HOW: {"code": str, "random_emoji": str},
+    String.VERIFICATION_HOW_IMAGE: {"random_emoji": str},
+    String.VERIFY_RANDOM_EMOJI_LIST: None,
+    String.VERIFICATION_QUEUED: {"user_mention": str, "position": int},
+    String.VERIFICATION_LOCKED: {"user_mention": str, "seconds": int},
+    String.VERIFY_FAILED_TIMEOUT: {},
+    String.VERIFY_SUCCESS: {"user_mention": str},
+    String.VERIFYALL_CONFIRMATION: {"verified_role_name": str, "emoji": str},
+    String.VERIFYALL_TIMEOUT: {},
+    String.VERIFYALL_STARTING: {},
+    String.VERIFYALL_PROGRESS: {"current": int, "total": int},
+    String.VERIFYALL_DONE: _BULK_ROLE_DONE,
+    String.UNVERIFYALL_CONFIRMATION: {"verified_role_name": str, "emoji": str},
+    String.UNVERIFYALL_STARTING: {},
+    String.UNVERIFYALL_DONE: _BULK_ROLE_DONE,
+    String.BULK_ROLE_RESUMING: {"current": int},
+    String.BULK_ROLE_DRY_RUN: {"total_changed": int, "total_skipped": int, "total": int},
+    String.BULK_ROLE_ALREADY_RUNNING: {},
+    String.VERIFYSTATS: {"verified": int, "unverified": int, "percentage": float,
+                         "growth_day": int, "growth_week": int},
+    String.VERIFYLOG_MEMBER: {"user_mention": str, "count": int, "entries": str},
+    String.VERIFYLOG_SINCE: {"since": str, "verified": int, "timeout": int, "error": int, "count": int,
+                             "entries": str},
+    String.VERIFYLOG_EMPTY: {},
+    String.VERIFYLOG_USAGE: {},
+    String.VERIFYLOG_DISABLED: {},
+    String.DIAG_LAG: {"samples": int, "p50": float, "p95": float, "max": float, "max_since_start": float,
+                      "stalls": int, "threshold": float},
+    String.DIAG_STALL: {"duration": float, "stack": str},
+    String.DIAG_NO_STALLS: {},
+    String.DIAG_PROFILE_STARTED: {"seconds": float},
+    String.DIAG_PROFILE_RUNNING: {},
+    String.DIAG_PROFILE_DONE: {"path": str, "summary": str},
+    String.DIAG_MEMORY_STARTED: {},
+    String.DIAG_MEMORY_DIFF: {"current": float, "peak": float, "top": str},
+    String.DIAG_MEMORY_STOPPED: {},
+    String.CMD_NOT_ALLOWED_FOR_USER: {},
+    String.GUILD_NOT_CONFIGURED: {},
+    String.MANUAL_VERIFICATION: {"user_mention": str},
+    String.MANUAL_VERIFICATION_NO_NEED: {"user_mention": str},
+    String.MANUAL_VERIFICATION_PENDING: {"user_mention": str},
+}
+
+
+class Template(str):
+    """
+    A string from strings.json that was checked against its schema when it was loaded. Strings without
+    placeholders are unescaped ({{ -> {) right away and format() returns them without parsing them again.
+    """
+    placeholders = frozenset()
+
+    def format(self, *args, **kwargs) -> str:
+        if not self.placeholders:
+            return str(self)
+        return str.format(self, *args, **kwargs)
+
+
+def compile_template(name: str, text: Any, schema: Dict[str, type]) -> Template:
+    """
+    :raises ValueError: if the template uses a placeholder the schema doesn't have or can't be formatted
+    """
+    if not isinstance(text, str):
+        raise ValueError(f"{name} has to be a string")
+
+    try:
+        fields = [(field, spec) for _, field, spec, _ in Formatter().parse(text) if field is not None]
+    except ValueError as e:
+        raise ValueError(f"{name} is not a valid template: {e}")
+
+    for field, spec in fields:
+        if field not in schema:
+            allowed = ", ".join(f"{{{placeholder}}}" for placeholder in schema) or "none"
+            raise ValueError(f"{name} uses the unknown placeholder {{{field}}} (allowed: {allowed})")
+        if "{" in spec:
+            raise ValueError(f"{name} has a placeholder in the format of {{{field}}}")
+
+    # Catches formats that don't fit the value (e.g. {current:.1f} on a string) now instead of during a verification
+    try:
+        text.format(**{placeholder: kind() for placeholder, kind in schema.items()})
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"{name} can't be formatted: {e}")
+
+    template = Template(text.format() if not fields else text)
+    template.placeholders = frozenset(field for field, _ in fields)
+    return template
+
+
+def compile_emoji_list(name: str, value: Any) -> List[tuple]:
+    if not isinstance(value, list) or not value:
+        raise ValueError(f"{name} has to be a list of [\":name:\", \"emoji\"] pairs")
+
+    for pair in value:
+        if not isinstance(pair, list) or len(pair) != 2 or not all(isinstance(part, str) for part in pair):
+            raise ValueError(f"{name} contains {pair!r}, which is not a [\":name:\", \"emoji\"] pair")
+
+    return [tuple(pair) for pair in value]
+
+
+def load_strings(path: str) -> Dict[str, Any]:
+    """
+    Reads and compiles all strings.
+    :raises Exception: listing every missing or invalid string
+    """
+    with open(path, "r", encoding="utf-8") as strings_file:
+        raw = loads(strings_file.read())
+
+    strings = {}
+    problems = []
+    for name, schema in STRING_SCHEMA.items():
+        value = raw.get(name)
+        if value is None:
+            problems.append(f"String {name} is required, but missing!")
+            continue
+
+        try:
+            strings[name] = compile_emoji_list(name, value) if schema is None \
+                else compile_template(name, value, schema)
+        except ValueError as e:
+            problems.append(str(e))
+
+    if problems:
+        raise Exception(f"Invalid strings in {path}:\n" + "\n".join(problems))
+
+    return strings
+
+
+class StringRegistry:
+    """
+    The compiled strings. A reload reads and checks the whole file before swapping it in at once,
+    if anything is wrong with it the current strings stay in use.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._strings: Dict[str, Any] = load_strings(path)
+        self._modified = os.stat(path).st_mtime_ns
+
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    def get(self, name: str) -> Any:
+        return self._strings.get(name)
+
+    def reload(self) -> bool:
+        """
+        :return: True if the new strings are in use
+        """
+        try:
+            self._modified = os.stat(self.path).st_mtime_ns
+            strings = load_strings(self.path)
+        except Exception as e:
+            self.failed_reloads += 1
+            log.error(f"Keeping the current strings, could not reload them: {e}")
+            return False
+
+        self._strings = strings
+        self.reloads += 1
+        log.info(f"Reloaded {len(strings)} strings from {self.path}")
+        return True
+
+    async def watch(self, interval: float) -> None:
+        """
+        Reloads the strings when the file changes, checking every interval seconds.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                modified = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                log.warning(f"Could not check {self.path} for changes: {e}")
+                continue
+
+            if modified != self._modified:
+                self.reload()
+
+
+string_registry = StringRegistry(STRINGS_FILE)
+
+
+def gets(string_name: str) -> Optional[Any]:
+    return string_registry.get(string_name)
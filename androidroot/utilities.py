@@ -1,6 +1,8 @@
+import re
 import uuid
 import random
 import string
+from typing import Optional
 
 
 # Singleton can only be instantiated once, subsequent instances are the same
@@ -23,5 +25,30 @@ def generate_id(length: int = 4):
 CODE_CHARS = string.ascii_uppercase + string.digits
 
 
-def generate_code(length: int = 4):
-    return "".join([random.choice(CODE_CHARS) for _ in range(length)])
\ No newline at end of file
+def generate_code(length: int = 4, chars: str = CODE_CHARS):
+    return "".join([random.choice(chars) for _ in range(length)])
+
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_duration(text: str) -> Optional[float]:
+    """
+    :return: Seconds of a duration like "90s", "30m", "12h", "7d" or "2w" (a plain number is hours), None if invalid
+    """
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw]?)", text.strip().lower())
+    if match is None:
+        return None
+
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2) or "h"]
+
+
+def parse_user_id(text: str) -> Optional[int]:
+    """
+    :return: User ID from a mention (<@123>, <@!123>) or a plain ID, None if it's neither
+    """
+    match = re.fullmatch(r"<@!?(\d+)>|(\d+)", text.strip())
+    if match is None:
+        return None
+
+    return int(match.group(1) or match.group(2))
@@ -0,0 +1,152 @@
+"""
+Benchmark of the image challenge (androidroot/captcha.py): how fast captcha images are rendered and whether the
+pre-rendered pool keeps up with a raid.
+
+Reports the render time of one image, images per second with one process and with --processes processes (and per
+process, to see how well it scales across cores), then takes images from a CaptchaPool at the given join rate and
+counts how often the pool ran empty.
+
+Usage (from the repository root, needs Pillow):
+    python benchmarks/bench_captcha.py --images 500
+    python benchmarks/bench_captcha.py --images 500 --output before.json
+    python benchmarks/bench_captcha.py --images 500 --compare before.json
+
+With --compare, the exit code is 1 if any metric got worse than the baseline by more than --tolerance percent.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+from fake_discord import percentile
+from harness import compare
+
+from androidroot.captcha import CaptchaPool, CAPTCHA_CHARS, render_captcha, is_available
+from androidroot.utilities import generate_code
+
+# metric -> True if higher is better
+COMPARED_METRICS = {
+    "render_ms": False,
+    "images_per_second_single": True,
+    "images_per_second": True,
+    "images_per_second_per_process": True,
+    "raid_pool_empty": False,
+    "raid_take_p99_ms": False,
+}
+
+
+def render_throughput(images: int, processes: int, font: str) -> float:
+    """
+    :return: Images rendered per second by that many processes
+    """
+    codes = [generate_code(4, CAPTCHA_CHARS) for _ in range(images)]
+    seeds = [random.getrandbits(32) for _ in range(images)]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # Start the processes before timing
+        list(executor.map(render_captcha, codes[:processes], seeds[:processes], [font] * processes))
+
+        started = time.perf_counter()
+        list(executor.map(render_captcha, codes, seeds, [font] * images, chunksize=max(images // processes // 4, 1)))
+        return images / (time.perf_counter() - started)
+
+
+async def run_raid(args: argparse.Namespace) -> Dict[str, float]:
+    """
+    Takes one image per join from a full pool, like begin_verification does.
+    """
+    pool = CaptchaPool(args.pool_size, args.pool_low_water, processes=args.processes, font_path=args.font)
+    await pool.start()
+    while pool.available < pool.size:
+        await asyncio.sleep(0.05)
+
+    interval = 60 / args.rate
+    take_times = []
+    started = time.monotonic()
+    for index in range(args.members):
+        await asyncio.sleep(max(started + index * interval - time.monotonic(), 0))
+
+        taken = time.perf_counter()
+        await pool.take()
+        take_times.append(time.perf_counter() - taken)
+
+    await pool.close()
+    return {
+        "raid_pool_empty": pool.empty,
+        "raid_take_p50_ms": percentile(take_times, 0.50) * 1000,
+        "raid_take_p99_ms": percentile(take_times, 0.99) * 1000,
+    }
+
+
+def print_results(results: Dict) -> None:
+    print(f"Rendered {results['images']} images")
+    print(f"  one image           {results['render_ms']:.1f}ms")
+    print(f"  1 process           {results['images_per_second_single']:.0f} images/s")
+    print(f"  {results['processes']} processes{' ' * (9 - len(str(results['processes'])))}"
+          f"{results['images_per_second']:.0f} images/s ({results['images_per_second_per_process']:.0f} per process)")
+    print(f"Raid of {results['members']} joins: pool ran empty {results['raid_pool_empty']} times, "
+          f"take p50 {results['raid_take_p50_ms']:.2f}ms p99 {results['raid_take_p99_ms']:.2f}ms")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Render throughput of the captcha images and the pre-rendered pool")
+    parser.add_argument("--images", type=int, default=300, help="Images to render per measurement")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Render processes")
+    parser.add_argument("--font", help="TrueType font to render with (Pillow's built-in one if not set)")
+    parser.add_argument("--members", type=int, default=500, help="Joins in the raid")
+    parser.add_argument("--rate", type=float, default=3000, help="Joins per minute in the raid")
+    parser.add_argument("--pool-size", type=int, default=100, help="[Captcha] pool_size")
+    parser.add_argument("--pool-low-water", type=int, default=50, help="[Captcha] pool_low_water")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Compare against results saved with --output earlier")
+    parser.add_argument("--tolerance", type=float, default=10, help="Allowed regression in percent")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_arguments()
+    if not is_available():
+        print("Pillow is not installed")
+        return 2
+
+    started = time.perf_counter()
+    for seed in range(20):
+        render_captcha("AB3K", seed, args.font)
+    results = {
+        "images": args.images,
+        "processes": args.processes,
+        "members": args.members,
+        "render_ms": (time.perf_counter() - started) / 20 * 1000,
+        "images_per_second_single": render_throughput(args.images, 1, args.font),
+        "images_per_second": render_throughput(args.images, args.processes, args.font),
+    }
+    results["images_per_second_per_process"] = results["images_per_second"] / args.processes
+    results.update(asyncio.get_event_loop().run_until_complete(run_raid(args)))
+    results["parameters"] = vars(args)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+
+        print(f"Compared to {args.compare}:")
+        regressions = compare(results, baseline, COMPARED_METRICS, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Load test for the verification flow, run against the offline Discord stand-in in fake_discord.py.
+
+Drives synthetic members through reaction -> verification channel -> reply -> role grant at a given join rate
+(and optionally a !verifyall over a batch of unverified members), then reports end-to-end latency percentiles,
+throughput, API calls per verification, rate limit hits and peak memory.
+
+--mode dm runs the challenges in DMs instead of channels (--closed-dms sets the share of members who don't accept
+DMs and get a channel anyway), so both modes can be compared with --output/--compare.
+
+Usage (from the repository root):
+    python benchmarks/bench_verification.py --members 500 --rate 1000
+    python benchmarks/bench_verification.py --members 500 --rate 1000 --output before.json
+    python benchmarks/bench_verification.py --members 500 --rate 1000 --compare before.json
+
+With --compare, the exit code is 1 if any metric got worse than the baseline by more than --tolerance percent.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from typing import Optional, Dict
+
+from fake_discord import FakeMember, FakeMessage, FakeReactionPayload, percentile
+from harness import Environment, FakeContext, TRIGGER_EMOJI, add_common_arguments, run
+
+# metric -> True if higher is better
+COMPARED_METRICS = {
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "throughput": True,
+    "api_calls_per_verification": False,
+    "rate_limited": False,
+    "bulk_duration": False,
+}
+
+
+async def verify_member(environment: Environment, member: FakeMember, args: argparse.Namespace,
+                        rng: random.Random) -> Optional[float]:
+    """
+    Reacts, waits for the verification channel, answers and waits for the role.
+    :return: Seconds from the reaction to the role grant or None if it didn't happen in time
+    """
+    bot_module = environment.bot
+    started = time.monotonic()
+    deadline = started + args.timeout
+
+    trigger_message = environment.trigger_message
+    trigger_message._reaction(TRIGGER_EMOJI).user_ids.append(member.id)
+    await bot_module.on_raw_reaction_add(FakeReactionPayload(member, trigger_message, TRIGGER_EMOJI))
+
+    session = None
+    while session is None:
+        if time.monotonic() > deadline:
+            return None
+        await asyncio.sleep(0.01)
+        session = bot_module.session_manager.get_by_member(member.guild.id, member.id)
+
+    # A verification channel or, in DM mode, the member's DMs
+    channel = environment.guild.get_channel(session.channel_id) or member.dm_channel
+    await asyncio.sleep(max(rng.gauss(args.reply_delay, args.reply_delay / 4), 0))
+
+    if rng.random() < args.wrong_answers:
+        await bot_module.on_message(FakeMessage(channel, member, "i don't get it"))
+        await asyncio.sleep(args.reply_delay / 2)
+
+    await bot_module.on_message(FakeMessage(channel, member, f"{session.code} {session.emoji}"))
+
+    try:
+        await asyncio.wait_for(member.role_added.wait(), timeout=max(deadline - time.monotonic(), 0))
+    except asyncio.TimeoutError:
+        return None
+
+    return time.monotonic() - started
+
+
+async def run_raid(environment: Environment, args: argparse.Namespace) -> Dict[str, float]:
+    api = environment.api
+    rng = random.Random(args.seed)
+    members = environment.guild.add_members(args.members)
+    # Separate generator, so the answers are the same as in channel mode
+    dm_rng = random.Random(args.seed)
+    for member in members:
+        member.dms_closed = dm_rng.random() < args.closed_dms
+    interval = 60 / args.rate
+
+    calls_before = api.calls
+    rate_limited_before = api.rate_limited
+    started = time.monotonic()
+
+    tasks = []
+    for member in members:
+        tasks.append(asyncio.ensure_future(verify_member(environment, member, args, rng)))
+        await asyncio.sleep(interval)
+
+    latencies = [latency for latency in await asyncio.gather(*tasks) if latency is not None]
+    duration = time.monotonic() - started
+    await environment.wait_until_idle()
+
+    calls = api.calls - calls_before
+    return {
+        "members": len(members),
+        "verified": len(latencies),
+        "failed": len(members) - len(latencies),
+        "duration": duration,
+        "throughput": len(latencies) / duration * 60 if duration else 0.0,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": max(latencies, default=0.0),
+        "api_calls": calls,
+        "api_calls_per_verification": calls / len(latencies) if latencies else 0.0,
+        "rate_limited": api.rate_limited - rate_limited_before,
+        "peak_queue_depth": environment.bot.admission.peak_depth,
+        "mode": args.mode,
+        "dm_fallbacks": environment.bot.metric_dm_fallbacks.get(),
+    }
+
+
+async def run_bulk(environment: Environment, args: argparse.Namespace) -> Dict[str, float]:
+    bot_module = environment.bot
+    guild = environment.guild
+    guild.add_members(args.bulk_members)
+
+    async def confirmed(_ctx, _confirmation: str) -> bool:
+        return True
+
+    bot_module.wait_for_owner_confirmation = confirmed
+    ctx = FakeContext(guild, environment.commands_channel, guild.owner, "verifyall")
+
+    calls_before = environment.api.calls
+    started = time.monotonic()
+    await bot_module.run_bulk_role_command(ctx, "add", None)
+
+    return {
+        "bulk_members": args.bulk_members,
+        "bulk_duration": time.monotonic() - started,
+        "bulk_api_calls": environment.api.calls - calls_before,
+    }
+
+
+def print_results(results: Dict) -> None:
+    print(f"Verified {results['verified']}/{results['members']} members in {results['duration']:.1f}s "
+          f"({results['throughput']:.1f}/min, {results['failed']} failed, {results['mode']} mode)")
+    print(f"  end-to-end latency  p50 {results['latency_p50']:.2f}s  p95 {results['latency_p95']:.2f}s  "
+          f"p99 {results['latency_p99']:.2f}s  max {results['latency_max']:.2f}s")
+    print(f"  API calls           {results['api_calls']} ({results['api_calls_per_verification']:.1f} per verification),"
+          f" {results['rate_limited']} rate limited")
+    print(f"  peak queue depth    {results['peak_queue_depth']}")
+    if results["mode"] == "dm":
+        print(f"  DMs closed          {results['dm_fallbacks']} verified in a channel instead")
+    if "bulk_duration" in results:
+        print(f"  !verifyall          {results['bulk_members']} members in {results['bulk_duration']:.1f}s "
+              f"({results['bulk_api_calls']} API calls)")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test for the verification flow against a fake Discord")
+    parser.add_argument("--members", type=int, default=200, help="Members to verify")
+    parser.add_argument("--rate", type=float, default=1000, help="Joins (reactions) per minute")
+    parser.add_argument("--bulk-members", type=int, default=0,
+                        help="Run !verifyall over this many extra unverified members after the raid")
+    parser.add_argument("--reply-delay", type=float, default=3.0, help="Mean time members take to answer")
+    parser.add_argument("--wrong-answers", type=float, default=0.1, help="Share of members answering wrong first")
+    parser.add_argument("--closed-dms", type=float, default=0.1,
+                        help="Share of members who don't accept DMs (only matters with --mode dm)")
+    parser.add_argument("--timeout", type=float, default=300, help="Give up on a member after this many seconds")
+    add_common_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_arguments()
+
+    async def benchmark(environment: Environment) -> Dict:
+        await environment.start_bot(fill_pool=args.pool_size > 0)
+
+        results = await run_raid(environment, args)
+        if args.bulk_members:
+            results.update(await run_bulk(environment, args))
+        results.update(environment.bot_stats())
+
+        await environment.stop_bot()
+        return results
+
+    return run(args, benchmark, print_results, COMPARED_METRICS)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,466 @@
+"""
+Offline stand-in for the parts of discord.py the bot uses (Guild, TextChannel, CategoryChannel, Member,
+Role, Message), so the verification flow can be driven without a connection to Discord.
+
+Every API call goes through FakeAPI, which adds latency and enforces per-route rate limit buckets
+the way Discord does (one bucket per route and major parameter). Hitting a bucket sleeps until it resets
+and is logged through the "discord.http" logger exactly like discord.py does, so the bot's own
+rate limit accounting sees it too.
+"""
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Optional, Dict, List, Tuple, Iterable
+
+from discord.errors import Forbidden
+
+http_log = logging.getLogger("discord.http")
+
+_snowflakes = itertools.count(100000000000000000)
+
+
+def next_id() -> int:
+    return next(_snowflakes)
+
+
+class Bucket:
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+
+class FakeAPI:
+    """
+    Latency and rate limit model for the fake REST calls.
+    :param latency: Mean latency of a call in seconds
+    :param jitter: Latency is uniformly distributed in latency +- jitter
+    :param limits: Route -> (requests, per seconds), routes not listed use default_limit
+    """
+    DEFAULT_LIMITS = {
+        "POST /guilds/{guild_id}/channels": (5, 5.0),
+        "DELETE /channels/{channel_id}": (5, 5.0),
+        "POST /channels/{channel_id}/messages": (5, 5.0),
+        "PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}": (10, 10.0),
+        "DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}": (10, 10.0),
+        "PUT /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me": (1, 0.25),
+        "DELETE /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/{member_id}": (1, 0.25),
+        "POST /users/@me/channels": (5, 5.0),
+    }
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02,
+                 limits: Optional[Dict[str, Tuple[int, float]]] = None, default_limit: Tuple[int, float] = (5, 5.0),
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.limits = dict(self.DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.default_limit = default_limit
+
+        self._random = random.Random(seed)
+        self._buckets: Dict[Tuple[str, int], Bucket] = {}
+
+        self.calls = 0
+        self.calls_by_route: Dict[str, int] = defaultdict(int)
+        self.rate_limited = 0
+
+    async def call(self, route: str, major: int = 0) -> None:
+        """
+        Simulates one REST call: waits for the rate limit bucket, then for the latency.
+        """
+        bucket = self._bucket(route, major)
+
+        while True:
+            now = time.monotonic()
+            if now >= bucket.reset_at:
+                bucket.remaining = bucket.limit
+                bucket.reset_at = now + bucket.per
+
+            if bucket.remaining > 0:
+                bucket.remaining -= 1
+                break
+
+            # This is what a 429 looks like from the outside
+            retry_after = bucket.reset_at - now
+            self.rate_limited += 1
+            http_log.warning('We are being rate limited. Retrying in %.2f seconds. Handled under the bucket "%s"',
+                             retry_after, f"{route}:{major}")
+            await asyncio.sleep(retry_after)
+
+        self.calls += 1
+        self.calls_by_route[route] += 1
+
+        await asyncio.sleep(max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0))
+
+    def _bucket(self, route: str, major: int) -> Bucket:
+        key = (route, major)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = Bucket(*self.limits.get(route, self.default_limit))
+            self._buckets[key] = bucket
+        return bucket
+
+
+class FakeHTTP:
+    """
+    Stand-in for discord.http.HTTPClient (only the raw request the log sink uses).
+    """
+    def __init__(self, api: FakeAPI):
+        self.api = api
+
+    async def request(self, route, **kwargs):
+        await self.api.call(f"{route.method} {route.path}", route.channel_id or route.guild_id or 0)
+        return {}
+
+
+class FakeRole:
+    def __init__(self, guild: "FakeGuild", name: str, role_id: Optional[int] = None):
+        self.id = role_id or next_id()
+        self.name = name
+        self.guild = guild
+        self.mention = f"<@&{self.id}>"
+
+    @property
+    def members(self) -> List["FakeMember"]:
+        return [m for m in self.guild.members if self in m.roles]
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeUser:
+    def __init__(self, name: str, user_id: Optional[int] = None, bot: bool = False):
+        self.id = user_id or next_id()
+        self.name = name
+        self.discriminator = f"{self.id % 10000:04d}"
+        self.mention = f"<@{self.id}>"
+        self.bot = bot
+        self.avatar_url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeResponse:
+    """
+    What discord.errors.HTTPException reads from the aiohttp response.
+    """
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+
+
+class FakeDMChannel:
+    def __init__(self, api: FakeAPI, recipient: "FakeMember"):
+        self.id = next_id()
+        self.api = api
+        self.recipient = recipient
+        self.me = recipient.guild.me
+        self.messages: List["FakeMessage"] = []
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> "FakeMessage":
+        await self.api.call("POST /channels/{channel_id}/messages", self.id)
+        if self.recipient.dms_closed:
+            raise Forbidden(FakeResponse(403, "Forbidden"),
+                            {"code": 50007, "message": "Cannot send messages to this user"})
+
+        message = FakeMessage(self, self.recipient.guild.me, content or "", **kwargs)
+        self.messages.append(message)
+        return message
+
+
+class FakeMember(FakeUser):
+    def __init__(self, guild: "FakeGuild", name: str, user_id: Optional[int] = None, bot: bool = False):
+        super().__init__(name, user_id, bot)
+        self.guild = guild
+        self.roles: List[FakeRole] = [guild.default_role] if guild.default_role is not None else []
+
+        self.dm_channel: Optional[FakeDMChannel] = None
+        # Doesn't accept DMs from the bot (sending one fails with 403 like on Discord)
+        self.dms_closed = False
+        # Set when the member gets a role (used by the benchmark to time verifications)
+        self.role_added = asyncio.Event()
+        self.dms: List[str] = []
+
+    async def create_dm(self) -> FakeDMChannel:
+        if self.dm_channel is None:
+            await self.guild.api.call("POST /users/@me/channels")
+            self.dm_channel = FakeDMChannel(self.guild.api, self)
+        return self.dm_channel
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> "FakeMessage":
+        channel = await self.create_dm()
+        self.dms.append(content or "")
+        return await channel.send(content, **kwargs)
+
+    async def add_roles(self, *roles: FakeRole, reason: Optional[str] = None, atomic: bool = True) -> None:
+        for role in roles:
+            await self.guild.api.call("PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.guild.id)
+            if role not in self.roles:
+                self.roles.append(role)
+        self.role_added.set()
+
+    async def remove_roles(self, *roles: FakeRole, reason: Optional[str] = None, atomic: bool = True) -> None:
+        for role in roles:
+            await self.guild.api.call("DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}", self.guild.id)
+            if role in self.roles:
+                self.roles.remove(role)
+
+
+class FakeReaction:
+    def __init__(self, message: "FakeMessage", emoji: str):
+        self.message = message
+        self.emoji = emoji
+        self.user_ids: List[int] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.user_ids)
+
+    async def users(self, limit: Optional[int] = None):
+        guild = self.message.channel.guild
+        for page_start in range(0, len(self.user_ids), 100):
+            await guild.api.call("GET /channels/{channel_id}/messages/{message_id}/reactions/{emoji}",
+                                 self.message.channel.id)
+            for user_id in self.user_ids[page_start:page_start + 100]:
+                member = guild.get_member(user_id)
+                if member is not None:
+                    yield member
+
+
+class FakeMessage:
+    def __init__(self, channel, author: FakeUser, content: str, message_id: Optional[int] = None, **kwargs):
+        self.id = message_id or next_id()
+        self.channel = channel
+        self.guild = getattr(channel, "guild", None)
+        self.author = author
+        self.content = content
+        self.embed = kwargs.get("embed")
+        self.file = kwargs.get("file")
+        self.reactions: List[FakeReaction] = []
+
+    @property
+    def clean_content(self) -> str:
+        return self.content
+
+    def _reaction(self, emoji: str) -> FakeReaction:
+        for reaction in self.reactions:
+            if reaction.emoji == emoji:
+                return reaction
+        reaction = FakeReaction(self, emoji)
+        self.reactions.append(reaction)
+        return reaction
+
+    async def add_reaction(self, emoji: str) -> None:
+        await self.channel.api.call("PUT /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me",
+                                    self.channel.id)
+        reaction = self._reaction(str(emoji))
+        me = self.guild.me if self.guild is not None else self.channel.me
+        if me.id not in reaction.user_ids:
+            reaction.user_ids.append(me.id)
+
+    async def remove_reaction(self, emoji: str, member: FakeUser) -> None:
+        await self.channel.api.call(
+            "DELETE /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/{member_id}", self.channel.id
+        )
+        reaction = self._reaction(str(emoji))
+        if member.id in reaction.user_ids:
+            reaction.user_ids.remove(member.id)
+
+    async def edit(self, content: Optional[str] = None, **kwargs) -> None:
+        await self.channel.api.call("PATCH /channels/{channel_id}/messages/{message_id}", self.channel.id)
+        if content is not None:
+            self.content = content
+
+
+class FakeTextChannel:
+    def __init__(self, guild: "FakeGuild", name: str, category: Optional["FakeCategory"] = None,
+                 overwrites: Optional[dict] = None, channel_id: Optional[int] = None):
+        self.id = channel_id or next_id()
+        self.name = name
+        self.guild = guild
+        self.api = guild.api
+        self.category = category
+        self.overwrites = dict(overwrites or {})
+        self.mention = f"<#{self.id}>"
+        self.messages: Dict[int, FakeMessage] = {}
+
+    @property
+    def category_id(self) -> Optional[int]:
+        return self.category.id if self.category is not None else None
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        await self.api.call("POST /channels/{channel_id}/messages", self.id)
+        message = FakeMessage(self, self.guild.me, content or "", **kwargs)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await self.api.call("GET /channels/{channel_id}/messages/{message_id}", self.id)
+        return self.messages[message_id]
+
+    async def delete(self, reason: Optional[str] = None) -> None:
+        await self.api.call("DELETE /channels/{channel_id}", self.id)
+        self.guild.remove_channel(self)
+
+    async def set_permissions(self, target, overwrite=None, reason: Optional[str] = None) -> None:
+        await self.api.call("PUT /channels/{channel_id}/permissions/{overwrite_id}", self.id)
+        if overwrite is None:
+            self.overwrites.pop(target, None)
+        else:
+            self.overwrites[target] = overwrite
+
+    async def edit(self, overwrites: Optional[dict] = None, reason: Optional[str] = None, **kwargs) -> None:
+        await self.api.call("PATCH /channels/{channel_id}", self.id)
+        if overwrites is not None:
+            self.overwrites = dict(overwrites)
+
+    async def purge(self, limit: Optional[int] = None) -> List[FakeMessage]:
+        await self.api.call("POST /channels/{channel_id}/messages/bulk-delete", self.id)
+        purged = list(self.messages.values())
+        self.messages.clear()
+        return purged
+
+
+class FakeCategory:
+    def __init__(self, guild: "FakeGuild", name: str, category_id: Optional[int] = None):
+        self.id = category_id or next_id()
+        self.name = name
+        self.guild = guild
+
+    @property
+    def text_channels(self) -> List[FakeTextChannel]:
+        return [c for c in self.guild.channels.values()
+                if isinstance(c, FakeTextChannel) and c.category is self]
+
+
+class FakeGuild:
+    def __init__(self, api: FakeAPI, guild_id: Optional[int] = None, name: str = "Benchmark guild"):
+        self.id = guild_id or next_id()
+        self.name = name
+        self.api = api
+        self.chunked = True
+
+        self.default_role: Optional[FakeRole] = None
+        self.default_role = FakeRole(self, "@everyone", role_id=self.id)
+        self.roles: Dict[int, FakeRole] = {self.default_role.id: self.default_role}
+        self.channels: Dict[int, object] = {}
+        self._members: Dict[int, FakeMember] = {}
+
+        self.me = FakeMember(self, "AndroidRootBot", bot=True)
+        self.owner = FakeMember(self, "Owner")
+        for member in (self.me, self.owner):
+            self._members[member.id] = member
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self._members.values())
+
+    @property
+    def member_count(self) -> int:
+        return len(self._members)
+
+    @property
+    def owner_id(self) -> int:
+        return self.owner.id
+
+    @property
+    def categories(self) -> List[FakeCategory]:
+        return [c for c in self.channels.values() if isinstance(c, FakeCategory)]
+
+    def add_role(self, name: str, role_id: Optional[int] = None) -> FakeRole:
+        role = FakeRole(self, name, role_id)
+        self.roles[role.id] = role
+        return role
+
+    def add_category(self, name: str, category_id: Optional[int] = None) -> FakeCategory:
+        category = FakeCategory(self, name, category_id)
+        self.channels[category.id] = category
+        return category
+
+    def add_text_channel(self, name: str, channel_id: Optional[int] = None,
+                         category: Optional[FakeCategory] = None) -> FakeTextChannel:
+        channel = FakeTextChannel(self, name, category=category, channel_id=channel_id)
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_member(self, name: str, member_id: Optional[int] = None, bot: bool = False) -> FakeMember:
+        member = FakeMember(self, name, member_id, bot)
+        self._members[member.id] = member
+        return member
+
+    def add_members(self, count: int) -> List[FakeMember]:
+        return [self.add_member(f"member{i}") for i in range(count)]
+
+    def remove_channel(self, channel) -> None:
+        self.channels.pop(channel.id, None)
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self.roles.get(role_id)
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self._members.get(member_id)
+
+    async def chunk(self, cache: bool = True) -> List[FakeMember]:
+        return self.members
+
+    async def create_text_channel(self, name: str, category: Optional[FakeCategory] = None,
+                                  overwrites: Optional[dict] = None, reason: Optional[str] = None) -> FakeTextChannel:
+        await self.api.call("POST /guilds/{guild_id}/channels", self.id)
+        channel = FakeTextChannel(self, name, category=category, overwrites=overwrites)
+        self.channels[channel.id] = channel
+        return channel
+
+    async def fetch_members(self, limit: Optional[int] = None, after=None):
+        members = sorted(self._members.values(), key=lambda m: m.id)
+        if after is not None:
+            members = [m for m in members if m.id > after.id]
+
+        for page_start in range(0, len(members), 1000):
+            await self.api.call("GET /guilds/{guild_id}/members", self.id)
+            for member in members[page_start:page_start + 1000]:
+                yield member
+
+
+class FakeEmoji:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+
+class FakeReactionPayload:
+    """
+    Stand-in for discord.RawReactionActionEvent.
+    """
+    def __init__(self, member: FakeMember, message: FakeMessage, emoji: str):
+        self.member = member
+        self.user_id = member.id
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.guild_id = member.guild.id
+        self.emoji = FakeEmoji(emoji)
+
+
+def percentile(values: Iterable[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
@@ -0,0 +1,288 @@
+"""
+Shared setup for the benchmarks: runs bot.py in a temporary directory against a FakeGuild, and saves and compares
+results between runs (e.g. between two versions of the bot).
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Optional, List, Dict, Callable, Awaitable
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_ROOT)
+
+from fake_discord import FakeAPI, FakeHTTP, FakeGuild, FakeMember, FakeMessage, FakeTextChannel
+
+TRIGGER_EMOJI = "🧠"
+
+
+class FakeCommand:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class FakeContext:
+    """
+    Just enough of discord.ext.commands.Context for the bulk role commands.
+    """
+    def __init__(self, guild: FakeGuild, channel: FakeTextChannel, author: FakeMember, command: str):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.command = FakeCommand(command)
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+class Environment:
+    """
+    The fake guild with everything the bot's config refers to.
+    """
+    def __init__(self, api: FakeAPI, existing_members: int):
+        self.api = api
+        self.guild = FakeGuild(api)
+
+        self.role = self.guild.add_role("Verified")
+        self.category = self.guild.add_category("verification")
+        self.trigger_channel = self.guild.add_text_channel("rules")
+        self.log_channel = self.guild.add_text_channel("verification-log")
+        self.commands_channel = self.guild.add_text_channel("bot-commands")
+
+        self.trigger_message = FakeMessage(self.trigger_channel, self.guild.me, "React to get verified")
+        self.trigger_channel.messages[self.trigger_message.id] = self.trigger_message
+
+        # Members that are already verified only make the member list realistic
+        for member in self.guild.add_members(existing_members):
+            member.roles.append(self.role)
+
+        self.bot = None
+
+    def write_config(self, directory: str, args: argparse.Namespace) -> None:
+        data_directory = os.path.join(directory, "data")
+        os.makedirs(data_directory, exist_ok=True)
+        shutil.copy(os.path.join(REPOSITORY_ROOT, "data", "strings.json"), data_directory)
+
+        config = f"""
+[Bot]
+bot_token = benchmark
+bot_prefix = !
+special_user_ids = []
+outbound_workers = {args.workers}
+
+[TriggerConfig]
+guild_id = {self.guild.id}
+verification_trigger_channel_id = {self.trigger_channel.id}
+verification_trigger_message_id = {self.trigger_message.id}
+verification_trigger_emoji = {TRIGGER_EMOJI}
+verification_catch_up_rate = 2
+
+[AuthConfig]
+verification_channel_category_id = {self.category.id}
+verification_success_role_id = {self.role.id}
+verification_channel_pool_size = {args.pool_size}
+verification_channel_pool_low_water = {args.pool_size // 2}
+max_concurrent_verifications = {args.concurrency}
+verification_mode = {args.mode}
+
+[Cache]
+intents = guilds, members, guild_messages, guild_reactions, dm_messages
+
+[Storage]
+session_database = ./data/sessions.sqlite3
+flush_interval = 1
+
+[BulkRoles]
+concurrency = 4
+progress_interval = 5
+checkpoint_directory = ./data/jobs
+
+[Logging]
+log_verification_to_console = False
+log_verification_to_channel = {self.log_channel.id}
+log_channel_flush_interval = 5
+log_channel_digest_threshold = 30
+
+[Status]
+discord_status =
+discord_status_type =
+discord_twitch_url =
+discord_member_status = online
+"""
+        with open(os.path.join(data_directory, "config.ini"), "w", encoding="utf-8") as config_file:
+            config_file.write(config)
+
+    async def start_bot(self, fill_pool: bool):
+        """
+        Imports bot.py, points it at the fake guild and runs its startup.
+        :return: The bot module
+        """
+        bot_module = importlib.import_module("bot")
+        bot_module.bot.get_guild = lambda guild_id: self.guild if guild_id == self.guild.id else None
+        for state in bot_module.guild_states.values():
+            state.log_sink.http = FakeHTTP(self.api)
+        self.bot = bot_module
+
+        await bot_module.startup.run()
+        if fill_pool:
+            # Let the pool fill up like it would between raids
+            await self.wait_until_idle()
+
+        return bot_module
+
+    async def stop_bot(self) -> None:
+        for task in self.bot.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.bot.background_tasks, return_exceptions=True)
+        for state in self.bot.guild_states.values():
+            await state.log_sink.close()
+        await self.bot.session_store.close()
+        if self.bot.audit_store is not None:
+            await self.bot.audit_store.close()
+
+    async def wait_until_idle(self, timeout: float = 30) -> None:
+        """
+        Waits for the queued follow-up calls (reaction removal, DMs, log messages) to go out.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.bot.scheduler.depth == 0 and self.bot.admission.running == 0:
+                break
+            await asyncio.sleep(0.05)
+
+        for state in self.bot.guild_states.values():
+            await state.log_sink.flush()
+
+    def bot_stats(self) -> Dict:
+        return {
+            "scheduler": self.bot.scheduler.stats(),
+            "entity_cache": self.bot.entity_cache.stats(),
+            "api_calls_by_route": dict(self.api.calls_by_route),
+        }
+
+
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--existing-members", type=int, default=5000, help="Members already verified")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean API latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="API latency jitter in seconds")
+    parser.add_argument("--workers", type=int, default=4, help="outbound_workers")
+    parser.add_argument("--concurrency", type=int, default=25, help="max_concurrent_verifications")
+    parser.add_argument("--pool-size", type=int, default=0, help="verification_channel_pool_size")
+    parser.add_argument("--mode", choices=("channel", "dm"), default="channel", help="verification_mode")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Also trace Python allocations for the peak (slows everything down)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Compare against results saved with --output earlier")
+    parser.add_argument("--tolerance", type=float, default=10, help="Allowed regression in percent")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's log output")
+
+
+def compare(results: Dict, baseline: Dict, metrics: Dict[str, bool], tolerance: float) -> List[str]:
+    """
+    Prints how each metric changed since the baseline.
+    :param metrics: Metric name -> True if higher is better
+    :return: Descriptions of the metrics that got worse than the baseline by more than tolerance percent
+    """
+    regressions = []
+    for metric, higher_is_better in metrics.items():
+        if metric not in results or metric not in baseline or not baseline[metric]:
+            continue
+
+        change = (results[metric] - baseline[metric]) / baseline[metric] * 100
+        worse = -change if higher_is_better else change
+        status = "REGRESSION" if worse > tolerance else "ok"
+        print(f"  {metric:<36} {baseline[metric]:>12.4f} -> {results[metric]:>12.4f} ({change:+.1f}%) {status}")
+
+        if worse > tolerance:
+            regressions.append(f"{metric} {change:+.1f}%")
+
+    return regressions
+
+
+def run(args: argparse.Namespace, benchmark: Callable[[Environment], Awaitable[Dict]],
+        print_results: Callable[[Dict], None], metrics: Dict[str, bool]) -> int:
+    """
+    Sets up the environment, runs the benchmark coroutine, prints, saves and compares its results.
+    :return: Exit code (1 if something regressed compared to the baseline)
+    """
+    random.seed(args.seed)
+
+    # The bot runs in a temporary directory
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+
+    # discord.py binds the bot to the current loop when bot.py is imported
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    environment = Environment(FakeAPI(latency=args.latency, jitter=args.jitter, seed=args.seed),
+                              args.existing_members)
+
+    working_directory = tempfile.mkdtemp(prefix="androidroot-bench-")
+    environment.write_config(working_directory, args)
+    os.chdir(working_directory)
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.verbose:
+        # Records still reach the loggers (and the scheduler's rate limit counter), they're just not printed
+        for handler in logging.getLogger().handlers:
+            handler.setLevel(logging.ERROR)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    try:
+        results = loop.run_until_complete(benchmark(environment))
+    finally:
+        loop.close()
+        os.chdir(REPOSITORY_ROOT)
+        shutil.rmtree(working_directory, ignore_errors=True)
+
+    if resource is not None:
+        # KiB on Linux
+        results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if args.tracemalloc:
+        results["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    results["parameters"] = vars(args)
+
+    print_results(results)
+    if "peak_rss_mb" in results:
+        print(f"  peak RSS            {results['peak_rss_mb']:.1f} MiB")
+    if "peak_traced_mb" in results:
+        print(f"  peak traced         {results['peak_traced_mb']:.1f} MiB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+
+        print(f"Compared to {args.compare}:")
+        regressions = compare(results, baseline, dict(metrics, peak_rss_mb=False, peak_traced_mb=False),
+                              args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+
+    return 0
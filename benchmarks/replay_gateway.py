@@ -0,0 +1,267 @@
+"""
+Replays a gateway recording (see record_gateway_events in config.ini) against the offline Discord stand-in
+and reports how long the bot's listeners took per event type, plus the end-to-end verification latency.
+
+Recordings are anonymized: members and channels are recreated from the anonymized IDs, and answers in
+verification channels are replayed as a correct or wrong answer to whatever the replayed session asks for.
+
+Usage (from the repository root):
+    python benchmarks/replay_gateway.py recording.jsonl --speed 10 --output v1.json
+    # ... check out another version of the bot ...
+    python benchmarks/replay_gateway.py recording.jsonl --speed 10 --compare v1.json
+
+The bot's own timeouts are not sped up, so a high --speed replays a raid as an even bigger raid.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from fake_discord import FakeMember, FakeMessage, FakeTextChannel, FakeReactionPayload, percentile
+from harness import Environment, TRIGGER_EMOJI, add_common_arguments, run
+
+EVENT_TYPES = ("reaction", "message", "join", "leave")
+
+# metric -> True if higher is better
+COMPARED_METRICS = {
+    f"{event}_{statistic}": False for event in EVENT_TYPES for statistic in ("p50", "p95", "p99")
+}
+COMPARED_METRICS.update({
+    "verification_p50": False,
+    "verification_p95": False,
+    "verification_p99": False,
+    "api_calls": False,
+    "rate_limited": False,
+})
+
+
+def load_recording(path: str):
+    """
+    :return: (header, list of events ordered by time)
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        lines = [json.loads(line) for line in file if line.strip()]
+
+    if not lines or "v" not in lines[0]:
+        raise ValueError(f"{path} is not a gateway recording (missing header)")
+
+    header, events = lines[0], lines[1:]
+    events.sort(key=lambda e: e["t"])
+    return header, events
+
+
+class Replay:
+    def __init__(self, environment: Environment, header: dict, args: argparse.Namespace):
+        self.environment = environment
+        self.bot = environment.bot
+        self.guild = environment.guild
+        self.args = args
+
+        self.trigger_message_id = header["trigger_message"]
+        self._channels: Dict[int, FakeTextChannel] = {header["trigger_channel"]: environment.trigger_channel}
+        self._messages: Dict[int, FakeMessage] = {self.trigger_message_id: environment.trigger_message}
+
+        self.handler_times: Dict[str, List[float]] = defaultdict(list)
+        self.schedule_lag: List[float] = []
+        self.verification_times: List[float] = []
+        self.unanswerable = 0
+        self._verifying: Dict[int, asyncio.Task] = {}
+
+    def member(self, user_id: int, bot: bool = False) -> FakeMember:
+        member = self.guild.get_member(user_id)
+        if member is None:
+            member = self.guild.add_member(f"member{user_id}", member_id=user_id, bot=bot)
+        return member
+
+    def channel(self, channel_id: int) -> FakeTextChannel:
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = self.guild.add_text_channel(f"channel{channel_id}")
+            self._channels[channel_id] = channel
+        return channel
+
+    def message(self, message_id: int, channel_id: int) -> FakeMessage:
+        message = self._messages.get(message_id)
+        if message is None:
+            message = FakeMessage(self.channel(channel_id), self.guild.me, "", message_id=message_id)
+            self._messages[message_id] = message
+        return message
+
+    async def timed(self, event: str, handler, *arguments) -> None:
+        started = time.perf_counter()
+        try:
+            await handler(*arguments)
+        finally:
+            self.handler_times[event].append(time.perf_counter() - started)
+
+    async def on_join(self, record: dict) -> None:
+        member = self.member(record["u"], record.get("bot", False))
+        await self.timed("join", self.bot.on_member_join, member)
+
+    async def on_leave(self, record: dict) -> None:
+        member = self.guild._members.pop(record["u"], None)
+        if member is not None:
+            await self.timed("leave", self.bot.on_member_remove, member)
+
+    async def on_reaction(self, record: dict) -> None:
+        member = self.member(record["u"], record.get("bot", False))
+        message = self.message(record["m"], record["c"])
+        emoji = TRIGGER_EMOJI if record.get("trigger") else "👍"
+
+        if record["m"] == self.trigger_message_id and record.get("trigger") and not member.bot:
+            reaction = message._reaction(emoji)
+            if member.id not in reaction.user_ids:
+                reaction.user_ids.append(member.id)
+            if member.id not in self._verifying and self.environment.role not in member.roles:
+                self._verifying[member.id] = asyncio.ensure_future(self.time_verification(member))
+
+        await self.timed("reaction", self.bot.on_raw_reaction_add, FakeReactionPayload(member, message, emoji))
+
+    async def on_message(self, record: dict) -> None:
+        member = self.member(record["u"])
+        kind = record.get("k", "other")
+
+        if kind == "other":
+            message = FakeMessage(self.channel(record["c"]), member, "")
+        else:
+            # The session (and its channel and code) of the replay is not the recorded one, wait for it
+            session = None
+            deadline = time.monotonic() + self.args.answer_wait
+            while session is None and time.monotonic() < deadline:
+                session = self.bot.session_manager.get_by_member(self.guild.id, member.id)
+                if session is None:
+                    await asyncio.sleep(0.01)
+
+            if session is None:
+                self.unanswerable += 1
+                return
+
+            content = f"{session.code} {session.emoji}" if kind == "correct" else "wrong answer"
+            message = FakeMessage(self.guild.get_channel(session.channel_id), member, content)
+
+        await self.timed("message", self.bot.on_message, message)
+
+    async def time_verification(self, member: FakeMember) -> None:
+        started = time.monotonic()
+        await member.role_added.wait()
+        self.verification_times.append(time.monotonic() - started)
+
+    async def run(self, events: List[dict]) -> None:
+        handlers = {
+            "reaction": self.on_reaction,
+            "message": self.on_message,
+            "join": self.on_join,
+            "leave": self.on_leave,
+        }
+
+        started = time.monotonic()
+        tasks = []
+        for record in events:
+            target = started + record["t"] / self.args.speed
+            delay = target - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.schedule_lag.append(max(time.monotonic() - target, 0))
+
+            handler = handlers.get(record["e"])
+            if handler is not None:
+                # Like discord.py, every event is handled in its own task
+                tasks.append(asyncio.ensure_future(handler(record)))
+
+        await asyncio.gather(*tasks)
+
+        # Give the verifications that are still running time to finish (or time out)
+        if self._verifying:
+            await asyncio.wait(list(self._verifying.values()), timeout=self.args.drain_timeout)
+            for task in self._verifying.values():
+                task.cancel()
+
+
+def summarize(values: List[float], scale: float = 1.0) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) * scale if values else 0.0,
+        "p50": percentile(values, 0.50) * scale,
+        "p95": percentile(values, 0.95) * scale,
+        "p99": percentile(values, 0.99) * scale,
+        "max": max(values, default=0.0) * scale,
+    }
+
+
+def print_results(results: Dict) -> None:
+    print(f"Replayed {results['events']} events in {results['duration']:.1f}s "
+          f"(speed x{results['parameters']['speed']}, schedule lag p99 {results['schedule_lag_p99']:.1f}ms)")
+    print(f"  {'handler':<10} {'count':>7} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}   (ms)")
+    for event in EVENT_TYPES:
+        if event not in results["handlers"]:
+            continue
+        stats = results["handlers"][event]
+        print(f"  {event:<10} {stats['count']:>7} {stats['mean']:>9.3f} {stats['p50']:>9.3f} "
+              f"{stats['p95']:>9.3f} {stats['p99']:>9.3f} {stats['max']:>9.3f}")
+
+    verifications = results["verifications"]
+    print(f"  verified {verifications['count']} members, reaction to role p50 {verifications['p50']:.2f}s  "
+          f"p95 {verifications['p95']:.2f}s  p99 {verifications['p99']:.2f}s")
+    print(f"  API calls           {results['api_calls']}, {results['rate_limited']} rate limited")
+    if results["unanswerable"]:
+        print(f"  {results['unanswerable']} recorded answers had no session to go to")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replays a gateway recording against a fake Discord")
+    parser.add_argument("recording", help="File written by the bot with record_gateway_events")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster than recorded")
+    parser.add_argument("--answer-wait", type=float, default=60,
+                        help="How long a recorded answer waits for its verification session to open")
+    parser.add_argument("--drain-timeout", type=float, default=150,
+                        help="How long to wait for the running verifications after the last event")
+    add_common_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_arguments()
+    header, events = load_recording(args.recording)
+
+    async def benchmark(environment: Environment) -> Dict:
+        await environment.start_bot(fill_pool=args.pool_size > 0)
+
+        replay = Replay(environment, header, args)
+        started = time.monotonic()
+        await replay.run(events)
+        duration = time.monotonic() - started
+        await environment.wait_until_idle()
+
+        # Handler times in milliseconds
+        handlers = {event: summarize(times, 1000) for event, times in replay.handler_times.items()}
+        verifications = summarize(replay.verification_times)
+
+        results = {
+            "events": len(events),
+            "duration": duration,
+            "handlers": handlers,
+            "verifications": verifications,
+            "schedule_lag_p99": percentile(replay.schedule_lag, 0.99) * 1000,
+            "unanswerable": replay.unanswerable,
+            "api_calls": environment.api.calls,
+            "rate_limited": environment.api.rate_limited,
+        }
+        # Flat copies for --compare
+        for event, stats in handlers.items():
+            for statistic in ("p50", "p95", "p99"):
+                results[f"{event}_{statistic}"] = stats[statistic]
+        for statistic in ("p50", "p95", "p99"):
+            results[f"verification_{statistic}"] = verifications[statistic]
+
+        results.update(environment.bot_stats())
+        await environment.stop_bot()
+        return results
+
+    return run(args, benchmark, print_results, COMPARED_METRICS)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,202 +1,545 @@
 import logging
-logging.basicConfig(level=logging.INFO)
 
-from typing import Optional
+from typing import Optional, Dict, List, Set, Union, Callable, Awaitable
 from random import choice
+import asyncio
+import math
+import signal
+import time
 from asyncio import TimeoutError
 from datetime import datetime
-
-from discord import Member, Guild, TextChannel, Message, PermissionOverwrite, Role, \
-    CategoryChannel, Reaction, Embed, Color, Activity, Status, ActivityType
-from discord.ext.commands import Bot, Context, check_any, CheckFailure
-from discord import RawReactionActionEvent
-from discord.errors import HTTPException
-
-from androidroot.state import state
-from androidroot.config import BOT_TOKEN, BOT_PREFIX, GUILD_ID, \
+from io import BytesIO
+
+from discord import Member, Guild, TextChannel, DMChannel, Message, PermissionOverwrite, Role, File, \
+    Embed, Color, Activity, Status, ActivityType, Game, Streaming, Intents, MemberCacheFlags
+from discord.ext.commands import Bot, AutoShardedBot, Context, check_any, CheckFailure
+from discord import RawReactionActionEvent, RawMessageUpdateEvent, RawMessageDeleteEvent
+from discord.errors import HTTPException, Forbidden
+
+from androidroot.cache import entity_cache
+from androidroot.sessions import session_manager, VerificationSession
+from androidroot.session_store import SessionStore
+from androidroot.audit_store import AuditStore, AuditEntry
+from androidroot.channel_pool import is_verification_channel_name
+from androidroot.admission import AdmissionQueue
+from androidroot.lockout import LockoutTable
+from androidroot.job_queue import JobQueue, JobKind, JobStatus
+from androidroot.captcha import CaptchaPool
+from androidroot.guilds import GuildState
+from androidroot.log_pipeline import log_pipeline
+from androidroot.diagnostics import LoopMonitor, Profiler, MemoryTracer, process_memory, cache_report
+from androidroot.metrics import registry, MetricsServer, instrument_http
+from androidroot.recorder import GatewayRecorder, MESSAGE_CORRECT, MESSAGE_WRONG, MESSAGE_OTHER
+from androidroot.startup import StartupPipeline, gather_bounded
+from androidroot.scheduler import ActionScheduler, Priority
+from androidroot.bulk_roles import BulkRoleJob, BulkRoleMode, BulkRoleProgress, report_progress_periodically
+from androidroot.config import BOT_TOKEN, BOT_PREFIX, SPECIAL_USERS_IDS, SHARDED, SHARD_COUNT, GUILDS, GUILD_ID, \
+    STRINGS_CHECK_INTERVAL, CONFIG_CHECK_INTERVAL, \
     VERIFICATION_TRIGGER_CHANNEL_ID, VERIFICATION_TRIGGER_MESSAGE_ID, VERIFICATION_TRIGGER_EMOJI, \
-    VERIFICATION_CHANNEL_CATEGORY_ID, VERIFICATION_SUCCESS_ROLE_ID, \
-    LOG_VERIFICATIONS_CONSOLE, LOG_VERIFICATIONS_CHANNEL, \
-    DISCORD_STATUS_NAME, DISCORD_TYPE, \
-    DISCORD_TWITCH, DISCORD_STATUS
-from androidroot.strings import gets, String
-from androidroot.utilities import generate_id, generate_code
+    VERIFICATION_CATCH_UP_RATE, MAX_CONCURRENT_VERIFICATIONS, VERIFICATION_CHALLENGE, VERIFICATION_MODE, \
+    CAPTCHA_POOL_SIZE, CAPTCHA_POOL_LOW_WATER, CAPTCHA_PROCESSES, CAPTCHA_FONT, \
+    CACHE_INTENTS, CACHE_MESSAGES, CACHE_MEMBERS, CACHE_CHUNK_AT_STARTUP, \
+    LOCKOUT_BASE, LOCKOUT_MAX, LOCKOUT_TTL, LOCKOUT_SNAPSHOT, \
+    OUTBOUND_WORKERS, STARTUP_CLEANUP_CONCURRENCY, SESSION_DATABASE, SESSION_DATABASE_FLUSH_INTERVAL, \
+    AUDIT_DATABASE, AUDIT_RETENTION_DAYS, \
+    BULK_ROLE_CONCURRENCY, BULK_ROLE_PROGRESS_INTERVAL, BULK_ROLE_CHECKPOINT_DIRECTORY, \
+    WORKERS_ENABLED, JOB_DATABASE, WORKER_POLL_INTERVAL, WORKER_LEASE, WORKER_MAX_ATTEMPTS, \
+    LOG_LEVEL, LOG_FILE, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS, LOG_QUEUE_SIZE, \
+    LOG_VERIFICATIONS_CHANNEL_FLUSH_INTERVAL, LOG_VERIFICATIONS_CHANNEL_DIGEST_THRESHOLD, \
+    METRICS_PORT, METRICS_HOST, RECORD_GATEWAY_EVENTS, \
+    LOOP_LAG_INTERVAL, LOOP_STALL_THRESHOLD, DIAGNOSTICS_DIRECTORY, \
+    Config, config_registry
+from androidroot.strings import gets, String, string_registry
+from androidroot.utilities import generate_id, generate_code, parse_duration, parse_user_id
 from androidroot.checks import is_server_owner, is_special_user, decorate_check
 from androidroot.emoji import StandardEmoji, UnicodeEmoji
 import sys
 
 __version__ = "0.3.0"
 
+# Seconds a member has to answer the challenge
+VERIFICATION_TIMEOUT = 120
+
 log = logging.getLogger(__name__)
-bot = Bot(
-    command_prefix=BOT_PREFIX
+
+
+# One gateway connection per shard instead of one for everything, for bots in many guilds
+class AndroidRootBot(AutoShardedBot if SHARDED else Bot):
+    async def start(self, *args, **kwargs):
+        loop_monitor.start()
+        lockout_table.load(LOCKOUT_SNAPSHOT)
+        # Metrics are available before the bot connects (e.g. to see gateway trouble)
+        if metrics_server is not None:
+            await metrics_server.start()
+
+        # Strings and config are reloaded without reconnecting (not on Windows, it has no SIGHUP)
+        if hasattr(signal, "SIGHUP"):
+            self.loop.add_signal_handler(signal.SIGHUP, reload_files)
+        if STRINGS_CHECK_INTERVAL > 0:
+            asyncio.ensure_future(string_registry.watch(STRINGS_CHECK_INTERVAL))
+        if CONFIG_CHECK_INTERVAL > 0:
+            asyncio.ensure_future(config_registry.watch(CONFIG_CHECK_INTERVAL))
+
+        await super().start(*args, **kwargs)
+
+    async def invoke(self, ctx: Context):
+        if ctx.command is None:
+            return await super().invoke(ctx)
+
+        started = time.monotonic()
+        await super().invoke(ctx)
+
+        name = ctx.command.qualified_name
+        metric_command_seconds.observe(time.monotonic() - started, command=name)
+        metric_commands.inc(command=name, outcome="failed" if ctx.command_failed else "ok")
+
+    async def close(self):
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        # Don't lose buffered verification logs on shutdown
+        await asyncio.gather(*[state.log_sink.close() for state in guild_states.values()])
+        await session_store.close()
+        if audit_store is not None:
+            await audit_store.close()
+        if job_queue is not None:
+            await job_queue.close()
+        if LOCKOUT_SNAPSHOT is not None and lockout_table.enabled:
+            lockout_table.save(LOCKOUT_SNAPSHOT)
+        if captcha_pool is not None:
+            await captcha_pool.close()
+        if gateway_recorder is not None:
+            await gateway_recorder.close()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        loop_monitor.stop()
+        await super().close()
+
+
+def build_intents(names) -> Intents:
+    """
+    :return: Intents with only the given flags enabled
+    """
+    intents = Intents.none()
+    for name in names:
+        if name not in Intents.VALID_FLAGS:
+            raise Exception(f"Unknown intent '{name}' in [Cache] intents")
+        setattr(intents, name, True)
+
+    if not intents.members:
+        raise Exception("The 'members' intent is required (for joins and the verified member index)")
+    if VERIFICATION_MODE == "dm" and not intents.dm_messages:
+        raise Exception("The 'dm_messages' intent is required with verification_mode = dm (for the answers)")
+
+    return intents
+
+
+intents = build_intents(CACHE_INTENTS)
+bot = AndroidRootBot(
+    command_prefix=BOT_PREFIX,
+    intents=intents,
+    max_messages=CACHE_MESSAGES if CACHE_MESSAGES > 0 else None,
+    member_cache_flags=MemberCacheFlags.from_intents(intents) if CACHE_MEMBERS else MemberCacheFlags.none(),
+    chunk_guilds_at_startup=CACHE_CHUNK_AT_STARTUP,
+    shard_count=SHARD_COUNT
 )
+# Shared by all guilds: they all use the same rate limits, sessions and verification slots
+scheduler = ActionScheduler(OUTBOUND_WORKERS)
+session_store = SessionStore(SESSION_DATABASE, flush_interval=SESSION_DATABASE_FLUSH_INTERVAL)
+session_manager.store = session_store
+# Every verification attempt, for !verifylog
+audit_store = AuditStore(AUDIT_DATABASE) if AUDIT_DATABASE is not None else None
+# Failed attempts per member, checked before a verification is even queued
+lockout_table = LockoutTable(LOCKOUT_BASE, LOCKOUT_MAX, LOCKOUT_TTL)
+# Only with [Workers] enabled: verifications and bulk role jobs are handed to the worker processes (worker.py)
+job_queue = JobQueue(
+    JOB_DATABASE, flush_interval=WORKER_POLL_INTERVAL, lease=WORKER_LEASE, max_attempts=WORKER_MAX_ATTEMPTS
+) if WORKERS_ENABLED else None
+# Only for the image challenge (the workers have their own when they run the verifications)
+captcha_pool = CaptchaPool(
+    CAPTCHA_POOL_SIZE, CAPTCHA_POOL_LOW_WATER, processes=CAPTCHA_PROCESSES, font_path=CAPTCHA_FONT
+) if VERIFICATION_CHALLENGE == "image" and job_queue is None else None
+# Everything else is kept per guild, events are routed to it by guild ID
+guild_states: Dict[int, GuildState] = {
+    guild_id: GuildState(
+        bot, guild_config, scheduler, VERIFICATION_CATCH_UP_RATE,
+        log_flush_interval=LOG_VERIFICATIONS_CHANNEL_FLUSH_INTERVAL,
+        log_digest_threshold=LOG_VERIFICATIONS_CHANNEL_DIGEST_THRESHOLD
+    )
+    for guild_id, guild_config in GUILDS.items()
+}
+loop_monitor = LoopMonitor(LOOP_LAG_INTERVAL, LOOP_STALL_THRESHOLD)
+profiler = Profiler(DIAGNOSTICS_DIRECTORY)
+memory_tracer = MemoryTracer(DIAGNOSTICS_DIRECTORY)
+
+
+def classify_recorded_message(channel_id: int, author_id: int, content: str) -> str:
+    """
+    Tells the gateway recorder whether a message was an answer in a verification channel (and if it was correct).
+    """
+    session = session_manager.get_by_channel(channel_id)
+    if session is None or session.member_id != author_id:
+        return MESSAGE_OTHER
+
+    return MESSAGE_CORRECT if session.is_correct(content) else MESSAGE_WRONG
 
 
 #############
-# Helper code
+# Metrics
 #############
+metric_verifications_started = registry.counter(
+    "verifications_started_total", "Verifications that were sent the challenge, by where (channel or dm)",
+    labels=("mode",)
+)
+metric_verifications_finished = registry.counter(
+    "verifications_finished_total", "Finished verifications by outcome (verified, timeout or error)",
+    labels=("outcome",)
+)
+metric_verification_seconds = registry.histogram(
+    "verification_duration_seconds", "Time from the verification request (reaction or !verify) to the role grant, "
+                                     "by where the challenge was answered (channel or dm)",
+    labels=("mode",), buckets=(1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300)
+)
+metric_dm_fallbacks = registry.counter(
+    "verification_dm_fallbacks_total", "Verifications that got a channel because the member's DMs were closed"
+)
+metric_channel_seconds = registry.histogram(
+    "verification_channel_seconds", "Time to get (acquire from the pool or create) and release verification "
+                                    "channels, including the wait in the outbound queue",
+    labels=("operation",)
+)
+metric_http_seconds = registry.histogram("http_request_duration_seconds", "Discord REST request latency per route",
+                                         labels=("route",))
+metric_http_responses = registry.counter("http_requests_total", "Discord REST requests per route and status",
+                                         labels=("route", "status"))
+metric_event_seconds = registry.histogram("event_handler_seconds", "Time spent in the gateway event listeners",
+                                          labels=("event",))
+metric_commands = registry.counter("commands_total", "Invoked commands by outcome", labels=("command", "outcome"))
+metric_command_seconds = registry.histogram("command_duration_seconds", "Time to run a command",
+                                            labels=("command",), buckets=(0.1, 0.5, 1, 5, 30, 60, 300, 1800))
+metric_admission_wait_seconds = registry.histogram(
+    "admission_wait_seconds", "Time verification requests waited in the admission queue for a free slot "
+                              "(0 if one was free)",
+    buckets=(0, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+
 
-# These functions cache the Guild, TextChannel and Message objects
-async def get_main_guild() -> Guild:
+def count_rate_limits():
     """
-    :return: Guild that was configured for this bot to work on
+    :return: Rate limits counted by the scheduler per priority class
     """
-    stored: Optional[Guild] = state.get("main_guild")
+    counts = {(Priority.NAMES[p],): s.rate_limited for p, s in scheduler.stats_by_class.items()}
+    counts[("unknown",)] = scheduler.rate_limited_unattributed
+    return counts
+
+
+registry.counter("rate_limits_total", "Rate limits (HTTP 429) hit by outbound API calls, per priority class",
+                 labels=("priority",), function=count_rate_limits)
+registry.gauge("active_sessions", "Verification sessions waiting for an answer",
+               function=lambda: session_manager.active)
+registry.gauge("admission_queue_depth", "Verification requests waiting for a free slot",
+               function=lambda: admission.depth)
+registry.gauge("lockout_table_size", "Members with failed verification attempts that are remembered",
+               function=lambda: len(lockout_table))
+registry.counter("verifications_locked_out_total", "Verification requests rejected because the member is locked out "
+                                                   "after failed attempts", function=lambda: lockout_table.rejected)
+registry.gauge("outbound_queue_depth", "API calls waiting in the outbound scheduler",
+               function=lambda: scheduler.depth)
+registry.counter("entity_cache_requests_total", "Lookups of cached entities (guild, channels, roles, messages) by "
+                                                 "result (hit, miss or coalesced into a running fetch)",
+                 labels=("result",),
+                 function=lambda: {("hit",): entity_cache.hits, ("miss",): entity_cache.misses,
+                                   ("coalesced",): entity_cache.coalesced})
+registry.counter("entity_cache_invalidations_total", "Cached entities dropped because a gateway event or config "
+                                                     "reload changed them", function=lambda: entity_cache.invalidations)
+registry.gauge("entity_cache_entries", "Entities in the cache", function=lambda: len(entity_cache))
+registry.gauge("event_loop_lag_seconds", "Event loop lag of the last sample",
+               function=lambda: loop_monitor.samples[-1] if loop_monitor.samples else 0)
+registry.counter("event_loop_stalls_total", "Times the event loop was blocked for longer than the stall threshold",
+                 function=lambda: loop_monitor.stall_count)
+registry.counter("log_records_total", "Log records by what happened to them (written, dropped or sampled out)",
+                 labels=("result",),
+                 function=lambda: {("written",): log_pipeline.written, ("dropped",): log_pipeline.dropped,
+                                   ("sampled_out",): log_pipeline.sampled_out})
+registry.gauge("log_queue_depth", "Log records waiting to be written", function=lambda: log_pipeline.stats()["depth"])
+registry.gauge("process_resident_memory_bytes", "Resident memory of the bot process",
+               function=lambda: process_memory()[0] * 1024 * 1024)
+registry.gauge("cached_objects", "Objects discord.py keeps in memory, by kind", labels=("kind",),
+               function=lambda: {(kind,): count for kind, count in cache_report(bot).items()})
+registry.gauge("worker_jobs", "Jobs in the worker queue by status (with [Workers] enabled)", labels=("status",),
+               function=lambda: {(status,): count for status, count in worker_job_counts.items()})
+registry.counter("captcha_pool_empty_total", "Times a verification found no pre-rendered captcha image ready",
+                 function=lambda: captcha_pool.empty if captcha_pool is not None else 0)
+registry.gauge("captcha_pool_available", "Pre-rendered captcha images ready",
+               function=lambda: captcha_pool.available if captcha_pool is not None else 0)
+registry.counter("file_reloads_total", "Reloads of strings.json and config.ini, by file and outcome (a failed reload "
+                                       "keeps the current values)", labels=("file", "outcome"),
+                 function=lambda: {("strings", "ok"): string_registry.reloads,
+                                   ("strings", "failed"): string_registry.failed_reloads,
+                                   ("config", "ok"): config_registry.reloads,
+                                   ("config", "failed"): config_registry.failed_reloads})
+registry.gauge("gateway_latency_seconds", "Latency between a gateway heartbeat and its acknowledgement",
+               function=lambda: bot.latency)
+
+instrument_http(bot.http, metric_http_seconds, metric_http_responses)
+metrics_server = MetricsServer(registry, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+
+# Member ID -> when the verification was requested (for the verification duration)
+verification_requested_at = {}
+# Status -> number of jobs in the worker queue, updated by collect_worker_results
+worker_job_counts: Dict[str, int] = {}
+# Loops started by the startup stages, cancelled before the stores they use are closed
+background_tasks: List[asyncio.Task] = []
+
+
+gateway_recorder = None
+if RECORD_GATEWAY_EVENTS is not None:
+    # Records the guild of [TriggerConfig]
+    gateway_recorder = GatewayRecorder(
+        RECORD_GATEWAY_EVENTS, GUILD_ID, VERIFICATION_TRIGGER_CHANNEL_ID, VERIFICATION_TRIGGER_MESSAGE_ID,
+        VERIFICATION_TRIGGER_EMOJI, classify_recorded_message
+    )
 
-    if stored is None:
-        main_guild = bot.get_guild(GUILD_ID)
-        state.set("main_guild", main_guild)
-        return main_guild
-    else:
-        return stored
 
+#############
+# Helper code
+#############
 
-async def get_verify_trigger_channel() -> TextChannel:
+def get_guild_state(guild_id: Optional[int]) -> Optional[GuildState]:
     """
-    :return: Verification TextChannel
+    :return: State of the guild if it is configured for verification
     """
-    stored: Optional[TextChannel] = state.get("auth_channel")
-
-    if stored is None:
-        auth_channel = (await get_main_guild()).get_channel(VERIFICATION_TRIGGER_CHANNEL_ID)
-        state.set("auth_channel", auth_channel)
-        return auth_channel
-    else:
-        return stored
+    return guild_states.get(guild_id)
 
 
-async def get_verify_trigger_message() -> Message:
+async def for_each_guild(function: Callable[[GuildState], Awaitable[None]]):
     """
-    :return: Verification trigger Message
+    Runs function for every configured guild at once.
     """
-    stored: Optional[Message] = state.get("auth_trigger_message")
-
-    if stored is None:
-        trigger_message = await (await get_verify_trigger_channel()).fetch_message(VERIFICATION_TRIGGER_MESSAGE_ID)
-        state.set("auth_trigger_message", trigger_message)
-        return trigger_message
-    else:
-        return stored
+    await asyncio.gather(*[function(state) for state in guild_states.values()])
 
 
-async def get_verified_role() -> Role:
+def route_member_payload(payload: dict):
     """
-    :return: Role to add when successfully authenticated.
+    Hands raw member updates and leaves to the guild's verified index (needed when members aren't cached).
     """
-    stored: Optional[Role] = state.get("auth_success_role")
+    event = payload.get("t")
+    if event not in ("GUILD_MEMBER_UPDATE", "GUILD_MEMBER_REMOVE"):
+        return
+
+    state = get_guild_state(int(payload["d"]["guild_id"]))
+    if state is not None:
+        state.sync_verified_index(event, payload["d"])
 
-    if stored is None:
-        success_role = (await get_main_guild()).get_role(VERIFICATION_SUCCESS_ROLE_ID)
-        state.set("auth_success_role", success_role)
-        return success_role
-    else:
-        return stored
 
+#############
+# Verification code
+#############
+def is_dm_channel(channel: Union[TextChannel, DMChannel]) -> bool:
+    return getattr(channel, "guild", None) is None
 
-# TODO use decorators for caching instead of doing it manually in each function
-async def get_logging_channel() -> Optional[TextChannel]:
+
+def challenge_file(image: Optional[bytes]) -> Optional[File]:
+    # A File can only be sent once
+    return File(BytesIO(image), filename="code.png") if image is not None else None
+
+
+# DM channels a challenge is being sent to right now (they have no session yet)
+dm_channels_opening: Set[int] = set()
+
+
+async def send_challenge_by_dm(member: Member, content: str, image: Optional[bytes]) -> Optional[DMChannel]:
     """
-    :return: Verification logging channel
+    Sends the whole challenge as one DM.
+    :return: The DM channel, None if the member doesn't accept DMs from the bot or is already
+             verifying for another guild in their DMs (the answers couldn't be told apart)
     """
-    if LOG_VERIFICATIONS_CHANNEL is None:
+    dm_channel = member.dm_channel or await scheduler.run(Priority.NORMAL, member.create_dm)
+    if session_manager.get_by_channel(dm_channel.id) is not None or dm_channel.id in dm_channels_opening:
         return None
 
-    stored: Optional[TextChannel] = state.get("verification_logging_channel")
+    dm_channels_opening.add(dm_channel.id)
+    try:
+        await scheduler.run(Priority.NORMAL, lambda: dm_channel.send(content, file=challenge_file(image)))
+    except Forbidden:
+        metric_dm_fallbacks.inc()
+        log.info(f"{member.name}#{member.discriminator} ({member.id}) doesn't accept DMs, verifying in a channel")
+        return None
+    finally:
+        dm_channels_opening.discard(dm_channel.id)
 
-    if stored is None:
-        logging_channel = (await get_main_guild()).get_channel(LOG_VERIFICATIONS_CHANNEL)
-        state.set("verification_logging_channel", logging_channel)
-        return logging_channel
-    else:
-        return stored
+    return dm_channel
 
 
-def find_category_by_id(guild: Guild, category_id: int) -> Optional[CategoryChannel]:
-    category = None
-    for c in guild.categories:
-        if c.id == category_id:
-            category = c
-            break
+async def open_verification_channel(member: Member) -> TextChannel:
+    state = guild_states[member.guild.id]
+    guild = await state.get_guild()
 
-    return category
+    # Take a pooled channel if one is ready, otherwise create a new one
+    with metric_channel_seconds.time(operation="acquire"):
+        auth_channel = await state.channel_pool.acquire(member)
 
+    if auth_channel is None:
+        channel_name = f"verification-{generate_id(4)}"
 
-#############
-# Verification code
-#############
-async def begin_verification(member: Member):
-    main_guild = await get_main_guild()
-
-    # Create new channel
-    channel_name = f"verification-{generate_id(4)}"
-
-    # Find the correct category
-    category = find_category_by_id(main_guild, VERIFICATION_CHANNEL_CATEGORY_ID)
-    if not category:
-        raise Exception(f"Could not find category with ID {VERIFICATION_CHANNEL_CATEGORY_ID}")
-
-    permission_overwrites = {
-        main_guild.me: PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True),
-        member: PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True),
-        main_guild.default_role: PermissionOverwrite(read_messages=False, send_messages=False)
-    }
-
-    auth_channel = await main_guild.create_text_channel(
-        channel_name,
-        category=category,
-        overwrites=permission_overwrites,
-        reason=f"Authenticating user {member.id}#{member.discriminator}"
-    )
+        # Find the correct category
+        category = await state.get_category()
+
+        permission_overwrites = {
+            guild.me: PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True),
+            member: PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True),
+            guild.default_role: PermissionOverwrite(read_messages=False, send_messages=False)
+        }
+
+        with metric_channel_seconds.time(operation="create"):
+            auth_channel = await scheduler.run(Priority.NORMAL, lambda: guild.create_text_channel(
+                channel_name,
+                category=category,
+                overwrites=permission_overwrites,
+                reason=f"Authenticating user {member.id}#{member.discriminator}"
+            ))
+
+    return auth_channel
 
-    random_code = generate_code(4)
+
+async def begin_verification(member: Member):
     random_emoji_text, random_emoji_unicode = choice(gets(String.VERIFY_RANDOM_EMOJI_LIST))
 
-    await auth_channel.send(gets(String.ON_VERIFICATION_BEGIN).format(user_mention=member.mention))
-    await auth_channel.send(gets(String.VERIFICATION_HOW).format(
-        code=random_code,
-        random_emoji=random_emoji_text.strip(":"),
-    ))
+    begin = gets(String.ON_VERIFICATION_BEGIN).format(user_mention=member.mention)
+    if captcha_pool is None:
+        random_code = generate_code(4)
+        image = None
+        how = gets(String.VERIFICATION_HOW).format(code=random_code, random_emoji=random_emoji_text.strip(":"))
+    else:
+        # Pre-rendered in other processes, ready right away
+        random_code, image = await captcha_pool.take()
+        how = gets(String.VERIFICATION_HOW_IMAGE).format(random_emoji=random_emoji_text.strip(":"))
+
+    auth_channel = None
+    if VERIFICATION_MODE == "dm":
+        auth_channel = await send_challenge_by_dm(member, f"{begin}\n{how}", image)
+
+    if auth_channel is None:
+        auth_channel = await open_verification_channel(member)
+        await scheduler.run(Priority.NORMAL, lambda: auth_channel.send(begin))
+        await scheduler.run(Priority.NORMAL, lambda: auth_channel.send(how, file=challenge_file(image)))
 
-    responses = []
-    embed = None
+    session = session_manager.open(member.guild.id, member.id, auth_channel.id, random_code, random_emoji_unicode,
+                                   timeout=VERIFICATION_TIMEOUT)
+    metric_verifications_started.inc(mode="dm" if is_dm_channel(auth_channel) else "channel")
+    await finish_verification(member, auth_channel, session)
 
+
+async def run_verification(member: Member):
+    """
+    Runs a verification from the admission queue and counts it if it fails with an error.
+    """
     try:
-        failed_tries = 0
+        await begin_verification(member)
+    except Exception as e:
+        metric_verifications_finished.inc(outcome="error")
+        if audit_store is not None:
+            requested_at = verification_requested_at.get((member.guild.id, member.id))
+            audit_store.record(
+                member.guild.id, member.id, f"{member.name}#{member.discriminator}", None, VERIFICATION_MODE, "error",
+                None, [repr(e)], 0, time.monotonic() - requested_at if requested_at is not None else None, None
+            )
+        raise
+    finally:
+        verification_requested_at.pop((member.guild.id, member.id), None)
+
 
-        def is_correct_response(message: Message):
-            if message.author.id != member.id:
-                return False
-            if message.channel.id != auth_channel.id:
-                return False
+def log_verification(member: Member, auth_channel: Union[TextChannel, DMChannel], outcome: str, expected: str,
+                     requested_at: Optional[float], response: Optional[str] = None):
+    """
+    Logs the outcome of a verification, with member_id, channel_id, outcome and duration as structured fields.
+    """
+    if not config_registry.config.log_verifications_console:
+        return
 
-            responses.append(message)
+    if response is not None and len(response) > 200:
+        response = f"{response[:200]}[...]"
+
+    log.info(
+        f"Verification {outcome}: {member.name}#{member.discriminator} ({member.id}), expected '{expected}', "
+        + (f"response '{response}'" if response is not None else "no response"),
+        extra={
+            "guild_id": member.guild.id,
+            "member_id": member.id,
+            "channel_id": auth_channel.id,
+            "mode": "dm" if is_dm_channel(auth_channel) else "channel",
+            "outcome": outcome,
+            "duration": round(time.monotonic() - requested_at, 3) if requested_at is not None else None,
+            "expected": expected,
+            "response": response,
+        }
+    )
 
-            content = str(message.content).strip().lower()
-            # Should begin with the code and end with the emoji
-            if random_code.lower() not in content:
-                return False
-            if random_emoji_unicode not in content:
-                return False
 
-            return True
+async def release_verification_channel(member: Member, auth_channel: Union[TextChannel, DMChannel], outcome: str):
+    # Nothing to clean up in DMs
+    if is_dm_channel(auth_channel):
+        return
 
-        response: Message = await bot.wait_for("message", check=is_correct_response, timeout=120)
+    with metric_channel_seconds.time(operation="release"):
+        await guild_states[member.guild.id].channel_pool.release(
+            auth_channel, member,
+            reason=f"Verification for {member.name}#{member.discriminator} ({member.id}) {outcome}"
+        )
+
+
+def record_attempt(member: Member, auth_channel: Union[TextChannel, DMChannel], session: VerificationSession,
+                   outcome: str, requested_at: Optional[float]):
+    """
+    Appends the attempt to the audit store (if it's enabled).
+    """
+    if audit_store is None:
+        return
+
+    audit_store.record(
+        member.guild.id, member.id, f"{member.name}#{member.discriminator}", auth_channel.id,
+        "dm" if is_dm_channel(auth_channel) else "channel", outcome, f"{session.code} {session.emoji}",
+        [response.clean_content for response in session.responses], session.response_count,
+        time.monotonic() - requested_at if requested_at is not None else None,
+        # Also known for sessions restored after a restart
+        time.time() - (session.deadline - VERIFICATION_TIMEOUT)
+    )
+
+
+async def finish_verification(member: Member, auth_channel: Union[TextChannel, DMChannel],
+                              session: VerificationSession):
+    """
+    Waits for the outcome of the session, then grants the role (or not), cleans up and logs the attempt.
+    """
+    state = guild_states[member.guild.id]
+    mode = "dm" if is_dm_channel(auth_channel) else "channel"
+    random_code = session.code
+    random_emoji_unicode = session.emoji
+    responses = session.responses
+    expected = f"{random_code} {random_emoji_unicode}"
+    # Not known for sessions restored after a restart
+    requested_at = verification_requested_at.get((member.guild.id, member.id))
+
+    try:
+        response: Message = await session_manager.wait(session)
     except TimeoutError:
         # Tell the user they were too slow and delete the verification channel
-        await member.send(gets(String.VERIFY_FAILED_TIMEOUT))
-        await auth_channel.delete(reason=f"Verification for {member.name}#{member.discriminator} ({member.id}) "
-                                         f"failed: timeout")
+        metric_verifications_finished.inc(outcome="timeout")
+        lockout_table.record_failure(member.guild.id, member.id)
+        record_attempt(member, auth_channel, session, "timeout", requested_at)
+        scheduler.submit(Priority.NORMAL, lambda: member.send(gets(String.VERIFY_FAILED_TIMEOUT)))
+        await release_verification_channel(member, auth_channel, "failed: timeout")
 
         if len(responses) == 0:
-            if LOG_VERIFICATIONS_CONSOLE:
-                log.info(f"Member failed to verify (timeout): {member.name}#{member.discriminator} ({member.id}), "
-                         f"expected '{random_code} {random_emoji_unicode}', no responses")
+            log_verification(member, auth_channel, "timeout", expected, requested_at)
+
+            no_response = "*No response*" if session.response_count == 0 \
+                else f"*No response since the restart ({session.previous_responses} before it)*"
 
             embed = Embed(
                 title="User failed to verify (timeout)",
                 description=f"*Expected \"{random_code} {random_emoji_unicode}\"*\n"
-                            f"*No response*", color=Color.dark_red(),
+                            f"{no_response}", color=Color.dark_red(),
                 timestamp=datetime.now()
             )
         else:
@@ -206,9 +549,7 @@ async def begin_verification(member: Member):
             if len(trimmed) > 1000:
                 trimmed = f"{trimmed[:1000]}[...]"
 
-            if LOG_VERIFICATIONS_CONSOLE:
-                log.info(f"Member not verified (timeout): {member.name}#{member.discriminator} ({member.id}), "
-                         f"expected '{random_code} {random_emoji_unicode}', last response '{trimmed}'")
+            log_verification(member, auth_channel, "timeout", expected, requested_at, last_message.clean_content)
 
             embed = Embed(
                 title="Member failed to verify (timeout)",
@@ -217,23 +558,29 @@ async def begin_verification(member: Member):
                 timestamp=datetime.now()
             )
     else:
-        await response.add_reaction("✅")
+        scheduler.submit(Priority.COSMETIC, lambda: response.add_reaction("✅"))
 
         # Assign the full member role
-        full_role = await get_verified_role()
-        await member.add_roles(full_role, reason=f"Verification finished")
+        full_role = await state.get_verified_role()
+        await scheduler.run(Priority.CRITICAL, lambda: member.add_roles(full_role, reason=f"Verification finished"))
+        state.verified_index.add(member.id)
+        lockout_table.record_success(member.guild.id, member.id)
+        record_attempt(member, auth_channel, session, "verified", requested_at)
+
+        metric_verifications_finished.inc(outcome="verified")
+        if requested_at is not None:
+            metric_verification_seconds.observe(time.monotonic() - requested_at, mode=mode)
 
-        await member.send(gets(String.VERIFY_SUCCESS).format(user_mention=member.mention))
-        await auth_channel.delete(reason=f"Verification for {member.name}#{member.discriminator} ({member.id}) "
-                                         f"finished")
+        scheduler.submit(Priority.NORMAL, lambda: member.send(
+            gets(String.VERIFY_SUCCESS).format(user_mention=member.mention)
+        ))
+        await release_verification_channel(member, auth_channel, "finished")
 
         trimmed = response.clean_content
         if len(trimmed) > 1000:
             trimmed = f"{trimmed[:1000]}[...]"
 
-        if LOG_VERIFICATIONS_CONSOLE:
-            log.info(f"Member verified: {member.name}#{member.discriminator} ({member.id}) with message '{trimmed}' "
-                     f"(expected \"{random_code} {random_emoji_unicode}\")")
+        log_verification(member, auth_channel, "verified", expected, requested_at, response.clean_content)
 
         embed = Embed(
             title="Member verified",
@@ -241,45 +588,392 @@ async def begin_verification(member: Member):
                         f"```{trimmed}```", color=Color.green(),
             timestamp=datetime.now()
         )
-    finally:
-        # Remove the reaction on the main message
-        trigger_messsage = await get_verify_trigger_message()
-        await trigger_messsage.remove_reaction(VERIFICATION_TRIGGER_EMOJI, member)
-
-        # Send the log embed if enabled
-        log_channel = await get_logging_channel()
-        if log_channel is not None:
-            embed.set_footer(
-                text=f"Member: {member.name}#{member.discriminator} ({member.id})",
-                icon_url=member.avatar_url
-            )
 
-            await log_channel.send(embed=embed)
+    # Remove the reaction on the main message
+    trigger_messsage = await state.get_trigger_message()
+    scheduler.submit(Priority.COSMETIC, lambda: trigger_messsage.remove_reaction(state.config.trigger_emoji, member))
+
+    # Send the log embed if enabled
+    log_channel = await state.get_logging_channel()
+    if log_channel is not None:
+        embed.set_footer(
+            text=f"Member: {member.name}#{member.discriminator} ({member.id})",
+            icon_url=member.avatar_url
+        )
+
+        state.log_sink.add(embed)
+
+
+async def restore_verification_sessions():
+    """
+    Picks up the verification sessions that were still running when the bot stopped.
+    Expired sessions and ones whose member or channel are gone are dropped.
+    """
+    now = time.time()
+
+    restored = 0
+    dropped = []
+    for stored in await session_store.load():
+        key = (stored.guild_id, stored.member_id)
+        state = get_guild_state(stored.guild_id)
+
+        if stored.deadline <= now or state is None or session_manager.get_by_member(*key) is not None:
+            dropped.append(key)
+            continue
+
+        member = await state.get_member(stored.member_id)
+        channel = (await state.get_guild()).get_channel(stored.channel_id)
+        if channel is None and member is not None and VERIFICATION_MODE == "dm":
+            # Verifications in DMs are in the member's DM channel
+            dm_channel = member.dm_channel or await member.create_dm()
+            if dm_channel.id == stored.channel_id:
+                channel = dm_channel
+
+        if member is None or channel is None:
+            dropped.append(key)
+            continue
+
+        session = session_manager.restore(
+            stored.guild_id, stored.member_id, stored.channel_id, stored.code, stored.emoji, stored.deadline,
+            previous_responses=stored.responses
+        )
+        admission.start_now(member, lambda m, c=channel, s=session: finish_verification(m, c, s))
+        restored += 1
+
+    await session_store.discard(dropped)
+    log.info(f"Restored {restored} verification sessions, dropped {len(dropped)} expired or orphaned ones")
+
+
+async def catch_up_missed_reactions(state: GuildState):
+    """
+    Starts verifications for members who reacted to the trigger message while the bot couldn't see it.
+    """
+    async def fetch_trigger_message() -> Message:
+        # Not the cached message, the reactions have to be current
+        return await (await state.get_trigger_channel()).fetch_message(state.config.trigger_message_id)
+
+    def needs_verification(member_id: int) -> bool:
+        return member_id not in state.verified_index and not admission.is_pending(state.id, member_id)
+
+    state.catch_up.start(
+        state.get_member, fetch_trigger_message, state.config.trigger_emoji, needs_verification, request_verification
+    )
+
+
+admission = AdmissionQueue(MAX_CONCURRENT_VERIFICATIONS, run_verification, wait_histogram=metric_admission_wait_seconds)
+
+
+async def request_verification(member: Member) -> None:
+    """
+    Hands the member to the admission queue, which starts the verification as soon as there is room
+    (or to the worker processes if they are enabled). Members locked out after failed attempts are turned away.
+    """
+    locked_for = lockout_table.locked_for(member.guild.id, member.id)
+    if locked_for > 0:
+        log.info(f"Verification for {member.id} rejected, locked out for another {locked_for:.0f}s")
+        if lockout_table.should_notify(member.guild.id, member.id):
+            scheduler.submit(Priority.COSMETIC, lambda: member.send(
+                gets(String.VERIFICATION_LOCKED).format(user_mention=member.mention, seconds=math.ceil(locked_for))
+            ))
+        return
+
+    if job_queue is not None:
+        # Ignored by the queue if the member already has a verification job
+        job_queue.enqueue(JobKind.VERIFY, member.guild.id, member.id)
+        return
+
+    position = admission.submit(member)
+    if position is not None:
+        verification_requested_at[(member.guild.id, member.id)] = time.monotonic()
+
+    if position is None:
+        log.debug(f"Verification for {member.id} is already pending, ignoring request.")
+    elif position > 0:
+        log.info(f"Verification for {member.id} queued at #{position} ({admission.running} running)")
+        scheduler.submit(Priority.COSMETIC, lambda: member.send(
+            gets(String.VERIFICATION_QUEUED).format(user_mention=member.mention, position=position)
+        ))
+
+
+async def is_verification_pending(state: GuildState, member_id: int) -> bool:
+    if job_queue is not None:
+        return await job_queue.is_pending(JobKind.VERIFY, state.id, member_id)
+
+    return admission.is_pending(state.id, member_id)
+
+
+def forward_to_worker(message: Message):
+    """
+    Hands a message sent in a verification channel to the worker queue, the worker running that
+    verification picks it up from there.
+    """
+    if message.author.bot:
+        return
+
+    if message.guild is None:
+        # Answers to challenges sent by DM (the workers ignore DMs that don't belong to a verification)
+        if VERIFICATION_MODE == "dm":
+            job_queue.forward(message.channel.id, message.author.id, message.id, message.content)
+        return
+
+    state = get_guild_state(message.guild.id)
+    if state is None or getattr(message.channel, "category_id", None) != state.config.category_id:
+        return
+
+    if is_verification_channel_name(str(message.channel.name)):
+        job_queue.forward(message.channel.id, message.author.id, message.id, message.content)
+
+
+async def collect_worker_results():
+    """
+    Counts the verifications the workers finished in the metrics and prunes old jobs from the queue.
+    """
+    last_prune = 0.0
+    while job_queue.is_open:
+        await asyncio.sleep(1)
+
+        try:
+            for job in await job_queue.collect_finished():
+                if job.kind != JobKind.VERIFY:
+                    continue
+
+                outcome = job.result.get("outcome", "error") if job.status == JobStatus.DONE else "error"
+                mode = job.result.get("mode", "channel")
+                if outcome in ("verified", "timeout"):
+                    metric_verifications_started.inc(mode=mode)
+                metric_verifications_finished.inc(outcome=outcome)
+                if outcome == "verified":
+                    metric_verification_seconds.observe(job.result["duration"], mode=mode)
+                    lockout_table.record_success(job.guild_id, job.member_id)
+                elif outcome == "timeout":
+                    lockout_table.record_failure(job.guild_id, job.member_id)
+
+            counts = await job_queue.counts()
+            worker_job_counts.clear()
+            worker_job_counts.update(counts)
+
+            if time.monotonic() - last_prune > 3600:
+                last_prune = time.monotonic()
+                await job_queue.prune(job_age=24 * 3600, message_age=3600)
+        except Exception as e:
+            log.error(f"Could not collect the results of the workers: {e!r}")
 
 
 #############
-# Discord events
+# Config reload
 #############
-@bot.listen()
-async def on_ready():
-    # badly implement status lmao
-    #str(DISCORD_TYPE.lower())
+def reload_files():
+    """
+    Reloads data/strings.json and data/config.ini (on SIGHUP).
+    """
+    string_registry.reload()
+    config_registry.reload()
+
+
+async def apply_presence(config: Config):
+    """
+    Sets the status and activity of [Status].
+    """
+    if config.status_type == "watching":
+        activity = Activity(type=ActivityType.watching, name=config.status_name)
+    elif config.status_type == "playing":
+        activity = Game(name=config.status_name)
+    elif config.status_type == "listening":
+        activity = Activity(type=ActivityType.listening, name=config.status_name)
+    elif config.status_type == "streaming":
+        activity = Streaming(name=config.status_name, url=config.status_url)
+    else:
+        activity = None
+
+    await bot.change_presence(status=Status(config.member_status), activity=activity)
+
+
+async def apply_reloaded_presence(config: Config):
+    try:
+        await apply_presence(config)
+    except Exception as e:
+        log.error(f"Could not apply the reloaded status: {e!r}")
+
+
+async def apply_reloaded_guild_config(state: GuildState, changed: List[str]):
+    """
+    Catches up with reloaded guild settings that need more than invalidating the cached entities.
+    """
+    try:
+        if "role_id" in changed:
+            # The index is of the members with the old role
+            await state.build_verified_index(CACHE_MEMBERS)
+        if {"trigger_channel_id", "trigger_message_id", "trigger_emoji"}.intersection(changed):
+            trigger_message = await state.get_trigger_message()
+            await scheduler.run(Priority.COSMETIC, lambda: trigger_message.add_reaction(state.config.trigger_emoji))
+    except Exception as e:
+        log.error(f"Could not apply the reloaded settings of guild {state.id}: {e!r}")
+
+
+def apply_config(old: Config, new: Config):
+    """
+    Applies a reloaded config (see ConfigRegistry) to the running bot, the gateway connection stays up.
+    Options that need a restart keep their old value in new.
+    """
+    bot.command_prefix = new.bot_prefix
+    logging.getLogger().setLevel(getattr(logging, new.log_level, logging.INFO))
+    scheduler.follow_log_level()
+    lockout_table.configure(new.lockout_base, new.lockout_max, new.lockout_ttl)
+
+    presence = ("status_name", "status_type", "status_url", "member_status")
+    if bot.is_ready() and any(getattr(old, name) != getattr(new, name) for name in presence):
+        asyncio.ensure_future(apply_reloaded_presence(new))
+
+    for guild_id, state in guild_states.items():
+        changed = state.apply_config(new.guilds[guild_id])
+        if not changed:
+            continue
+
+        log.info(f"Applied the reloaded settings of guild {guild_id}: {', '.join(changed)}")
+        if bot.is_ready():
+            asyncio.ensure_future(apply_reloaded_guild_config(state, changed))
+
+
+config_registry.add_listener(apply_config)
+
+
+#############
+# Startup
+#############
+startup = StartupPipeline()
+
+
+@startup.stage("resolve entities")
+async def startup_resolve_entities():
+    async def resolve(state: GuildState):
+        guild = await state.get_guild()
+        if guild is None:
+            raise Exception(f"The bot is not in the configured guild {state.id}")
+
+        await state.get_trigger_channel()
+        await state.get_trigger_message()
+        await state.get_verified_role()
+        await state.get_logging_channel()
+
+        state.channel_pool.attach(guild, await state.get_category())
+
+    await for_each_guild(resolve)
+
+
+@startup.stage("verified index")
+async def startup_verified_index():
+    await for_each_guild(lambda state: state.build_verified_index(CACHE_MEMBERS))
+
+
+@startup.stage("captcha pool")
+async def startup_captcha_pool():
+    if captcha_pool is not None and not captcha_pool.running:
+        await captcha_pool.start()
+
+
+@startup.stage("audit store")
+async def startup_audit_store():
+    # Only once, on_ready also fires after reconnects
+    if audit_store is not None and not audit_store.is_open:
+        await audit_store.open()
+        background_tasks.append(
+            asyncio.ensure_future(audit_store.prune_periodically(AUDIT_RETENTION_DAYS * 86400))
+        )
+
+
+@startup.stage("restore sessions")
+async def startup_restore_sessions():
+    # Only once, on_ready also fires after reconnects
+    if job_queue is not None:
+        # The workers run the sessions, they stay in the queue while the bot restarts
+        if not job_queue.is_open:
+            await job_queue.open()
+            background_tasks.append(asyncio.ensure_future(collect_worker_results()))
+    elif not session_store.is_open:
+        await session_store.open()
+        await restore_verification_sessions()
+
+
+# Guilds whose leftover verification channels were already cleaned up
+cleaned_up_guilds: Set[int] = set()
+
+
+@startup.stage("cleanup")
+async def startup_cleanup():
+    async def delete(ch: TextChannel):
+        log.warning(f"Deleting stale verification channel: {ch.name} ({ch.id})")
+        try:
+            await scheduler.run(Priority.NORMAL, lambda: ch.delete(reason="Cleaning stale verification channels on start."))
+        except HTTPException as e:
+            log.warning(f"Could not delete stale verification channel {ch.id}: {e}")
+
+    # Channels of verifications running in the worker processes
+    worker_channels = await job_queue.active_channels() if job_queue is not None else set()
+
+    # Adopt orphaned verification channels into the pool (or delete them if the pool is full)
+    async def clean(state: GuildState):
+        # Only once, on_ready also fires after reconnects (and verifications are running by then)
+        if state.id in cleaned_up_guilds:
+            return
+        cleaned_up_guilds.add(state.id)
+
+        channel_pool = state.channel_pool
+        auth_category = await state.get_category()
+
+        orphaned = [
+            ch for ch in auth_category.text_channels
+            # Make sure they match verification-<4digits> and don't belong to a live session
+            if is_verification_channel_name(str(ch.name)) and session_manager.get_by_channel(ch.id) is None
+            and ch.id not in worker_channels and not channel_pool.owns(ch.id)
+        ]
+        to_adopt = orphaned[:channel_pool.room]
+        to_delete = orphaned[len(to_adopt):]
+
+        async def adopt(ch: TextChannel):
+            if not await channel_pool.adopt(ch):
+                await delete(ch)
 
-    if(DISCORD_TYPE == "watching"):
-        await bot.change_presence(status=Status(DISCORD_STATUS), activity=Activity(type=ActivityType.watching, name=DISCORD_STATUS_NAME))
+        await gather_bounded(STARTUP_CLEANUP_CONCURRENCY, to_adopt, adopt)
+        await gather_bounded(STARTUP_CLEANUP_CONCURRENCY, to_delete, delete)
 
-    elif(DISCORD_TYPE == "playing"):
-        await bot.change_presence(status=Status(DISCORD_STATUS), activity=Game(name=DISCORD_STATUS_NAME))
+        channel_pool.refill()
 
-    elif(DISCORD_TYPE == "listening"):
-        await bot.change_presence(status=Status(DISCORD_STATUS), activity=Activity(type=ActivityType.listening, name=DISCORD_STATUS_NAME))
+    await for_each_guild(clean)
 
-    elif(DISCORD_TYPE == "streaming"):
-        await bot.change_presence(status=Status(DISCORD_STATUS), activity=Streaming(name=DISCORD_STATUS_NAME, url=DISCORD_TWITCH))
 
-    log.info(f"Bot is ready: logged in as {bot.user.name} ({bot.user.id})")
+@startup.stage("trigger reaction")
+async def startup_trigger_reaction():
+    # Puts up the first reaction on the trigger messages
+    async def react(state: GuildState):
+        trigger_message = await state.get_trigger_message()
+        await trigger_message.add_reaction(state.config.trigger_emoji)
+
+    await for_each_guild(react)
+
+
+@startup.stage("presence")
+async def startup_presence():
+    config = config_registry.config
+    # Without a status configured, the default (online, no activity) is left alone
+    if config.status_type or config.member_status != "online":
+        await apply_presence(config)
+
+
+@startup.stage("memory report")
+async def startup_memory_report():
+    current, peak = process_memory()
+    cached = ", ".join(f"{count} {kind}" for kind, count in cache_report(bot).items())
+    log.info(f"Memory: {current:.1f} MiB resident (peak {peak:.1f} MiB), cached: {cached}")
+
+
+#############
+# Discord events
+#############
+@bot.listen()
+async def on_ready():
+    log.info(f"Connected: logged in as {bot.user.name} ({bot.user.id})")
     log.info("Checking for Pterodactyl...")
-    if(str(sys.argv[1]) == 'ptero'):
+    if len(sys.argv) > 1 and sys.argv[1] == 'ptero':
         log.info("Pterodactyl Detected!")
     else:
         log.info("Pterodactyl not found.")
@@ -287,117 +981,311 @@ async def on_ready():
     # Really make sure the internal cache is ready
     await bot.wait_until_ready()
 
-    # Delete all stale verification channels on start
-    auth_category = find_category_by_id(await get_main_guild(), VERIFICATION_CHANNEL_CATEGORY_ID)
-    if not auth_category:
-        raise Exception(f"Could not find category with ID {VERIFICATION_CHANNEL_CATEGORY_ID}")
+    await startup.run()
+    log.info(f"Bot is ready: logged in as {bot.user.name} ({bot.user.id}), verifying in {len(guild_states)} guilds")
 
-    for ch in auth_category.text_channels:
-        # Make sure they match verification-<4digits>
-        if len(ch.name) != len("verification-1234"):
-            return
-        if not str(ch.name).startswith("verification-"):
-            return
+    await for_each_guild(catch_up_missed_reactions)
+
+
+@bot.listen()
+async def on_resumed():
+    # Reactions might have been missed while reconnecting
+    if startup.ready:
+        await for_each_guild(catch_up_missed_reactions)
 
-        log.warning(f"Deleting stale verification channel: {ch.name} ({ch.id})")
-        await ch.delete(reason="Cleaning stale verification channels on start.")
 
-    # Puts up the first reaction on the trigger message
-    trigger_message = await get_verify_trigger_message()
-    await trigger_message.add_reaction(VERIFICATION_TRIGGER_EMOJI)
+if gateway_recorder is not None or not CACHE_MEMBERS:
+    # Only registered when needed, discord.py dispatches this for every single gateway payload
+    @bot.listen()
+    async def on_socket_response(payload: dict):
+        # Runs before the event is parsed, so the verification session an answer belongs to is still open
+        if gateway_recorder is not None:
+            gateway_recorder.handle(payload)
+        if not CACHE_MEMBERS:
+            route_member_payload(payload)
+
+
+# Invalidate cached entities when Discord tells us they changed
+@bot.listen()
+async def on_guild_update(_before: Guild, after: Guild):
+    entity_cache.handle_event("guild_update", after.id)
+
+
+@bot.listen()
+async def on_guild_remove(guild: Guild):
+    entity_cache.handle_event("guild_remove", guild.id)
 
 
 @bot.listen()
+async def on_guild_channel_update(_before: TextChannel, after: TextChannel):
+    entity_cache.handle_event("guild_channel_update", after.id)
+
+
+@bot.listen()
+async def on_guild_channel_delete(channel: TextChannel):
+    entity_cache.handle_event("guild_channel_delete", channel.id)
+
+
+@bot.listen()
+async def on_guild_role_update(_before: Role, after: Role):
+    entity_cache.handle_event("guild_role_update", after.id)
+
+
+@bot.listen()
+async def on_guild_role_delete(role: Role):
+    entity_cache.handle_event("guild_role_delete", role.id)
+
+
+@bot.listen()
+async def on_raw_message_edit(payload: RawMessageUpdateEvent):
+    entity_cache.handle_event("message_edit", payload.message_id)
+
+
+@bot.listen()
+async def on_raw_message_delete(payload: RawMessageDeleteEvent):
+    entity_cache.handle_event("message_delete", payload.message_id)
+
+
+@bot.listen()
+@metric_event_seconds.time(event="member_join")
 async def on_member_join(member: Member):
+    state = get_guild_state(member.guild.id)
+    if state is None:
+        return
+
     # Send a DM instructing the member to get verified
-    auth_channel = await get_verify_trigger_channel()
+    auth_channel = await state.get_trigger_channel()
 
     formatted = gets(String.ON_MEMBER_JOIN).format(user_mention=member.mention, channel_mention=auth_channel.mention)
-    await member.send(formatted)
+    scheduler.submit(Priority.COSMETIC, lambda: member.send(formatted))
+
+
+@bot.listen()
+@metric_event_seconds.time(event="member_update")
+async def on_member_update(before: Member, after: Member):
+    # Keep the verified index in sync with role changes made by anyone
+    state = get_guild_state(after.guild.id)
+    if before.roles == after.roles or state is None:
+        return
+
+    verified_role = await state.get_verified_role()
+    if verified_role in after.roles:
+        state.verified_index.add(after.id)
+    else:
+        state.verified_index.discard(after.id)
+
+
+@bot.listen()
+@metric_event_seconds.time(event="member_remove")
+async def on_member_remove(member: Member):
+    state = get_guild_state(member.guild.id)
+    if state is not None:
+        state.verified_index.discard(member.id)
 
 
 @bot.listen()
+@metric_event_seconds.time(event="message")
+async def on_message(message: Message):
+    # Route replies straight to the verification session of that channel
+    if job_queue is not None:
+        forward_to_worker(message)
+    else:
+        session_manager.dispatch(message)
+
+
+@bot.listen()
+@metric_event_seconds.time(event="raw_reaction_add")
 async def on_raw_reaction_add(payload: RawReactionActionEvent):
-    # Ignore all "official" bots
-    if payload.member.bot:
+    # Route by guild (reactions in DMs have none)
+    state = get_guild_state(payload.guild_id)
+    if state is None:
         return
 
-    # Check if it matches with the correct message
-    if payload.message_id != VERIFICATION_TRIGGER_MESSAGE_ID:
+    # Ignore all "official" bots
+    if payload.member.bot:
         return
 
-    # Check if the emoji is correct
-    if str(payload.emoji) != VERIFICATION_TRIGGER_EMOJI:
+    # Check if it matches with the correct message and emoji
+    if not state.is_trigger(payload.message_id, str(payload.emoji)):
         return
 
     # Check if user is already authenticated
-    full_role = await get_verified_role()
-    if full_role in payload.member.roles:
+    if await state.is_verified(payload.member):
         log.debug(f"User {payload.member.name}#{payload.member.discriminator} "
                   f"is already authenticated, ignoring reaction.")
         return
 
     # Begin the verification
-    log.info(f"Got new verification request: user {payload.user_id}")
-    await begin_verification(payload.member)
+    log.info(f"Got new verification request: user {payload.user_id} in guild {payload.guild_id}")
+    await request_verification(payload.member)
 
 
 #############
 # Dangerous commands
 #############
-@check_any(decorate_check(is_server_owner), decorate_check(is_special_user))
-@bot.command(name="verifyall", brief="Give every member the verified role (owner only)")
-async def cmd_verifyall(ctx: Context):
-    verified_role = await get_verified_role()
-
-    msg = await ctx.send(gets(String.VERIFYALL_CONFIRMATION).format(verified_role_name=verified_role.name, emoji=StandardEmoji.OK))
+async def wait_for_owner_confirmation(ctx: Context, confirmation: str) -> bool:
+    """
+    Sends the confirmation message and waits for the server owner to react to it.
+    :return: True if confirmed in time
+    """
+    msg = await ctx.send(confirmation)
     await msg.add_reaction(UnicodeEmoji.OK)
 
-    try:
-        def is_confirmation(reaction: Reaction, member: Member):
-            if reaction.message.id != msg.id:
-                return False
+    # Raw event, the message cache might be disabled
+    def is_confirmation(payload: RawReactionActionEvent):
+        if payload.message_id != msg.id:
+            return False
 
-            if member.id != member.guild.owner.id:
-                return False
+        if payload.user_id != ctx.guild.owner_id:
+            return False
 
-            if reaction.emoji != UnicodeEmoji.OK:
-                return False
+        if str(payload.emoji) != UnicodeEmoji.OK:
+            return False
 
-            return True
+        return True
 
-        _reaction, _user = await bot.wait_for("reaction_add", timeout=30, check=is_confirmation)
+    try:
+        await bot.wait_for("raw_reaction_add", timeout=30, check=is_confirmation)
     except TimeoutError:
         await ctx.send(gets(String.VERIFYALL_TIMEOUT))
+        return False
+
+    return True
+
+
+async def get_command_guild_state(ctx: Context) -> Optional[GuildState]:
+    """
+    :return: State of the guild the command was sent in (None and tells the user if it isn't configured)
+    """
+    state = get_guild_state(ctx.guild.id if ctx.guild is not None else None)
+    if state is None:
+        await ctx.send(gets(String.GUILD_NOT_CONFIGURED))
+
+    return state
+
+
+async def run_bulk_role_job_on_worker(job: BulkRoleJob,
+                                     report: Callable[[BulkRoleProgress], Awaitable[None]]) -> Optional[BulkRoleProgress]:
+    """
+    Hands the bulk role job to a worker process and reports its progress until it is finished.
+    :return: Final progress, None if another bulk role job is already running in the guild
+    """
+    # One bulk role job per guild, the member ID of the job is always 0
+    job_id = await job_queue.submit(JobKind.BULK_ROLE, job.guild.id, 0, {
+        "role_id": job.role.id, "mode": job.mode, "reason": job.reason
+    })
+    if job_id is None:
+        return None
+
+    while True:
+        await asyncio.sleep(BULK_ROLE_PROGRESS_INTERVAL)
+
+        queued = await job_queue.get(job_id)
+        current = BulkRoleProgress.from_dict(queued.result)
+        if queued.status in JobStatus.FINISHED:
+            if queued.status == JobStatus.FAILED:
+                log.error(f"Bulk role job {job_id} failed: {queued.result.get('error')}")
+            return current
+
+        await report(current)
+
+
+async def run_bulk_role_command(ctx: Context, mode: str, option: Optional[str]):
+    """
+    Shared implementation of !verifyall and !unverifyall.
+    """
+    state = await get_command_guild_state(ctx)
+    if state is None:
+        return
+
+    verified_index = state.verified_index
+    verified_role = await state.get_verified_role()
+    dry_run = option == "--dry-run"
+
+    if mode == BulkRoleMode.ADD:
+        confirmation, starting, done = \
+            String.VERIFYALL_CONFIRMATION, String.VERIFYALL_STARTING, String.VERIFYALL_DONE
     else:
-        VERIFYALL_STARTING = gets(String.VERIFYALL_STARTING)
-        VERIFYALL_PROGRESS = gets(String.VERIFYALL_PROGRESS)
-        VERIFYALL_DONE = gets(String.VERIFYALL_DONE)
+        confirmation, starting, done = \
+            String.UNVERIFYALL_CONFIRMATION, String.UNVERIFYALL_STARTING, String.UNVERIFYALL_DONE
+
+    job = BulkRoleJob(
+        ctx.guild, verified_role, mode, scheduler,
+        checkpoint_directory=BULK_ROLE_CHECKPOINT_DIRECTORY,
+        concurrency=BULK_ROLE_CONCURRENCY,
+        dry_run=dry_run,
+        reason=f"!{ctx.command.name}"
+    )
 
-        progress = await ctx.send(
-            VERIFYALL_STARTING + VERIFYALL_PROGRESS.format(current=0, total=ctx.guild.member_count)
-        )
+    # Only go through the members that need changing if the verified index knows who they are
+    members = None
+    total = ctx.guild.member_count
+    # (and all members are cached, otherwise the job pages through the member list itself, as it does on a worker)
+    if verified_index.ready and ctx.guild.chunked and job_queue is None:
+        if mode == BulkRoleMode.ADD:
+            members = verified_index.missing(ctx.guild.members)
+        else:
+            members = verified_index.present(ctx.guild.members)
+        total = len(members)
+
+    if dry_run:
+        result = await job.run(members)
+        await ctx.send(gets(String.BULK_ROLE_DRY_RUN).format(
+            total_changed=result.changed, total_skipped=result.skipped, total=result.processed
+        ))
+        return
 
-        count = 0
-        errored = 0
-        async for member in ctx.guild.fetch_members(limit=None):
-            try:
-                await member.add_roles(verified_role, reason="!verifyall")
-            except HTTPException:
-                errored += 1
-            else:
-                count += 1
-
-            if count % 10 == 0:
-                await progress.edit(
-                    content=VERIFYALL_STARTING + VERIFYALL_PROGRESS.format(current=count, total=ctx.guild.member_count)
-                )
-
-        await progress.edit(
-            content=VERIFYALL_STARTING + VERIFYALL_DONE.format(
-                verified_role_name=verified_role.name, total_done=count, total_errored=errored
-            )
+    if job_queue is not None and await job_queue.is_pending(JobKind.BULK_ROLE, ctx.guild.id, 0):
+        await ctx.send(gets(String.BULK_ROLE_ALREADY_RUNNING))
+        return
+
+    confirmed = await wait_for_owner_confirmation(
+        ctx, gets(confirmation).format(verified_role_name=verified_role.name, emoji=StandardEmoji.OK)
+    )
+    if not confirmed:
+        return
+
+    BULK_STARTING = gets(starting)
+    if job.load_checkpoint():
+        BULK_STARTING += gets(String.BULK_ROLE_RESUMING).format(current=job.progress.processed)
+    BULK_PROGRESS = gets(String.VERIFYALL_PROGRESS)
+    BULK_DONE = gets(done)
+
+    progress = await ctx.send(
+        BULK_STARTING + BULK_PROGRESS.format(current=job.progress.processed, total=total)
+    )
+
+    async def report(current: BulkRoleProgress):
+        # Edits of the same message coalesce, only the latest progress is sent if they pile up
+        scheduler.submit(Priority.COSMETIC, lambda: progress.edit(
+            content=BULK_STARTING + BULK_PROGRESS.format(current=current.processed, total=total)
+        ), key=("edit", progress.id))
+
+    if job_queue is not None:
+        # The worker pages through the member list itself
+        result = await run_bulk_role_job_on_worker(job, report)
+        if result is None:
+            await ctx.send(gets(String.BULK_ROLE_ALREADY_RUNNING))
+            return
+    else:
+        reporter = asyncio.ensure_future(report_progress_periodically(job, BULK_ROLE_PROGRESS_INTERVAL, report))
+        try:
+            result = await job.run(members)
+        finally:
+            reporter.cancel()
+
+    await scheduler.run(Priority.COSMETIC, lambda: progress.edit(
+        content=BULK_STARTING + BULK_DONE.format(
+            verified_role_name=verified_role.name, total_done=result.changed,
+            total_skipped=result.skipped, total_errored=result.errored
         )
+    ), key=("edit", progress.id))
+
+
+@check_any(decorate_check(is_server_owner), decorate_check(is_special_user))
+@bot.command(name="verifyall", brief="Give every member the verified role (owner only)")
+async def cmd_verifyall(ctx: Context, option: Optional[str] = None):
+    await run_bulk_role_command(ctx, BulkRoleMode.ADD, option)
 
 
 @cmd_verifyall.error
@@ -405,27 +1293,218 @@ async def cmd_verifyall_error(ctx: Context, _: CheckFailure):
     await ctx.send(gets(String.CMD_NOT_ALLOWED_FOR_USER))
 
 
+@check_any(decorate_check(is_server_owner), decorate_check(is_special_user))
+@bot.command(name="unverifyall", brief="Remove the verified role from every member (owner only)")
+async def cmd_unverifyall(ctx: Context, option: Optional[str] = None):
+    await run_bulk_role_command(ctx, BulkRoleMode.REMOVE, option)
+
+
+@cmd_unverifyall.error
+async def cmd_unverifyall_error(ctx: Context, _: CheckFailure):
+    await ctx.send(gets(String.CMD_NOT_ALLOWED_FOR_USER))
+
+
+def trim_code_block(text: str, limit: int = 1500, keep_end: bool = False) -> str:
+    """
+    Shortens text so a message with it in a code block stays under Discord's message length limit.
+    """
+    text = text.strip().replace("```", "'''")
+    if len(text) <= limit:
+        return text
+
+    return f"[...]{text[-limit:]}" if keep_end else f"{text[:limit]}[...]"
+
+
+@check_any(decorate_check(is_server_owner), decorate_check(is_special_user))
+@bot.group(name="diag", brief="Event loop lag and stalls, profiling and memory tracing (owner only)",
+           invoke_without_command=True)
+async def cmd_diag(ctx: Context):
+    stats = loop_monitor.stats()
+    await ctx.send(gets(String.DIAG_LAG).format(threshold=loop_monitor.stall_threshold * 1000, **stats))
+
+    stall = loop_monitor.longest_stall()
+    if stall is None:
+        await ctx.send(gets(String.DIAG_NO_STALLS))
+    else:
+        # The innermost frames are the interesting ones
+        await ctx.send(gets(String.DIAG_STALL).format(
+            duration=stall.duration * 1000, stack=trim_code_block(stall.stack, keep_end=True)
+        ))
+
+
+@cmd_diag.error
+async def cmd_diag_error(ctx: Context, _: CheckFailure):
+    await ctx.send(gets(String.CMD_NOT_ALLOWED_FOR_USER))
+
+
+# Subcommands don't run the group's checks (because of invoke_without_command), they need their own
+@check_any(decorate_check(is_server_owner), decorate_check(is_special_user))
+@cmd_diag.command(name="profile", brief="Profile the bot for a number of seconds")
+async def cmd_diag_profile(ctx: Context, seconds: float = 10):
+    if profiler.running:
+        await ctx.send(gets(String.DIAG_PROFILE_RUNNING))
+        return
+
+    seconds = min(max(seconds, 1), 300)
+    await ctx.send(gets(String.DIAG_PROFILE_STARTED).format(seconds=seconds))
+
+    path, summary = await profiler.profile(seconds)
+    await ctx.send(gets(String.DIAG_PROFILE_DONE).format(path=path, summary=trim_code_block(summary)))
+
+
+@cmd_diag_profile.error
+async def cmd_diag_profile_error(ctx: Context, _: CheckFailure):
+    await ctx.send(gets(String.CMD_NOT_ALLOWED_FOR_USER))
+
+
+@check_any(decorate_check(is_server_owner), decorate_check(is_special_user))
+@cmd_diag.command(name="mem", brief="Trace memory allocations and show what grew since the last run")
+async def cmd_diag_mem(ctx: Context, option: Optional[str] = None):
+    if option == "stop":
+        memory_tracer.stop()
+        await ctx.send(gets(String.DIAG_MEMORY_STOPPED))
+    elif not memory_tracer.tracing:
+        memory_tracer.start()
+        await ctx.send(gets(String.DIAG_MEMORY_STARTED))
+    else:
+        current, peak, top = await memory_tracer.diff()
+        await ctx.send(gets(String.DIAG_MEMORY_DIFF).format(current=current, peak=peak, top=trim_code_block(top)))
+
+
+@cmd_diag_mem.error
+async def cmd_diag_mem_error(ctx: Context, _: CheckFailure):
+    await ctx.send(gets(String.CMD_NOT_ALLOWED_FOR_USER))
+
+
+def format_audit_entries(entries: List[AuditEntry], with_member: bool) -> str:
+    """
+    :return: The attempts as plain text lines, for a code block
+    """
+    lines = []
+    for entry in entries:
+        finished = datetime.utcfromtimestamp(entry.finished).strftime("%Y-%m-%d %H:%M:%S UTC")
+        took = f" after {entry.duration:.1f}s" if entry.duration is not None else ""
+        member = f"{entry.member_name} ({entry.member_id}) " if with_member else ""
+        lines.append(f"{finished} {member}{entry.outcome}{took} ({entry.mode})")
+
+        if entry.expected is not None:
+            lines.append(f"  expected: {entry.expected}")
+        if entry.responses:
+            label = "error" if entry.outcome == "error" else f"answers ({entry.response_count})"
+            lines.append(f"  {label}: " + " | ".join(response.replace("\n", " ") for response in entry.responses))
+
+    return trim_code_block("\n".join(lines))
+
+
+@check_any(decorate_check(is_server_owner), decorate_check(is_special_user))
+@bot.command(name="verifylog", brief="Verification attempts of a member or since a time (owner only)")
+async def cmd_verifylog(ctx: Context, target: Optional[str] = None, since: Optional[str] = None):
+    state = await get_command_guild_state(ctx)
+    if state is None:
+        return
+
+    if audit_store is None or not audit_store.is_open:
+        await ctx.send(gets(String.VERIFYLOG_DISABLED))
+        return
+
+    # Include the attempts that haven't been written yet
+    await audit_store.flush()
+
+    if target == "--since":
+        seconds = parse_duration(since) if since is not None else 86400
+        if seconds is None:
+            await ctx.send(gets(String.VERIFYLOG_USAGE))
+            return
+
+        started = time.time() - seconds
+        entries = await audit_store.since(state.id, started)
+        outcomes = await audit_store.outcomes_since(state.id, started)
+        if not entries:
+            await ctx.send(gets(String.VERIFYLOG_EMPTY))
+            return
+
+        await ctx.send(gets(String.VERIFYLOG_SINCE).format(
+            since=datetime.utcfromtimestamp(started).strftime("%Y-%m-%d %H:%M UTC"),
+            verified=outcomes.get("verified", 0), timeout=outcomes.get("timeout", 0), error=outcomes.get("error", 0),
+            count=len(entries), entries=format_audit_entries(entries, with_member=True)
+        ))
+        return
+
+    member_id = parse_user_id(target) if target is not None else None
+    if member_id is None:
+        await ctx.send(gets(String.VERIFYLOG_USAGE))
+        return
+
+    entries = await audit_store.member_history(state.id, member_id)
+    if not entries:
+        await ctx.send(gets(String.VERIFYLOG_EMPTY))
+        return
+
+    await ctx.send(gets(String.VERIFYLOG_MEMBER).format(
+        user_mention=f"<@{member_id}>", count=len(entries), entries=format_audit_entries(entries, with_member=False)
+    ))
+
+
+@cmd_verifylog.error
+async def cmd_verifylog_error(ctx: Context, _: CheckFailure):
+    await ctx.send(gets(String.CMD_NOT_ALLOWED_FOR_USER))
+
+
 #############
 # Normal commands
 #############
 @bot.command(name="verify", brief="Verify yourself if you haven't already")
 async def cmd_verify(ctx: Context):
-    verified_role = await get_verified_role()
+    state = await get_command_guild_state(ctx)
+    if state is None:
+        return
 
-    if verified_role in ctx.author.roles:
+    if await state.is_verified(ctx.author):
         await ctx.send(gets(String.MANUAL_VERIFICATION_NO_NEED).format(user_mention=ctx.author.mention))
+    elif await is_verification_pending(state, ctx.author.id):
+        await ctx.send(gets(String.MANUAL_VERIFICATION_PENDING).format(user_mention=ctx.author.mention))
     else:
+        locked_for = lockout_table.locked_for(state.id, ctx.author.id)
+        if locked_for > 0:
+            await ctx.send(gets(String.VERIFICATION_LOCKED).format(user_mention=ctx.author.mention,
+                                                                    seconds=math.ceil(locked_for)))
+            return
+
         await ctx.send(gets(String.MANUAL_VERIFICATION).format(user_mention=ctx.author.mention))
-        await begin_verification(ctx.author)
+        await request_verification(ctx.author)
 
 
 @bot.command(name="unverify", brief="Remove the verified role from yourself")
 async def cmd_removerole(ctx: Context):
-    success_role = await get_verified_role()
+    state = await get_command_guild_state(ctx)
+    if state is None:
+        return
+
+    success_role = await state.get_verified_role()
     author: Member = ctx.author
 
-    await author.remove_roles(success_role)
-    await ctx.message.add_reaction("✅")
+    await scheduler.run(Priority.CRITICAL, lambda: author.remove_roles(success_role))
+    state.verified_index.discard(author.id)
+    scheduler.submit(Priority.COSMETIC, lambda: ctx.message.add_reaction("✅"))
+
+
+@bot.command(name="verifystats", brief="How many members are verified")
+async def cmd_verifystats(ctx: Context):
+    state = await get_command_guild_state(ctx)
+    if state is None:
+        return
+
+    verified_index = state.verified_index
+    verified = len(verified_index)
+    total = (await state.get_guild()).member_count
+
+    await ctx.send(gets(String.VERIFYSTATS).format(
+        verified=verified,
+        unverified=max(total - verified, 0),
+        percentage=round(verified / total * 100, 1) if total else 0,
+        growth_day=verified_index.growth(24 * 3600),
+        growth_week=verified_index.growth(7 * 24 * 3600),
+    ))
 
 
 @bot.command(name="ping", brief="The bot responds if alive")
@@ -437,5 +1516,20 @@ async def cmd_ping(ctx: Context):
 async def cmd_about(ctx: Context):
     await ctx.send(gets(String.BOT_ABOUT).format(bot_mention=bot.user.mention, bot_version=__version__))
 
+
 # Run everything
-bot.run(BOT_TOKEN)
+if __name__ == "__main__":
+    log_pipeline.start(
+        level=getattr(logging, LOG_LEVEL, logging.INFO),
+        file=LOG_FILE, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS, queue_size=LOG_QUEUE_SIZE
+    )
+    scheduler.follow_log_level()
+    log.info(f"Special users: {', '.join([str(a) for a in SPECIAL_USERS_IDS])}")
+    if gateway_recorder is not None:
+        log.info(f"Recording gateway events to {RECORD_GATEWAY_EVENTS}")
+
+    try:
+        bot.run(BOT_TOKEN)
+    finally:
+        log_pipeline.stop()
+
@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from androidroot.admission import AdmissionQueue
+from androidroot.metrics import Histogram
+
+
+def member(member_id: int, guild_id: int = 1):
+    return SimpleNamespace(id=member_id, guild=SimpleNamespace(id=guild_id))
+
+
+class AdmissionQueueTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.gates = {}
+        self.started = []
+        self.histogram = Histogram("admission_wait_seconds", "", buckets=(0, 1))
+        self.queue = AdmissionQueue(2, self.verify, wait_histogram=self.histogram)
+
+    async def asyncTearDown(self):
+        # Lets the verifications that are still running (and waiting) end
+        while self.queue.running:
+            for gate in list(self.gates.values()):
+                gate.set()
+            await asyncio.sleep(0)
+
+    async def verify(self, m):
+        self.started.append(m.id)
+        gate = self.gates.setdefault(m.id, asyncio.Event())
+        await gate.wait()
+
+    async def finish(self, member_id: int):
+        self.gates.setdefault(member_id, asyncio.Event()).set()
+        # Let the verification end and the next one start
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+    async def test_runs_up_to_concurrency(self):
+        positions = [self.queue.submit(member(i)) for i in range(4)]
+        await asyncio.sleep(0)
+
+        self.assertEqual(positions, [0, 0, 1, 2])
+        self.assertEqual(self.queue.running, 2)
+        self.assertEqual(self.queue.depth, 2)
+        self.assertEqual(self.started, [0, 1])
+
+    async def test_waiting_start_in_order(self):
+        for i in range(4):
+            self.queue.submit(member(i))
+        await asyncio.sleep(0)
+
+        await self.finish(1)
+        self.assertEqual(self.started, [0, 1, 2])
+        self.assertEqual((self.queue.running, self.queue.depth), (2, 1))
+
+        await self.finish(0)
+        await self.finish(2)
+        await self.finish(3)
+        self.assertEqual(self.started, [0, 1, 2, 3])
+        self.assertEqual((self.queue.running, self.queue.depth), (0, 0))
+        self.assertEqual(self.queue.peak_depth, 2)
+
+    async def test_repeated_requests_collapse(self):
+        self.queue.submit(member(1))
+        self.queue.submit(member(2))
+        self.queue.submit(member(3))
+
+        # Running and waiting members
+        self.assertIsNone(self.queue.submit(member(1)))
+        self.assertIsNone(self.queue.submit(member(3)))
+        # Same member in another guild is a separate request
+        self.assertEqual(self.queue.submit(member(1, guild_id=2)), 2)
+
+        self.assertEqual(self.queue.collapsed, 2)
+        self.assertEqual(self.queue.admitted, 4)
+        self.assertTrue(self.queue.is_pending(1, 3))
+        self.assertFalse(self.queue.is_pending(1, 4))
+
+    async def test_failed_verification_frees_slot(self):
+        async def fail(m):
+            raise RuntimeError("broken")
+
+        queue = AdmissionQueue(1, fail)
+        queue.submit(member(1))
+        queue.submit(member(2))
+
+        with self.assertLogs("androidroot.admission", "ERROR"):
+            for _ in range(3):
+                await asyncio.sleep(0)
+
+        self.assertEqual((queue.running, queue.depth), (0, 0))
+
+    async def test_start_now_ignores_limit(self):
+        self.queue.submit(member(1))
+        self.queue.submit(member(2))
+        self.queue.start_now(member(3), self.verify)
+        await asyncio.sleep(0)
+
+        self.assertEqual(self.queue.running, 3)
+        self.assertEqual(self.queue.depth, 0)
+
+    async def test_wait_histogram(self):
+        for i in range(3):
+            self.queue.submit(member(i))
+        await asyncio.sleep(0)
+        await self.finish(0)
+
+        samples = {labels + name: value for name, labels, value in self.histogram.samples()}
+        # Two started right away, one after waiting
+        self.assertEqual(samples['{le="0"}_bucket'], 2)
+        self.assertEqual(samples["_count"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
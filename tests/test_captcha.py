@@ -0,0 +1,34 @@
+import asyncio
+import unittest
+from io import BytesIO
+
+from androidroot import captcha
+from androidroot.captcha import CaptchaPool, render_captcha
+
+
+@unittest.skipUnless(captcha.is_available(), "needs Pillow (poetry install -E captcha)")
+class RenderCaptchaTest(unittest.TestCase):
+    def test_built_in_font(self):
+        # font = None in [Captcha], the built-in font is a bitmap font before Pillow 10.1
+        image = captcha.Image.open(BytesIO(render_captcha("AB23", seed=1, font_path=None)))
+
+        self.assertEqual(image.format, "PNG")
+        self.assertEqual(image.size, (captcha.WIDTH, captcha.HEIGHT))
+
+    def test_pool_start(self):
+        async def start_and_take():
+            pool = CaptchaPool(2, 1, processes=1, font_path=None)
+            await pool.start()
+            try:
+                return await pool.take()
+            finally:
+                await pool.close()
+
+        code, image = asyncio.run(start_and_take())
+
+        self.assertEqual(len(code), 4)
+        self.assertTrue(image.startswith(b"\x89PNG"))
+
+
+if __name__ == "__main__":
+    unittest.main()
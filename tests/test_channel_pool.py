@@ -0,0 +1,157 @@
+import asyncio
+import itertools
+import unittest
+from types import SimpleNamespace
+
+from discord.errors import HTTPException
+
+from androidroot import channel_pool
+from androidroot.channel_pool import ChannelPool
+from androidroot.scheduler import ActionScheduler
+
+_ids = itertools.count(1000)
+
+
+class FakeChannel:
+    def __init__(self, guild=None):
+        self.id = next(_ids)
+        self.name = "verification-1234"
+        self.guild = guild
+        self.fail = False
+        self.deleted = False
+
+    async def _call(self):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise HTTPException(SimpleNamespace(status=500, reason="Internal Server Error"), "failed")
+
+    async def set_permissions(self, *args, **kwargs):
+        await self._call()
+
+    async def purge(self, **kwargs):
+        await self._call()
+
+    async def edit(self, **kwargs):
+        await self._call()
+
+    async def delete(self, **kwargs):
+        await asyncio.sleep(0)
+        self.deleted = True
+
+
+class FakeGuild:
+    def __init__(self):
+        self.me = None
+        self.default_role = None
+        self.created = []
+
+    async def create_text_channel(self, *args, **kwargs):
+        await asyncio.sleep(0.01)
+        channel = FakeChannel(self)
+        self.created.append(channel)
+        return channel
+
+
+def member(member_id: int):
+    return SimpleNamespace(id=member_id, discriminator="0001")
+
+
+class ChannelPoolTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # PermissionOverwrite needs a real guild member and role as keys
+        self._hidden_overwrites = channel_pool.hidden_overwrites
+        channel_pool.hidden_overwrites = lambda guild: {}
+
+        self.guild = FakeGuild()
+        self.pool = ChannelPool(3, 1, ActionScheduler(2))
+
+    def tearDown(self):
+        channel_pool.hidden_overwrites = self._hidden_overwrites
+
+    async def fill(self):
+        self.pool.attach(self.guild, None)
+        self.pool.refill()
+        await self.pool._refill_task
+
+    async def test_refill_up_to_size(self):
+        await self.fill()
+
+        self.assertEqual(self.pool.idle, 3)
+        self.assertEqual(self.pool.room, 0)
+        self.assertEqual(len(self.guild.created), 3)
+
+    async def test_acquire_and_release(self):
+        await self.fill()
+
+        channel = await self.pool.acquire(member(1))
+        self.assertTrue(self.pool.owns(channel.id))
+        self.assertEqual(self.pool.idle, 2)
+
+        await self.pool.release(channel, member(1), "done")
+        self.assertEqual(self.pool.idle, 3)
+        self.assertFalse(channel.deleted)
+
+    async def test_acquire_skips_unusable_channel(self):
+        await self.fill()
+        broken = self.pool._idle[0]
+        broken.fail = True
+
+        channel = await self.pool.acquire(member(1))
+
+        self.assertIsNot(channel, broken)
+        self.assertFalse(self.pool.owns(broken.id))
+
+    async def test_failed_recycle_deletes(self):
+        await self.fill()
+        channel = await self.pool.acquire(member(1))
+        channel.fail = True
+
+        await self.pool.release(channel, member(1), "done")
+
+        self.assertTrue(channel.deleted)
+        self.assertFalse(self.pool.owns(channel.id))
+
+    async def test_release_into_full_pool_deletes(self):
+        await self.fill()
+        extra = FakeChannel(self.guild)
+
+        await self.pool.release(extra, member(1), "done")
+
+        self.assertTrue(extra.deleted)
+        self.assertEqual(self.pool.idle, 3)
+
+    async def test_adopt_until_full(self):
+        adopted = [await self.pool.adopt(FakeChannel(self.guild)) for _ in range(4)]
+
+        self.assertEqual(adopted, [True, True, True, False])
+        self.assertEqual(self.pool.room, 0)
+
+    async def test_adopt_owned_channel_again(self):
+        # The startup cleanup running again after a reconnect
+        channel = FakeChannel(self.guild)
+        self.assertTrue(await self.pool.adopt(channel))
+        self.assertTrue(await self.pool.adopt(channel))
+
+        self.assertEqual(self.pool.idle, 1)
+        self.assertEqual(self.pool.room, 2)
+
+    async def test_channels_in_flight_count_against_size(self):
+        await self.fill()
+        channels = await asyncio.gather(*[self.pool.acquire(member(i)) for i in range(3)])
+
+        # Refills while the channels are being recycled must not push the pool past its size
+        releases = [asyncio.ensure_future(self.pool.release(ch, member(i), "done")) for i, ch in enumerate(channels)]
+        await asyncio.sleep(0)
+        self.assertTrue(all(self.pool.owns(ch.id) for ch in channels))
+        self.assertEqual(self.pool.room, 0)
+
+        await asyncio.gather(*releases)
+        if self.pool._refill_task is not None:
+            await self.pool._refill_task
+
+        self.assertEqual(self.pool.idle, 3)
+        self.assertEqual(len(self.guild.created), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
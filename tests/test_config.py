@@ -0,0 +1,181 @@
+import importlib
+import os
+import tempfile
+import unittest
+
+CONFIG = """
+[Bot]
+bot_token = token
+bot_prefix = !
+outbound_workers = 4
+
+[TriggerConfig]
+guild_id = 100
+verification_trigger_channel_id = 101
+verification_trigger_message_id = 102
+verification_trigger_emoji = 🧠
+
+[AuthConfig]
+verification_channel_category_id = 103
+verification_success_role_id = 104
+verification_channel_pool_size = 4
+
+[Logging]
+log_verification_to_console = true
+"""
+
+config = None
+
+
+def write_config(path: str, content: str = CONFIG) -> None:
+    with open(path, "w", encoding="utf-8") as config_file:
+        config_file.write(content)
+
+
+def setUpModule():
+    global config
+    # androidroot.config reads ./data/config.ini when it is imported
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "data"))
+        write_config(os.path.join(directory, "data", "config.ini"))
+
+        working_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            config = importlib.import_module("androidroot.config")
+        finally:
+            os.chdir(working_directory)
+
+
+class LoadConfigTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "config.ini")
+        write_config(self.path)
+
+    def test_defaults(self):
+        loaded = config.load_config(self.path, {})
+
+        self.assertEqual(loaded.bot_prefix, "!")
+        self.assertEqual(loaded.verification_mode, "channel")
+        self.assertEqual(loaded.log_level, "INFO")
+        self.assertEqual(list(loaded.guilds), [100])
+        self.assertEqual(loaded.guilds[100].pool_low_water, 2)
+
+    def test_environment_overrides(self):
+        loaded = config.load_config(self.path, {
+            "ANDROIDROOT_BOT__BOT_PREFIX": "?",
+            "ANDROIDROOT_AUTHCONFIG__VERIFICATION_MODE": "dm",
+            "ANDROIDROOT_GUILD_200__VERIFICATION_TRIGGER_CHANNEL_ID": "201",
+            "ANDROIDROOT_GUILD_200__VERIFICATION_TRIGGER_MESSAGE_ID": "202",
+            "ANDROIDROOT_GUILD_200__VERIFICATION_CHANNEL_CATEGORY_ID": "203",
+            "ANDROIDROOT_GUILD_200__VERIFICATION_SUCCESS_ROLE_ID": "204",
+            "UNRELATED": "ignored",
+        })
+
+        self.assertEqual(loaded.bot_prefix, "?")
+        self.assertEqual(loaded.verification_mode, "dm")
+        # A whole guild from the environment, with the emoji and pool of the first one
+        self.assertEqual(loaded.guilds[200].category_id, 203)
+        self.assertEqual(loaded.guilds[200].trigger_emoji, "🧠")
+        self.assertEqual(loaded.guilds[200].pool_size, 4)
+
+    def test_unknown_section_in_environment(self):
+        with self.assertRaisesRegex(config.ConfigError, "ANDROIDROOT_NOPE__"):
+            config.load_config(self.path, {"ANDROIDROOT_NOPE__OPTION": "1"})
+
+    def test_invalid_values_name_the_option(self):
+        cases = {
+            "ANDROIDROOT_BOT__OUTBOUND_WORKERS": ("0", r"\[Bot\] outbound_workers has to be at least 1"),
+            "ANDROIDROOT_CACHE__CACHE_MEMBERS": ("maybe", r"\[Cache\] cache_members has to be true or false"),
+            "ANDROIDROOT_LOGGING__LOG_LEVEL": ("loud", r"\[Logging\] log_level has to be one of"),
+            "ANDROIDROOT_BOT__SPECIAL_USER_IDS": ("1, 2", r"\[Bot\] special_user_ids has to be a JSON array"),
+        }
+        for name, (value, message) in cases.items():
+            with self.subTest(name), self.assertRaisesRegex(config.ConfigError, message):
+                config.load_config(self.path, {name: value})
+
+    def test_missing_option(self):
+        with self.assertRaisesRegex(config.ConfigError, r"\[TriggerConfig\] guild_id is missing"):
+            config.load_config(self.path, {"ANDROIDROOT_TRIGGERCONFIG__GUILD_ID": ""})
+
+
+class ConfigRegistryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "config.ini")
+        write_config(self.path)
+
+        self.registry = config.ConfigRegistry(self.path, {})
+        self.changes = []
+        self.registry.add_listener(lambda old, new: self.changes.append((old, new)))
+
+    def reload_with(self, *replacements) -> bool:
+        content = CONFIG
+        for old, new in replacements:
+            content = content.replace(old, new)
+        write_config(self.path, content)
+        return self.registry.reload()
+
+    def test_reloadable_options_apply(self):
+        old = self.registry.config
+
+        with self.assertLogs("androidroot.config", "INFO"):
+            self.assertTrue(self.reload_with(("bot_prefix = !", "bot_prefix = ?"),
+                                             ("success_role_id = 104", "success_role_id = 105")))
+
+        new = self.registry.config
+        self.assertEqual((new.bot_prefix, new.guilds[100].role_id), ("?", 105))
+        # The old config isn't changed, listeners compare the two
+        self.assertEqual((old.bot_prefix, old.guilds[100].role_id), ("!", 104))
+        self.assertEqual(self.changes, [(old, new)])
+        self.assertEqual(self.registry.reloads, 1)
+
+    def test_restart_options_keep_their_value(self):
+        with self.assertLogs("androidroot.config", "WARNING") as logs:
+            self.reload_with(("outbound_workers = 4", "outbound_workers = 8"),
+                             ("verification_channel_category_id = 103", "verification_channel_category_id = 106"),
+                             ("bot_prefix = !", "bot_prefix = ?"))
+
+        new = self.registry.config
+        self.assertEqual((new.outbound_workers, new.guilds[100].category_id, new.bot_prefix), (4, 103, "?"))
+        self.assertIn("outbound_workers, category_id of guild 100", "\n".join(logs.output))
+
+    def test_broken_file_keeps_config(self):
+        old = self.registry.config
+
+        with self.assertLogs("androidroot.config", "ERROR"):
+            self.assertFalse(self.reload_with(("outbound_workers = 4", "outbound_workers = many")))
+
+        self.assertIs(self.registry.config, old)
+        self.assertEqual((self.registry.reloads, self.registry.failed_reloads), (0, 1))
+        self.assertEqual(self.changes, [])
+
+    def test_environment_wins_on_reload(self):
+        registry = config.ConfigRegistry(self.path, {"ANDROIDROOT_BOT__BOT_PREFIX": "$"})
+        write_config(self.path, CONFIG.replace("bot_prefix = !", "bot_prefix = ?"))
+
+        with self.assertLogs("androidroot.config", "INFO"):
+            registry.reload()
+
+        self.assertEqual(registry.config.bot_prefix, "$")
+
+    def test_failing_listener_does_not_stop_reload(self):
+        def fail(old, new):
+            raise RuntimeError("broken")
+
+        registry = config.ConfigRegistry(self.path, {})
+        registry.add_listener(fail)
+        registry.add_listener(lambda old, new: self.changes.append((old, new)))
+        write_config(self.path, CONFIG.replace("bot_prefix = !", "bot_prefix = ?"))
+
+        with self.assertLogs("androidroot.config", "ERROR"):
+            self.assertTrue(registry.reload())
+        self.assertEqual(registry.config.bot_prefix, "?")
+        self.assertEqual(len(self.changes), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from androidroot.job_queue import JobQueue, JobKind, JobStatus
+
+
+class JobQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("androidroot.job_queue.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        path = os.path.join(self.directory.name, "jobs.db")
+
+        # The gateway and two workers, each with its own connection like the separate processes
+        self.gateway = JobQueue(path, lease=30, max_attempts=2)
+        self.worker_a = JobQueue(path, lease=30, max_attempts=2)
+        self.worker_b = JobQueue(path, lease=30, max_attempts=2)
+        for queue in (self.gateway, self.worker_a, self.worker_b):
+            await queue.open()
+
+    async def asyncTearDown(self):
+        for queue in (self.gateway, self.worker_a, self.worker_b):
+            await queue.close()
+
+    async def test_claims_oldest_first_and_once(self):
+        first = await self.gateway.submit(JobKind.VERIFY, 1, 10, {"mode": "channel"})
+        second = await self.gateway.submit(JobKind.VERIFY, 1, 11)
+
+        job_a = await self.worker_a.claim("a")
+        job_b = await self.worker_b.claim("b")
+
+        self.assertEqual((job_a.id, job_b.id), (first, second))
+        self.assertEqual(job_a.payload, {"mode": "channel"})
+        self.assertEqual((job_a.status, job_a.attempts), (JobStatus.RUNNING, 1))
+        self.assertIsNone(await self.worker_a.claim("a"))
+
+    async def test_one_open_job_per_member(self):
+        self.assertIsNotNone(await self.gateway.submit(JobKind.VERIFY, 1, 10))
+        self.assertIsNone(await self.gateway.submit(JobKind.VERIFY, 1, 10))
+        # Another kind or guild is a separate job
+        self.assertIsNotNone(await self.gateway.submit(JobKind.BULK_ROLE, 1, 10))
+        self.assertIsNotNone(await self.gateway.submit(JobKind.VERIFY, 2, 10))
+
+        job = await self.worker_a.claim("a")
+        await self.worker_a.finish(job, JobStatus.DONE)
+        self.assertIsNotNone(await self.gateway.submit(JobKind.VERIFY, 1, 10))
+
+    async def test_batched_enqueue(self):
+        self.gateway.enqueue(JobKind.VERIFY, 1, 10)
+        self.gateway.enqueue(JobKind.VERIFY, 1, 10)
+        self.assertIsNone(await self.worker_a.claim("a"))
+
+        await self.gateway.flush()
+
+        self.assertEqual(await self.gateway.counts(), {JobStatus.QUEUED: 1})
+        self.assertTrue(await self.gateway.is_pending(JobKind.VERIFY, 1, 10))
+
+    async def test_expired_lease_is_queued_again(self):
+        await self.gateway.submit(JobKind.VERIFY, 1, 10)
+        job = await self.worker_a.claim("a")
+        await self.worker_a.update(job, channel_id=500)
+        self.assertEqual(await self.gateway.active_channels(), {500})
+
+        # Worker a renews its lease, then stops responding
+        self.now += 20
+        await self.worker_a.renew("a")
+        self.now += 20
+        self.assertIsNone(await self.worker_b.claim("b"))
+
+        self.now += 20
+        with self.assertLogs("androidroot.job_queue", "WARNING"):
+            retried = await self.worker_b.claim("b")
+
+        self.assertEqual((retried.id, retried.attempts, retried.channel_id), (job.id, 2, 500))
+
+    async def test_fails_after_max_attempts(self):
+        await self.gateway.submit(JobKind.VERIFY, 1, 10)
+        await self.worker_a.claim("a")
+        self.now += 31
+        with self.assertLogs("androidroot.job_queue", "WARNING"):
+            await self.worker_b.claim("b")
+
+        self.now += 31
+        with self.assertLogs("androidroot.job_queue", "ERROR"):
+            self.assertIsNone(await self.worker_a.claim("a"))
+
+        finished = await self.gateway.collect_finished()
+        self.assertEqual([(job.status, job.result) for job in finished], [(JobStatus.FAILED, {"error": "worker lost"})])
+        self.assertEqual(await self.gateway.collect_finished(), [])
+
+    async def test_release_does_not_count_attempt(self):
+        await self.gateway.submit(JobKind.VERIFY, 1, 10)
+        await self.worker_a.claim("a")
+
+        await self.worker_a.release("a")
+        job = await self.worker_b.claim("b")
+
+        self.assertEqual(job.attempts, 1)
+
+    async def test_forwarded_messages(self):
+        last = await self.worker_a.last_message_id()
+        self.gateway.forward(500, 10, 9000, "AB23 🍕")
+        await self.gateway.flush()
+
+        messages = await self.worker_a.messages(last)
+        self.assertEqual([(m.channel_id, m.author_id, m.content) for m in messages], [(500, 10, "AB23 🍕")])
+        self.assertEqual(await self.worker_a.messages(messages[-1].id), [])
+
+    async def test_prune(self):
+        await self.gateway.submit(JobKind.VERIFY, 1, 10)
+        job = await self.worker_a.claim("a")
+        await self.worker_a.finish(job, JobStatus.DONE, {"outcome": "verified"})
+
+        # Not collected yet, so it stays
+        self.now += 100
+        await self.gateway.prune(job_age=50, message_age=50)
+        self.assertEqual(await self.gateway.counts(), {JobStatus.DONE: 1})
+
+        await self.gateway.collect_finished()
+        await self.gateway.prune(job_age=200, message_age=50)
+        self.assertEqual(await self.gateway.counts(), {JobStatus.DONE: 1})
+        await self.gateway.prune(job_age=50, message_age=50)
+        self.assertEqual(await self.gateway.counts(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from androidroot.lockout import LockoutTable
+
+
+class LockoutTableTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("androidroot.lockout.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.table = LockoutTable(base_lockout=10, max_lockout=60, ttl=300)
+
+    def test_backoff_doubles_up_to_max(self):
+        lockouts = [self.table.record_failure(1, 10) for _ in range(5)]
+
+        self.assertEqual(lockouts, [10, 20, 40, 60, 60])
+
+    def test_locked_for(self):
+        self.table.record_failure(1, 10)
+
+        self.assertEqual(self.table.locked_for(1, 10), 10)
+        self.assertEqual(self.table.locked_for(2, 10), 0)
+        self.now += 4
+        self.assertEqual(self.table.locked_for(1, 10), 6)
+        self.now += 6
+        self.assertEqual(self.table.locked_for(1, 10), 0)
+
+        self.assertEqual(self.table.rejected, 2)
+
+    def test_success_forgets(self):
+        self.table.record_failure(1, 10)
+        self.table.record_success(1, 10)
+
+        self.assertEqual(self.table.locked_for(1, 10), 0)
+        self.assertEqual(self.table.record_failure(1, 10), 10)
+
+    def test_notify_once_per_lockout(self):
+        self.assertFalse(self.table.should_notify(1, 10))
+        self.table.record_failure(1, 10)
+
+        self.assertTrue(self.table.should_notify(1, 10))
+        self.assertFalse(self.table.should_notify(1, 10))
+
+        self.table.record_failure(1, 10)
+        self.assertTrue(self.table.should_notify(1, 10))
+
+    def test_ttl_eviction(self):
+        self.table.record_failure(1, 10)
+        self.now += 200
+        self.table.record_failure(1, 11)
+        self.now += 50
+        # Moves member 10 behind member 11
+        self.table.record_failure(1, 10)
+        self.now += 270
+
+        # Member 11's last failure is 320 seconds ago, member 10's 270
+        self.table.record_failure(1, 12)
+
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table.evicted, 1)
+        self.assertEqual(self.table.record_failure(1, 11), 10)
+        # Member 10 wasn't forgotten, the backoff goes on
+        self.assertEqual(self.table.record_failure(1, 10), 40)
+
+    def test_ttl_is_at_least_max_lockout(self):
+        table = LockoutTable(base_lockout=10, max_lockout=600, ttl=60)
+
+        self.assertEqual(table.ttl, 600)
+
+    def test_disabled(self):
+        table = LockoutTable(base_lockout=0, max_lockout=60, ttl=300)
+
+        self.assertEqual(table.record_failure(1, 10), 0)
+        self.assertEqual(table.locked_for(1, 10), 0)
+        self.assertEqual(len(table), 0)
+
+    def test_configure_keeps_current_lockouts(self):
+        self.table.record_failure(1, 10)
+        self.table.configure(base_lockout=100, max_lockout=1000, ttl=3000)
+
+        self.assertEqual(self.table.locked_for(1, 10), 10)
+        self.assertEqual(self.table.record_failure(1, 10), 200)
+
+    def test_snapshot(self):
+        self.table.record_failure(1, 10)
+        self.table.record_failure(1, 10)
+        self.now += 200
+        self.table.record_failure(2, 20)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lockouts.json")
+            self.table.save(path)
+
+            # Member 10 expired while the bot was down
+            self.now += 150
+            restored = LockoutTable(base_lockout=10, max_lockout=60, ttl=300)
+            self.assertEqual(restored.load(path), 1)
+
+        self.assertEqual(restored.locked_for(1, 10), 0)
+        self.assertEqual(restored.record_failure(2, 20), 20)
+
+    def test_unreadable_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lockouts.json")
+            with open(path, "w") as snapshot_file:
+                snapshot_file.write("{")
+
+            with self.assertLogs("androidroot.lockout", "WARNING"):
+                self.assertEqual(self.table.load(path), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
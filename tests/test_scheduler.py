@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import unittest
+
+from androidroot.scheduler import ActionScheduler, Priority
+
+
+class ActionSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_priority_order(self):
+        scheduler = ActionScheduler(1)
+        order = []
+        gate = asyncio.Event()
+
+        async def record(name: str):
+            await gate.wait()
+            order.append(name)
+
+        # Holds the only worker until everything else is queued
+        first = scheduler.submit(Priority.NORMAL, lambda: record("first"))
+        await asyncio.sleep(0)
+        futures = [
+            scheduler.submit(Priority.BULK, lambda: record("bulk")),
+            scheduler.submit(Priority.COSMETIC, lambda: record("cosmetic")),
+            scheduler.submit(Priority.NORMAL, lambda: record("normal 1")),
+            scheduler.submit(Priority.CRITICAL, lambda: record("critical")),
+            scheduler.submit(Priority.NORMAL, lambda: record("normal 2")),
+        ]
+        self.assertEqual(scheduler.depth, 5)
+
+        gate.set()
+        await asyncio.gather(first, *futures)
+
+        self.assertEqual(order, ["first", "critical", "normal 1", "normal 2", "cosmetic", "bulk"])
+
+    async def test_default_class_limits(self):
+        scheduler = ActionScheduler(4)
+
+        self.assertEqual(scheduler.class_limits, {
+            Priority.CRITICAL: 4, Priority.NORMAL: 3, Priority.COSMETIC: 2, Priority.BULK: 2,
+        })
+
+    async def test_blocked_classes_leave_workers_free(self):
+        scheduler = ActionScheduler(4)
+        stuck = asyncio.Event()
+
+        # Like calls waiting out a 429 inside discord.py
+        blocked = [scheduler.submit(priority, stuck.wait)
+                   for priority in (Priority.NORMAL, Priority.BULK) for _ in range(5)]
+        await asyncio.sleep(0)
+
+        # Normal takes 3 workers, the last one is left for role grants
+        self.assertEqual(scheduler._running, {Priority.CRITICAL: 0, Priority.NORMAL: 3,
+                                              Priority.COSMETIC: 0, Priority.BULK: 0})
+        self.assertEqual(await asyncio.wait_for(scheduler.run(Priority.CRITICAL, lambda: asyncio.sleep(0, "role")),
+                                                timeout=1), "role")
+
+        stuck.set()
+        await asyncio.gather(*blocked)
+        self.assertEqual(scheduler.depth, 0)
+
+    async def test_class_limits_override(self):
+        scheduler = ActionScheduler(4, class_limits={Priority.BULK: 1, Priority.NORMAL: 10})
+
+        self.assertEqual(scheduler.class_limits[Priority.BULK], 1)
+        self.assertEqual(scheduler.class_limits[Priority.NORMAL], 4)
+
+    async def test_coalescing(self):
+        scheduler = ActionScheduler(1)
+        gate = asyncio.Event()
+        calls = []
+
+        async def edit(content: str):
+            calls.append(content)
+            return content
+
+        blocker = scheduler.submit(Priority.NORMAL, gate.wait)
+        await asyncio.sleep(0)
+        futures = [scheduler.submit(Priority.COSMETIC, lambda c=content: edit(c), key="progress")
+                   for content in ("10%", "20%", "30%")]
+        self.assertEqual(scheduler.depth, 1)
+
+        gate.set()
+        results = await asyncio.gather(blocker, *futures)
+
+        self.assertEqual(calls, ["30%"])
+        self.assertEqual(results[1:], ["30%"] * 3)
+        self.assertEqual(scheduler.stats()["cosmetic"]["coalesced"], 2)
+
+    async def test_failure_reaches_submitter(self):
+        scheduler = ActionScheduler(1)
+
+        async def fail():
+            raise ValueError("nope")
+
+        with self.assertRaises(ValueError):
+            await scheduler.run(Priority.CRITICAL, fail)
+        self.assertEqual(scheduler.stats()["critical"]["failed"], 1)
+
+
+class RateLimitCounterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.root = logging.getLogger()
+        self.http_log = logging.getLogger("discord.http")
+        self._levels = (self.root.level, self.http_log.level, list(self.http_log.filters))
+        # Counters of the schedulers of other tests would drop the records before this one sees them
+        self.http_log.filters = []
+
+    def tearDown(self):
+        self.root.setLevel(self._levels[0])
+        self.http_log.setLevel(self._levels[1])
+        self.http_log.filters = self._levels[2]
+
+    async def test_counts_above_configured_level(self):
+        self.root.setLevel(logging.ERROR)
+        scheduler = ActionScheduler(1)
+
+        async def request():
+            self.http_log.warning("We are being rate limited. Retrying in %.2f seconds. Handled under the bucket %s",
+                                  1.0, "bucket")
+            self.http_log.debug("POST https://discord.com/api/v7/guilds/1/channels with {} has returned 200")
+
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        self.http_log.addHandler(handler)
+        try:
+            await scheduler.run(Priority.NORMAL, request)
+        finally:
+            self.http_log.removeHandler(handler)
+
+        self.assertEqual(scheduler.stats()["normal"]["rate_limited"], 1)
+        # Neither gets written at the configured level
+        self.assertEqual(records, [])
+
+    async def test_level_follows_root(self):
+        self.root.setLevel(logging.ERROR)
+        ActionScheduler.follow_log_level()
+        self.assertEqual(self.http_log.level, logging.WARNING)
+
+        self.root.setLevel(logging.DEBUG)
+        ActionScheduler.follow_log_level()
+        self.assertEqual(self.http_log.level, logging.DEBUG)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+from androidroot.sessions import SessionManager
+
+
+def message(channel_id: int, author_id: int, content: str):
+    return SimpleNamespace(channel=SimpleNamespace(id=channel_id), author=SimpleNamespace(id=author_id),
+                           content=content)
+
+
+class RecordingStore:
+    def __init__(self):
+        self.saved = []
+        self.removed = []
+
+    def save(self, session):
+        self.saved.append((session.member_id, session.response_count))
+
+    def remove(self, session):
+        self.removed.append(session.member_id)
+
+
+class SessionManagerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.manager = SessionManager()
+
+    async def test_correct_answer(self):
+        session = self.manager.open(1, 10, 100, "AB23", "🍕", timeout=5)
+        waiter = asyncio.ensure_future(self.manager.wait(session))
+
+        self.assertFalse(self.manager.dispatch(message(100, 11, "ab23 🍕")))
+        self.assertFalse(self.manager.dispatch(message(100, 10, "ab23")))
+        self.assertTrue(self.manager.dispatch(message(100, 10, " AB23 🍕 ")))
+
+        answer = await waiter
+        self.assertEqual(answer.author.id, 10)
+        self.assertEqual(session.response_count, 2)
+        self.assertEqual(self.manager.active, 0)
+        self.assertIsNone(self.manager.get_by_member(1, 10))
+
+    async def test_messages_in_other_channels_are_ignored(self):
+        self.manager.open(1, 10, 100, "AB23", "🍕", timeout=5)
+
+        self.assertFalse(self.manager.dispatch(message(200, 10, "AB23 🍕")))
+
+    async def test_deadline(self):
+        session = self.manager.open(1, 10, 100, "AB23", "🍕", timeout=0.05)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.manager.wait(session)
+        self.assertEqual(self.manager.active, 0)
+
+    async def test_deadlines_in_order(self):
+        timed_out = []
+
+        async def wait(session):
+            try:
+                await self.manager.wait(session)
+            except asyncio.TimeoutError:
+                timed_out.append(session.member_id)
+
+        # The earlier deadline is added later and has to wake the timer up
+        late = self.manager.open(1, 10, 100, "AAAA", "🍕", timeout=0.3)
+        early = self.manager.open(1, 11, 101, "BBBB", "🍕", timeout=0.05)
+        waiters = [asyncio.ensure_future(wait(late)), asyncio.ensure_future(wait(early))]
+
+        await asyncio.sleep(0.15)
+        self.assertEqual(timed_out, [11])
+        self.assertFalse(late.done)
+
+        await asyncio.gather(*waiters)
+        self.assertEqual(timed_out, [11, 10])
+
+    async def test_answered_session_does_not_time_out(self):
+        session = self.manager.open(1, 10, 100, "AB23", "🍕", timeout=0.05)
+        self.manager.dispatch(message(100, 10, "AB23 🍕"))
+
+        await self.manager.wait(session)
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(session.future.result().content, "AB23 🍕")
+        # Dropped from the heap by the timer once the deadline passed
+        self.assertEqual(self.manager._deadlines, [])
+
+    async def test_restore_past_deadline(self):
+        session = self.manager.restore(1, 10, 100, "AB23", "🍕", time.time() - 1, previous_responses=3)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.manager.wait(session)
+        self.assertEqual(session.response_count, 3)
+
+    async def test_same_member_in_two_guilds(self):
+        first = self.manager.open(1, 10, 100, "AAAA", "🍕", timeout=5)
+        second = self.manager.open(2, 10, 200, "BBBB", "🍕", timeout=5)
+
+        self.assertIs(self.manager.get_by_member(1, 10), first)
+        self.assertIs(self.manager.get_by_member(2, 10), second)
+
+        self.manager.close(first)
+        self.assertIs(self.manager.get_by_member(2, 10), second)
+        self.manager.close(second)
+
+    async def test_store(self):
+        store = RecordingStore()
+        self.manager.store = store
+
+        session = self.manager.open(1, 10, 100, "AB23", "🍕", timeout=5)
+        self.manager.dispatch(message(100, 10, "wrong"))
+        self.manager.dispatch(message(100, 11, "someone else"))
+        self.manager.close(session)
+
+        self.assertEqual(store.saved, [(10, 0), (10, 1)])
+        self.assertEqual(store.removed, [10])
+
+    async def test_cancelled_session_stays_stored(self):
+        # Shutting down cancels the waits, the session is resumed after the restart
+        store = RecordingStore()
+        self.manager.store = store
+        session = self.manager.open(1, 10, 100, "AB23", "🍕", timeout=5)
+        waiter = asyncio.ensure_future(self.manager.wait(session))
+        await asyncio.sleep(0)
+
+        session.future.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+
+        self.assertEqual(store.removed, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,523 @@
+import logging
+
+from typing import Optional, Dict, List, Set
+from random import choice
+import asyncio
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+from io import BytesIO
+
+from discord import Client, Intents, Object, Guild, Member, Message, TextChannel, DMChannel, PermissionOverwrite, \
+    Embed, Color, File
+from discord.errors import NotFound, Forbidden
+
+from androidroot.audit_store import AuditStore
+from androidroot.cache import entity_cache
+from androidroot.captcha import CaptchaPool
+from androidroot.guilds import GuildConfig
+from androidroot.job_queue import JobQueue, Job, JobKind, JobStatus, ForwardedMessage
+from androidroot.log_pipeline import log_pipeline
+from androidroot.log_sink import VerificationLogSink
+from androidroot.scheduler import ActionScheduler, Priority
+from androidroot.sessions import VerificationSession
+from androidroot.bulk_roles import BulkRoleJob, BulkRoleProgress, report_progress_periodically
+from androidroot.config import BOT_TOKEN, GUILDS, OUTBOUND_WORKERS, STRINGS_CHECK_INTERVAL, CONFIG_CHECK_INTERVAL, \
+    VERIFICATION_CHALLENGE, VERIFICATION_MODE, CAPTCHA_POOL_SIZE, CAPTCHA_POOL_LOW_WATER, CAPTCHA_PROCESSES, \
+    CAPTCHA_FONT, AUDIT_DATABASE, JOB_DATABASE, WORKER_CONCURRENCY, WORKER_POLL_INTERVAL, WORKER_LEASE, WORKER_MAX_ATTEMPTS, \
+    BULK_ROLE_CONCURRENCY, BULK_ROLE_PROGRESS_INTERVAL, BULK_ROLE_CHECKPOINT_DIRECTORY, \
+    LOG_LEVEL, LOG_FILE, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS, LOG_QUEUE_SIZE, \
+    LOG_VERIFICATIONS_CHANNEL_FLUSH_INTERVAL, LOG_VERIFICATIONS_CHANNEL_DIGEST_THRESHOLD, Config, config_registry
+from androidroot.strings import gets, String, string_registry
+from androidroot.utilities import generate_id, generate_code
+
+log = logging.getLogger(__name__)
+
+# Runs the jobs bot.py puts in the job queue when [Workers] is enabled: usage "python worker.py [name]".
+# Workers only use the REST API, the gateway connection (and everything it receives) stays in the bot process,
+# which forwards the answers sent in verification channels through the queue.
+WORKER_NAME = sys.argv[1] if len(sys.argv) > 1 else f"worker-{os.getpid()}"
+
+# Same as begin_verification in bot.py
+VERIFICATION_TIMEOUT = 120
+# Nothing invalidates the cached entities here (there are no gateway events), they are fetched again after this
+ENTITY_TTL = 300
+
+client = Client(intents=Intents.none())
+scheduler = ActionScheduler(OUTBOUND_WORKERS)
+job_queue = JobQueue(JOB_DATABASE, flush_interval=WORKER_POLL_INTERVAL, lease=WORKER_LEASE,
+                     max_attempts=WORKER_MAX_ATTEMPTS)
+# The same database as the bot's, pruned by the bot
+audit_store = AuditStore(AUDIT_DATABASE) if AUDIT_DATABASE is not None else None
+captcha_pool = CaptchaPool(
+    CAPTCHA_POOL_SIZE, CAPTCHA_POOL_LOW_WATER, processes=CAPTCHA_PROCESSES, font_path=CAPTCHA_FONT
+) if VERIFICATION_CHALLENGE == "image" else None
+
+# Verification channel ID -> answers forwarded for the verification running in it
+inboxes: Dict[int, asyncio.Queue] = {}
+running_jobs: Set[asyncio.Task] = set()
+# Set when logging in, client.user is only filled in by the gateway connection
+bot_user_id: Optional[int] = None
+
+
+#############
+# Entities
+#############
+async def get_guild(guild_id: int) -> Guild:
+    return await entity_cache.get(f"guild:{guild_id}", lambda: client.fetch_guild(guild_id), ENTITY_TTL)
+
+
+async def get_bot_member(guild: Guild) -> Member:
+    # Guild.me is only known with a gateway connection
+    return await entity_cache.get(f"me:{guild.id}", lambda: guild.fetch_member(bot_user_id), ENTITY_TTL)
+
+
+async def get_trigger_message(config: GuildConfig) -> Message:
+    async def get():
+        channel = await client.fetch_channel(config.trigger_channel_id)
+        return await channel.fetch_message(config.trigger_message_id)
+
+    return await entity_cache.get(f"trigger_message:{config.guild_id}", get, ENTITY_TTL)
+
+
+def logging_channel_getter(guild_id: int):
+    async def get_logging_channel() -> Optional[TextChannel]:
+        # The current settings, the channel can change with a config reload
+        config = config_registry.config.guilds[guild_id]
+        if config.log_channel_id is None:
+            return None
+
+        return await entity_cache.get(f"logging_channel:{guild_id}",
+                                      lambda: client.fetch_channel(config.log_channel_id), ENTITY_TTL)
+
+    return get_logging_channel
+
+
+log_sinks: Dict[int, VerificationLogSink] = {
+    guild_id: VerificationLogSink(
+        client.http, logging_channel_getter(guild_id), scheduler,
+        flush_interval=LOG_VERIFICATIONS_CHANNEL_FLUSH_INTERVAL,
+        digest_threshold=LOG_VERIFICATIONS_CHANNEL_DIGEST_THRESHOLD
+    )
+    for guild_id in GUILDS
+}
+
+
+#############
+# Verification jobs
+#############
+async def delete_channel(channel_id: int, reason: str):
+    try:
+        await scheduler.run(Priority.NORMAL, lambda: client.http.delete_channel(channel_id, reason=reason))
+    except NotFound:
+        pass
+
+
+async def wait_for_answer(session: VerificationSession, inbox: asyncio.Queue,
+                          responses: List[ForwardedMessage]) -> Optional[ForwardedMessage]:
+    """
+    :return: The correct answer, None if the session timed out first
+    """
+    while True:
+        try:
+            message: ForwardedMessage = await asyncio.wait_for(inbox.get(), timeout=session.deadline - time.time())
+        except asyncio.TimeoutError:
+            return None
+
+        if message.author_id != session.member_id:
+            continue
+
+        responses.append(message)
+        if session.is_correct(message.content):
+            return message
+
+
+async def send_challenge_by_dm(member: Member, content: str, image: Optional[bytes]) -> Optional[DMChannel]:
+    """
+    Like send_challenge_by_dm in bot.py.
+    :return: The DM channel, None if the member doesn't accept DMs or is verifying in them on this worker already
+    """
+    dm_channel = member.dm_channel or await scheduler.run(Priority.NORMAL, member.create_dm)
+    if dm_channel.id in inboxes:
+        return None
+
+    inboxes[dm_channel.id] = asyncio.Queue()
+    try:
+        await scheduler.run(Priority.NORMAL, lambda: dm_channel.send(content, file=challenge_file(image)))
+    except Forbidden:
+        del inboxes[dm_channel.id]
+        log.info(f"{member.name}#{member.discriminator} ({member.id}) doesn't accept DMs, verifying in a channel")
+        return None
+
+    return dm_channel
+
+
+async def open_verification_channel(guild: Guild, config: GuildConfig, member: Member) -> TextChannel:
+    permission_overwrites = {
+        await get_bot_member(guild): PermissionOverwrite(read_messages=True, send_messages=True,
+                                                         read_message_history=True),
+        member: PermissionOverwrite(read_messages=True, send_messages=True, read_message_history=True),
+        guild.default_role: PermissionOverwrite(read_messages=False, send_messages=False)
+    }
+
+    return await scheduler.run(Priority.NORMAL, lambda: guild.create_text_channel(
+        f"verification-{generate_id(4)}",
+        category=Object(id=config.category_id),
+        overwrites=permission_overwrites,
+        reason=f"Authenticating user {member.id}#{member.discriminator}"
+    ))
+
+
+def challenge_file(image: Optional[bytes]) -> Optional[File]:
+    return File(BytesIO(image), filename="code.png") if image is not None else None
+
+
+async def run_verification_job(job: Job):
+    """
+    The verification of begin_verification/finish_verification in bot.py, with the answers coming in through
+    the job queue instead of the gateway.
+    """
+    config = config_registry.config.guilds[job.guild_id]
+    guild = await get_guild(job.guild_id)
+
+    # The channel of an attempt on a worker that stopped (DMs stay)
+    if job.channel_id is not None and job.result.get("mode") != "dm":
+        await delete_channel(job.channel_id, reason="Verification moved to another worker")
+
+    try:
+        member = await guild.fetch_member(job.member_id)
+    except NotFound:
+        log.info(f"Member {job.member_id} left guild {job.guild_id} before their verification started")
+        await job_queue.finish(job, JobStatus.DONE, {"outcome": "error", "error": "member left"})
+        return
+
+    random_emoji_text, random_emoji_unicode = choice(gets(String.VERIFY_RANDOM_EMOJI_LIST))
+
+    begin = gets(String.ON_VERIFICATION_BEGIN).format(user_mention=member.mention)
+    if captcha_pool is None:
+        random_code = generate_code(4)
+        image = None
+        how = gets(String.VERIFICATION_HOW).format(code=random_code, random_emoji=random_emoji_text.strip(":"))
+    else:
+        random_code, image = await captcha_pool.take()
+        how = gets(String.VERIFICATION_HOW_IMAGE).format(random_emoji=random_emoji_text.strip(":"))
+
+    auth_channel = None
+    if VERIFICATION_MODE == "dm":
+        auth_channel = await send_challenge_by_dm(member, f"{begin}\n{how}", image)
+    mode = "dm" if auth_channel is not None else "channel"
+
+    if auth_channel is None:
+        auth_channel = await open_verification_channel(guild, config, member)
+        inboxes[auth_channel.id] = asyncio.Queue()
+    inbox = inboxes[auth_channel.id]
+
+    responses: List[ForwardedMessage] = []
+    try:
+        # Lets the bot process know the channel isn't stale
+        await job_queue.update(job, channel_id=auth_channel.id, result={"mode": mode})
+
+        if mode == "channel":
+            await scheduler.run(Priority.NORMAL, lambda: auth_channel.send(begin))
+            await scheduler.run(Priority.NORMAL, lambda: auth_channel.send(how, file=challenge_file(image)))
+
+        session = VerificationSession(job.guild_id, member.id, auth_channel.id, random_code, random_emoji_unicode,
+                                      time.time() + VERIFICATION_TIMEOUT)
+        answer = await wait_for_answer(session, inbox, responses)
+    finally:
+        del inboxes[auth_channel.id]
+
+    expected = f"{random_code} {random_emoji_unicode}"
+    if answer is None:
+        outcome = "timeout"
+        scheduler.submit(Priority.NORMAL, lambda: member.send(gets(String.VERIFY_FAILED_TIMEOUT)))
+        last_response = responses[-1].content if responses else None
+    else:
+        outcome = "verified"
+        await scheduler.run(Priority.CRITICAL, lambda: member.add_roles(Object(id=config.role_id),
+                                                                        reason="Verification finished"))
+        scheduler.submit(Priority.NORMAL, lambda: member.send(
+            gets(String.VERIFY_SUCCESS).format(user_mention=member.mention)
+        ))
+        last_response = answer.content
+
+    # No pool here, the channel always goes away (so there's no point in reacting to the answer)
+    if mode == "channel":
+        await delete_channel(auth_channel.id, reason=f"Verification for {member.name}#{member.discriminator} "
+                                                     f"({member.id}) finished: {outcome}")
+
+    trigger_message = await get_trigger_message(config)
+    scheduler.submit(Priority.COSMETIC, lambda: trigger_message.remove_reaction(config.trigger_emoji, member))
+
+    duration = time.time() - job.created
+    log_verification(member, auth_channel.id, mode, outcome, expected, duration, last_response)
+    if audit_store is not None:
+        audit_store.record(job.guild_id, member.id, f"{member.name}#{member.discriminator}", auth_channel.id, mode,
+                           outcome, expected, [response.content for response in responses], len(responses),
+                           duration, time.time() - (session.deadline - VERIFICATION_TIMEOUT))
+    log_sinks[job.guild_id].add(build_log_embed(member, outcome, expected, last_response))
+
+    await job_queue.finish(job, JobStatus.DONE, {
+        "outcome": outcome, "mode": mode, "duration": round(duration, 3), "responses": len(responses)
+    })
+
+
+def log_verification(member: Member, channel_id: int, mode: str, outcome: str, expected: str, duration: float,
+                     response: Optional[str]):
+    """
+    Logs the outcome with the same structured fields as log_verification in bot.py.
+    """
+    if not config_registry.config.log_verifications_console:
+        return
+
+    if response is not None and len(response) > 200:
+        response = f"{response[:200]}[...]"
+
+    log.info(
+        f"Verification {outcome}: {member.name}#{member.discriminator} ({member.id}), expected '{expected}', "
+        + (f"response '{response}'" if response is not None else "no response"),
+        extra={
+            "guild_id": member.guild.id,
+            "member_id": member.id,
+            "channel_id": channel_id,
+            "mode": mode,
+            "outcome": outcome,
+            "duration": round(duration, 3),
+            "expected": expected,
+            "response": response,
+            "worker": WORKER_NAME,
+        }
+    )
+
+
+def build_log_embed(member: Member, outcome: str, expected: str, last_response: Optional[str]) -> Embed:
+    trimmed = last_response
+    if trimmed is not None and len(trimmed) > 1000:
+        trimmed = f"{trimmed[:1000]}[...]"
+
+    if outcome == "verified":
+        embed = Embed(title="Member verified", description=f"*Expected \"{expected}\"*\n```{trimmed}```",
+                      color=Color.green(), timestamp=datetime.now())
+    elif trimmed is None:
+        embed = Embed(title="User failed to verify (timeout)", description=f"*Expected \"{expected}\"*\n*No response*",
+                      color=Color.dark_red(), timestamp=datetime.now())
+    else:
+        embed = Embed(title="Member failed to verify (timeout)",
+                      description=f"*Expected \"{expected}\"*\nLast response:\n```{trimmed}```",
+                      color=Color.red(), timestamp=datetime.now())
+
+    embed.set_footer(text=f"Member: {member.name}#{member.discriminator} ({member.id})", icon_url=member.avatar_url)
+    return embed
+
+
+#############
+# Bulk role jobs
+#############
+async def run_bulk_role_job(job: Job):
+    """
+    Runs !verifyall/!unverifyall, the progress is written to the job for the bot process to report.
+    """
+    guild = await get_guild(job.guild_id)
+    role = guild.get_role(job.payload["role_id"])
+    if role is None:
+        raise Exception(f"Could not find role with ID {job.payload['role_id']} in guild {job.guild_id}")
+
+    bulk_role_job = BulkRoleJob(
+        guild, role, job.payload["mode"], scheduler,
+        checkpoint_directory=BULK_ROLE_CHECKPOINT_DIRECTORY,
+        concurrency=BULK_ROLE_CONCURRENCY,
+        reason=job.payload.get("reason")
+    )
+    # Continues where the bot process or a stopped worker left off
+    bulk_role_job.load_checkpoint()
+
+    async def report(current: BulkRoleProgress):
+        await job_queue.update(job, result=current.to_dict())
+
+    reporter = asyncio.ensure_future(report_progress_periodically(bulk_role_job, BULK_ROLE_PROGRESS_INTERVAL, report))
+    try:
+        result = await bulk_role_job.run()
+    finally:
+        reporter.cancel()
+
+    await job_queue.finish(job, JobStatus.DONE, result.to_dict())
+
+
+JOB_RUNNERS = {
+    JobKind.VERIFY: run_verification_job,
+    JobKind.BULK_ROLE: run_bulk_role_job,
+}
+
+
+#############
+# Worker loop
+#############
+async def run_job(job: Job):
+    log.debug(f"Running job {job.id} ({job.kind}, attempt {job.attempts})")
+    try:
+        await JOB_RUNNERS[job.kind](job)
+    except Exception as e:
+        log.exception(f"Job {job.id} ({job.kind}) failed")
+        await job_queue.finish(job, JobStatus.FAILED, {"error": repr(e)})
+
+        if job.kind == JobKind.VERIFY and audit_store is not None:
+            audit_store.record(job.guild_id, job.member_id, str(job.member_id), job.channel_id,
+                               job.result.get("mode", VERIFICATION_MODE), "error", None, [repr(e)], 0,
+                               time.time() - job.created, None)
+
+
+async def claim_jobs():
+    """
+    Takes jobs from the queue while there is room for them.
+    """
+    slots = asyncio.Semaphore(max(WORKER_CONCURRENCY, 1))
+
+    def job_done(task: asyncio.Task):
+        running_jobs.discard(task)
+        slots.release()
+
+    while True:
+        await slots.acquire()
+
+        try:
+            job = await job_queue.claim(WORKER_NAME)
+        except Exception as e:
+            log.error(f"Could not claim a job: {e!r}")
+            job = None
+
+        if job is None:
+            slots.release()
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+            continue
+
+        task = asyncio.ensure_future(run_job(job))
+        running_jobs.add(task)
+        task.add_done_callback(job_done)
+
+
+async def renew_leases():
+    # Well within the lease, a single slow write doesn't lose the jobs
+    while True:
+        await asyncio.sleep(WORKER_LEASE / 3)
+        try:
+            await job_queue.renew(WORKER_NAME)
+        except Exception as e:
+            log.error(f"Could not renew the job leases: {e!r}")
+
+
+async def deliver_answers():
+    """
+    Hands the messages the bot process forwarded to the verifications running here.
+    """
+    last_id = await job_queue.last_message_id()
+    while True:
+        await asyncio.sleep(WORKER_POLL_INTERVAL)
+        try:
+            messages = await job_queue.messages(last_id)
+        except Exception as e:
+            log.error(f"Could not read forwarded messages: {e!r}")
+            continue
+
+        for message in messages:
+            last_id = message.id
+            inbox = inboxes.get(message.channel_id)
+            if inbox is not None:
+                inbox.put_nowait(message)
+
+
+#############
+# Config reload
+#############
+def reload_files():
+    """
+    Reloads data/strings.json and data/config.ini (on SIGHUP), like the bot process.
+    """
+    string_registry.reload()
+    config_registry.reload()
+
+
+def apply_config(old: Config, new: Config):
+    """
+    Applies a reloaded config. Jobs read the guild settings when they start, only the cached entities looked up
+    with changed IDs have to go.
+    """
+    logging.getLogger().setLevel(getattr(logging, new.log_level, logging.INFO))
+    scheduler.follow_log_level()
+
+    for guild_id, config in new.guilds.items():
+        old_config = old.guilds[guild_id]
+        if (config.trigger_channel_id, config.trigger_message_id) != \
+                (old_config.trigger_channel_id, old_config.trigger_message_id):
+            entity_cache.invalidate(f"trigger_message:{guild_id}")
+        if config.log_channel_id != old_config.log_channel_id:
+            entity_cache.invalidate(f"logging_channel:{guild_id}")
+
+
+config_registry.add_listener(apply_config)
+
+
+async def main():
+    global bot_user_id
+    await job_queue.open()
+    if audit_store is not None:
+        await audit_store.open()
+    if captcha_pool is not None:
+        await captcha_pool.start()
+    # Like Client.login, which throws away the user it gets back
+    user = await client.http.static_login(BOT_TOKEN.strip(), bot=True)
+    bot_user_id = int(user["id"])
+    log.info(f"Worker {WORKER_NAME} is ready: logged in as {user['username']} ({bot_user_id}), "
+             f"running up to {WORKER_CONCURRENCY} jobs at once")
+
+    loops = [asyncio.ensure_future(loop) for loop in (claim_jobs(), renew_leases(), deliver_answers())]
+    if STRINGS_CHECK_INTERVAL > 0:
+        loops.append(asyncio.ensure_future(string_registry.watch(STRINGS_CHECK_INTERVAL)))
+    if CONFIG_CHECK_INTERVAL > 0:
+        loops.append(asyncio.ensure_future(config_registry.watch(CONFIG_CHECK_INTERVAL)))
+    try:
+        await asyncio.gather(*loops)
+    finally:
+        for task in loops + list(running_jobs):
+            task.cancel()
+        await asyncio.gather(*running_jobs, return_exceptions=True)
+
+        # Another worker picks up what was still running here (and deletes the verification channels)
+        await job_queue.release(WORKER_NAME)
+        await asyncio.gather(*[sink.close() for sink in log_sinks.values()])
+        await job_queue.close()
+        if audit_store is not None:
+            await audit_store.close()
+        if captcha_pool is not None:
+            await captcha_pool.close()
+        await client.close()
+        log.info(f"Worker {WORKER_NAME} stopped")
+
+
+# Run everything
+if __name__ == "__main__":
+    # Each worker writes its own log file next to the bot's
+    log_file = None
+    if LOG_FILE is not None:
+        base, extension = os.path.splitext(LOG_FILE)
+        log_file = f"{base}-{WORKER_NAME}{extension}"
+
+    log_pipeline.start(
+        level=getattr(logging, LOG_LEVEL, logging.INFO),
+        file=log_file, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS, queue_size=LOG_QUEUE_SIZE
+    )
+    scheduler.follow_log_level()
+
+    event_loop = asyncio.get_event_loop()
+    main_task = event_loop.create_task(main())
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        event_loop.add_signal_handler(signal_number, main_task.cancel)
+    event_loop.add_signal_handler(signal.SIGHUP, reload_files)
+
+    try:
+        event_loop.run_until_complete(main_task)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        log_pipeline.stop()